@@ -1,3 +1,40 @@
-from .agent import Agent
-from .message import Message
+"""Very Powerful Agents
+
+Submodules are imported on first access of their names (PEP 562), so that an agent
+only pays at import time for the features it uses.
+"""
+
+import importlib
+
+# typing.TYPE_CHECKING without importing typing, type checkers treat it as True
+TYPE_CHECKING = False
+
 from .version import __version__
+
+if TYPE_CHECKING:
+    from .agent import Agent, cpu_bound
+    from .async_agent import AsyncAgent
+    from .cluster import AgentCluster
+    from .message import Message
+
+_LAZY = {
+    "Agent": ".agent",
+    "cpu_bound": ".agent",
+    "AsyncAgent": ".async_agent",
+    "AgentCluster": ".cluster",
+    "Message": ".message",
+}
+
+__all__ = ["__version__", *_LAZY]
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
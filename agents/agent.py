@@ -1,20 +1,238 @@
+import copy
+import importlib
+import multiprocessing
 import os
 import queue
 import threading
 import time
 import traceback
+from collections import defaultdict, deque
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import suppress
 from signal import SIGINT, SIGTERM, signal
 from typing import Optional
 
+import rx
 import zmq
-from pyrsistent import pmap
 from rx.subject import Subject
 
-from agents.utils import Logger, random_uuid, stdout_logger
+from agents.utils import (
+    Compressor,
+    Logger,
+    SendQueue,
+    Waker,
+    random_uuid,
+    stdout_logger,
+)
 
 log = stdout_logger(__name__)
 
 
+class SocketShard:
+    """Sockets serviced by one socket thread, with its own poller and waker"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.sockets = {}
+        self.handles = {}
+        self.pending = set()
+        self.calls = deque()
+        self.poller = zmq.Poller()
+        self.waker = Waker()
+        self.poller.register(self.waker.socket, zmq.POLLIN)
+
+
+class SocketHandle:
+    """Connection returned by `Agent.bind_socket` and `Agent.connect_socket`
+
+    Messages received on `socket` are emitted on `observable`, `send` is thread safe
+    and queues messages for the socket thread owning `socket`.
+    """
+
+    __slots__ = (
+        "socket",
+        "address",
+        "type",
+        "options",
+        "observable",
+        "send_queue",
+        "recv_budget",
+        "batch",
+        "shard",
+        "zero_copy",
+        "track",
+        "compressor",
+        "_pending",
+        "_calls",
+        "_waker",
+        "_local",
+        "_flush",
+    )
+
+    def __init__(
+        self,
+        socket,
+        address,
+        socket_type,
+        options,
+        observable,
+        send_queue,
+        shard,
+        recv_budget=100,
+        batch=False,
+        zero_copy=False,
+        track=False,
+        compressor=None,
+        local=None,
+        flush=None,
+    ):
+        self.socket = socket
+        self.address = address
+        self.type = socket_type
+        self.options = options
+        self.observable = observable
+        self.send_queue = send_queue
+        self.recv_budget = recv_budget
+        self.batch = batch
+        self.shard = shard.index
+        self.zero_copy = zero_copy
+        self.track = track
+        self.compressor = compressor
+        self._pending = shard.pending
+        self._calls = shard.calls
+        self._waker = shard.waker
+        # thread local of the socket threads, and flush of the send queue
+        self._local = local
+        self._flush = flush
+
+    def __repr__(self):
+        return f"SocketHandle({self.type}:{self.address})"
+
+    def send(self, x):
+        """Queues a multipart message, in zero_copy mode a single buffer (bytes,
+        memoryview, numpy array, ...) is sent as one frame and the Future of its
+        `zmq.MessageTracker` is returned if `track` is set
+
+        Messages sent once the agent is shut down are dropped."""
+        future = None
+        if self.zero_copy:
+            if not isinstance(x, (list, tuple)):
+                x = [x]
+            future = Future() if self.track else None
+            x = (x, future)
+        elif self.compressor is not None:
+            x = [*x[:-1], self.compressor.compress(x[-1])]
+        if self._waker.closed:
+            self.send_queue.drop(x)
+            return future
+        if self._owned():
+            queued = self._put_owned(x)
+        else:
+            queued = self.send_queue.put(x)
+        if queued:
+            self._pending.add(self)
+            self._waker.wake()
+        return future
+
+    def _owned(self):
+        return (
+            self.send_queue.overflow == "block"
+            and getattr(self._local, "shard", None) == self.shard
+        )
+
+    def _put_owned(self, x):
+        # the socket thread owning the socket would wait for itself to flush a
+        # full queue, it flushes the queue in place instead
+        try:
+            return self.send_queue.put(x, block=False)
+        except queue.Full:
+            self._flush(self)
+        return self.send_queue.put(x, block=False)
+
+    def call(self, f):
+        """Calls `f(socket)` in the socket thread owning `socket`, eg. to change
+        socket options of a socket already serviced by that thread"""
+        self._calls.append((self.socket, f))
+        self._waker.wake()
+
+    @property
+    def depth(self):
+        return self.send_queue.depth
+
+    @property
+    def high_water(self):
+        return self.send_queue.high_water
+
+    @property
+    def drops(self):
+        return self.send_queue.drops
+
+    def stats(self):
+        return self.send_queue.stats()
+
+    def replace(self, **kwargs):
+        """Returns a copy with some attributes replaced, sharing socket and send queue"""
+        handle = copy.copy(self)
+        for k, v in kwargs.items():
+            setattr(handle, k, v)
+        return handle
+
+    def pipe(self, *operators):
+        """Returns a copy whose observable is piped through rx operators"""
+        return self.replace(observable=self.observable.pipe(*operators))
+
+
+def _import(module, qualname):
+    x = importlib.import_module(module)
+    for name in qualname.split("."):
+        x = getattr(x, name)
+    return x
+
+
+class CpuBound:
+    """Function marked to be offloaded to a process pool, see `cpu_bound`"""
+
+    def __init__(self, fn, pool="cpu", max_in_flight=None):
+        self.fn = fn
+        self.pool = pool
+        self.max_in_flight = max_in_flight
+        self.__module__ = fn.__module__
+        self.__qualname__ = fn.__qualname__
+        self.__name__ = fn.__name__
+        self.__doc__ = fn.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.fn(*args, **kwargs)
+
+    def __reduce__(self):
+        # the decorated name refers to self, so pickle it by reference
+        return _import, (self.__module__, self.__qualname__)
+
+
+def cpu_bound(fn=None, pool="cpu", max_in_flight=None):
+    """Marks a module level function as CPU bound, `Agent.offload(fn)` then runs it
+    in `pool` with at most `max_in_flight` calls outstanding
+
+    Usage:
+
+        ```python
+        @cpu_bound
+        def analyse(x):
+            ...
+
+        socket.observable.pipe(agent.offload(analyse))
+        ```
+    """
+    if fn is None:
+        return lambda fn: CpuBound(fn, pool=pool, max_in_flight=max_in_flight)
+    return CpuBound(fn, pool=pool, max_in_flight=max_in_flight)
+
+
 class Agent(
     # RouterClientMixin,
     # NotificationsMixin,
@@ -22,18 +240,42 @@ class Agent(
     # WebserverMixin,
     # DaemonMixin,
 ):
-    def __init__(self, uid: Optional[str] = None):
+    cpu_bound = staticmethod(cpu_bound)
+
+    def __init__(
+        self,
+        uid: Optional[str] = None,
+        shards: int = 1,
+        cpu_workers: Optional[int] = None,
+        shutdown_timeout: float = 10.0,
+    ):
 
         self.uid = uid or random_uuid()
         self.log = Logger(log, {"agent": self.uid})
         self.initialized_event = threading.Event()
         self.exit_event = threading.Event()
+        self.shutdown_timeout = shutdown_timeout
+        self.shutdown_times = {}
+        self._shutdown_started = False
+        self._exit_lock = threading.Lock()
+        self._exit_notified = False
+        self._exit_callbacks = []
         self.zmq_sockets = {}
-        self.zmq_poller = zmq.Poller()
+        self.zmq_shards = [SocketShard(i) for i in range(shards)]
+        self.zmq_poller = self.zmq_shards[0].poller
+        self._next_shard = 0
+        self._socket_thread = threading.local()
+        self.cpu_workers = cpu_workers or os.cpu_count()
+        self.executors = {}
+        self.executor_workers = {}
+        self._offloaded = set()
         self.threads = []
         self.disposables = []
 
         self._modules = {}
+        self._pending_modules = []
+        self._modules_booted = False
+        self.module_boot_times = {}
 
         # signals for graceful shutdown
         signal(SIGTERM, self._shutdown)
@@ -60,25 +302,158 @@ class Agent(
         return self.initialized_event.is_set()
 
     def register_module(self, module):
+        """Registers a module
+
+        Modules registered in `setup` are set up once it returns, concurrently
+        unless they depend on each other (see `AgentModule.dependencies`), and the
+        agent is initialized when all of them are ready. Modules registered after
+        boot are set up immediately.
+        """
         self.log.info(f"Registering module {module.uid} ...")
         self._modules[module.uid] = module
+        self._pending_modules.append(module)
+        if self._modules_booted:
+            self._setup_modules()
+
+    def _setup_modules(self):
+        modules, self._pending_modules = self._pending_modules, []
+        pending = {m.uid for m in modules}
+        for m in modules:
+            for d in m.dependencies:
+                if d not in self._modules:
+                    raise ValueError(f"Module {m.uid} depends on unknown module {d}")
+        # dependencies set up earlier are ready already
+        self._run_in_dependency_order(
+            {m.uid: [d for d in m.dependencies if d in pending] for m in modules},
+            lambda uid: self._setup_module(self._modules[uid]),
+        )
+        self._modules_booted = True
+
+    def _setup_module(self, module):
+        start = time.perf_counter()
         module.setup()
-        self.log.info(f"Module {module.uid} setup complete ...")
+        setup = time.perf_counter() - start
+        if module.ready_on_setup:
+            module.set_ready()
+        module.wait_ready(module.ready_timeout)
+        ready = time.perf_counter() - start
+        self.module_boot_times[module.uid] = {"setup": setup, "ready": ready}
+        self.log.info(
+            f"Module {module.uid} ready in {ready:.3f} seconds (setup {setup:.3f}) ..."
+        )
+
+    def _shutdown_modules(self, deadline=None):
+        # modules are shut down after the modules depending on them
+        dependents = {uid: [] for uid in self._modules}
+        for m in self._modules.values():
+            for d in m.dependencies:
+                if d in dependents:
+                    dependents[d].append(m.uid)
+        return self._run_in_dependency_order(
+            dependents, self._shutdown_module, deadline
+        )
+
+    def _shutdown_module(self, uid):
+        self.log.info(f"Shutting down module {uid} ...")
+        start = time.perf_counter()
+        try:
+            self._modules[uid].shutdown()
+        except Exception:
+            self.log.error(
+                f"Failed to shutdown module {uid} ...\n\n{traceback.format_exc()}"
+            )
+        finally:
+            self.shutdown_times[f"module {uid}"] = time.perf_counter() - start
+        self.log.info(
+            f"Module {uid} shutdown complete in {time.perf_counter() - start:.3f} seconds ..."
+        )
+
+    def _run_in_dependency_order(self, dependencies, f, deadline=None):
+        """Calls f(uid) for every uid once it returned for all uids it depends on,
+        concurrently in a daemon thread each
+
+        Args:
+            dependencies (dict): uid -> uids it depends on
+            f (callable): called with every uid
+            deadline (float): `time.perf_counter()` time after which calls still
+                running are abandoned and calls not started are skipped
+
+        Returns:
+            list: uids whose call did not return before the deadline
+
+        Raises:
+            the first exception raised by f, after the calls in progress returned,
+            or ValueError if dependencies are circular
+        """
+        if not dependencies:
+            return []
+        remaining = {k: set(v) for k, v in dependencies.items()}
+        dependents = defaultdict(list)
+        for k, v in remaining.items():
+            for d in v:
+                dependents[d].append(k)
+        returned = queue.Queue()
+        running = set()
+        error = None
+
+        def call(k):
+            try:
+                f(k)
+            except BaseException as e:
+                returned.put((k, e))
+            else:
+                returned.put((k, None))
+
+        while True:
+            if error is None:
+                for k in [k for k, v in remaining.items() if not v]:
+                    del remaining[k]
+                    running.add(k)
+                    threading.Thread(
+                        target=call,
+                        args=(k,),
+                        name=f"agent-{self.uid}-module-{k}",
+                        daemon=True,
+                    ).start()
+            if not running:
+                break
+            timeout = None
+            if deadline is not None:
+                timeout = max(0, deadline - time.perf_counter())
+            try:
+                k, e = returned.get(timeout=timeout)
+            except queue.Empty:
+                return sorted(running) + sorted(remaining)
+            running.discard(k)
+            if e is not None:
+                error = error or e
+                continue
+            for x in dependents[k]:
+                remaining[x].discard(k)
+        if error is not None:
+            raise error
+        if remaining:
+            raise ValueError(f"Circular module dependencies {sorted(remaining)}")
+        return []
 
     def run_process_in_thread(self, f):
-        t = threading.Thread(target=f, args=(self.exit_event,))
+        # daemon threads, so that threads outliving the shutdown deadline do not
+        # keep the process alive
+        t = threading.Thread(target=f, args=(self.exit_event,), daemon=True)
         self.threads.append(t)
         t.start()
 
     def boot(self, *args, **kwargs):
         try:
             start = time.time()
-            # self.log.info("Booting up ...")
-            # self.zmq_context = zmq.Context()
+            self.log.info("Booting up ...")
+            self.zmq_context = zmq.Context()
+            self._create_executors()
 
             # user setup
             self.log.info("Running user setup ...")
             self.setup()
+            self._setup_modules()
 
             # # setup bases
             # for base in Agent.__bases__:
@@ -86,10 +461,13 @@ class Agent(
             #         self.log.info(f"Initiating {base.__name__} setup procedure")
             #         base.setup(self, *args, **kwargs)
 
-            # # process sockets
-            # t = threading.Thread(target=self.process_sockets)
-            # self.threads.append(t)
-            # t.start()
+            # process sockets, one thread per shard
+            for shard in self.zmq_shards:
+                t = threading.Thread(
+                    target=self.process_sockets, args=(shard,), daemon=True
+                )
+                self.threads.append(t)
+                t.start()
 
             self.initialized_event.set()
             self.log.info(f"Booted in {time.time() - start} seconds ...")
@@ -99,16 +477,31 @@ class Agent(
             self.initialized_event.set()
             os.kill(os.getpid(), SIGINT)
 
-    def shutdown(self):
+    def shutdown(self, timeout: Optional[float] = None):
         """
         Shutdown procedure, call super().shutdown() if overriding
+
+        Threads still running after the deadline are abandoned (they are daemon
+        threads) together with the zmq sockets they may be using. The duration of
+        every step is logged and kept in `shutdown_times`.
+
+        Args:
+            timeout: seconds until the deadline, `shutdown_timeout` if None
         """
+        if self._shutdown_started:
+            return
+        self._shutdown_started = True
+        start = time.perf_counter()
+        deadline = start + (self.shutdown_timeout if timeout is None else timeout)
 
-        # shutdown modules
-        for m in self._modules.values():
-            self.log.info(f"Shutting down module {m.uid} ...")
-            m.shutdown()
-            self.log.info(f"Module {m.uid} shutdown complete ...")
+        def timed(name, t):
+            self.shutdown_times[name] = time.perf_counter() - t
+            self.log.info(f"{name} in {self.shutdown_times[name]:.3f} seconds ...")
+
+        # shutdown modules, concurrently unless they depend on each other, the time
+        # of each module is kept in shutdown_times
+        for uid in self._shutdown_modules(deadline):
+            self.log.warning(f"module {uid} still shutting down at the deadline ...")
 
         # # run shutdown procedures of all bases
         # for base in Agent.__bases__:
@@ -116,111 +509,448 @@ class Agent(
         #         self.log.info(f"Initiating {base.__name__} shutdown procedure")
         #         base.shutdown(self)
 
-        # dispose observables
-        for d in self.disposables:
-            self.log.info(f"disposing {d} ...")
-            d.dispose()
+        # dispose observables until the deadline
+        t = time.perf_counter()
+        thread = threading.Thread(target=self._dispose, daemon=True)
+        thread.start()
+        thread.join(max(0, deadline - t))
+        if thread.is_alive():
+            self.log.warning("disposing still running at the deadline ...")
+        timed("disposed observables", t)
 
         self.log.info("set exit event ...")
         self.exit_event.set()
+        self._notify_exit()
 
         self.log.info("wait for initialization before cleaning up ...")
-        self.initialized_event.wait()
+        self.initialized_event.wait(max(0, deadline - time.perf_counter()))
 
-        # join threads
+        # join threads until the deadline
         self.log.info(f"joining {len(self.threads)} threads ...")
-        for t in self.threads:
-            self.log.info(f"joining {t}")
-            t.join()
+        abandoned = []
+        for thread in self.threads:
+            t = time.perf_counter()
+            thread.join(max(0, deadline - t))
+            if thread.is_alive():
+                abandoned.append(thread)
+                self.log.warning(f"{thread.name} still running at the deadline ...")
+            else:
+                timed(f"joined {thread.name}", t)
         self.log.info("joining threads complete ...")
 
-        # # destroy zmq sockets
-        # for k, v in self.zmq_sockets.items():
-        #     self.log.info(f"closing socket {k} ...")
-        #     v["socket"].close()
-        # self.zmq_context.term()
+        # destroy zmq sockets, unless abandoned threads may still use them
+        t = time.perf_counter()
+        if abandoned:
+            self.log.warning(f"not closing sockets of {len(abandoned)} threads ...")
+        else:
+            for k, v in self.zmq_sockets.items():
+                self.log.info(f"closing socket {k} ...")
+                v.socket.close(linger=0)
+            if hasattr(self, "zmq_context"):
+                self.zmq_context.destroy(linger=0)
+            for shard in self.zmq_shards:
+                shard.waker.close()
+        timed("closed sockets", t)
+
+        # shutdown executors, dropping offloaded work not started (cancel_futures
+        # of Executor.shutdown needs Python 3.9), waiting for work in progress
+        # until the deadline
+        for future in list(self._offloaded):
+            future.cancel()
+        for name, executor in self.executors.items():
+            t = time.perf_counter()
+            thread = threading.Thread(
+                target=executor.shutdown, kwargs={"wait": True}, daemon=True
+            )
+            thread.start()
+            thread.join(max(0, deadline - t))
+            if thread.is_alive():
+                self.log.warning(f"executor {name} still running at the deadline ...")
+            timed(f"shut down executor {name}", t)
+
+        self.shutdown_times["total"] = time.perf_counter() - start
+        self.log.info(
+            f"shutdown complete in {self.shutdown_times['total']:.3f} seconds ..."
+        )
 
-        self.log.info("shutdown complete ...")
+    def _dispose(self):
+        for d in self.disposables:
+            self.log.info(f"disposing {d} ...")
+            try:
+                d.dispose()
+            except Exception:
+                self.log.error(f"Failed to dispose {d} ...\n\n{traceback.format_exc()}")
 
     def _shutdown(self, signum, frame):
         self.shutdown()
 
+    def on_exit(self, f):
+        """Calls f() once the exit event is set, immediately if it is already
+
+        Threads blocked on something else than the socket threads (a queue, a
+        future, another event loop) register a wakeup here instead of polling
+        `exit_event` with a timeout.
+        """
+        with self._exit_lock:
+            if not self._exit_notified:
+                self._exit_callbacks.append(f)
+                return
+        f()
+
+    def exit_future(self, loop=None):
+        """asyncio Future resolved once the exit event is set
+
+        Args:
+            loop: event loop of the future, the running loop if None
+        """
+        # asyncio is only imported by agents using it
+        import asyncio
+
+        loop = loop or asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve():
+            if not future.done():
+                future.set_result(None)
+
+        def notify():
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(resolve)
+
+        self.on_exit(notify)
+        return future
+
+    def _notify_exit(self):
+        """Wakes up threads blocked on I/O after exit_event is set"""
+        for shard in self.zmq_shards:
+            shard.waker.wake()
+        with self._exit_lock:
+            self._exit_notified = True
+            callbacks, self._exit_callbacks = self._exit_callbacks, []
+        for f in callbacks:
+            try:
+                f()
+            except Exception:
+                self.log.error(f"Failed exit callback ...\n\n{traceback.format_exc()}")
+
+    ########################################################################################
+    ## executors
+    ########################################################################################
+
+    def _create_executors(self):
+        # workers are started on demand, spawned rather than forked from a process
+        # running zmq and socket threads
+        self.executor_workers = {
+            "cpu": self.cpu_workers,
+            "thread": min(32, (os.cpu_count() or 1) + 4),
+        }
+        self.executors["cpu"] = ProcessPoolExecutor(
+            max_workers=self.executor_workers["cpu"],
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self.executors["thread"] = ThreadPoolExecutor(
+            max_workers=self.executor_workers["thread"],
+            thread_name_prefix=f"agent-{self.uid}",
+        )
+
+    def call_soon(self, f, shard=0):
+        """Calls f() in the socket thread of shard"""
+        s = self.zmq_shards[shard]
+        s.calls.append((None, lambda _: f()))
+        s.waker.wake()
+
+    def offload(self, fn, pool=None, max_in_flight=None):
+        """Rx operator running fn on every item in an executor ("cpu" process pool or
+        "thread" pool), so that CPU bound work does not hold the socket threads
+
+        Results are emitted in the order of the items, in the socket thread the
+        items are received on. When `max_in_flight` items are being processed the
+        source waits, processing the oldest result first if it is a socket thread.
+        The first error is emitted in order too, the items still processed are then
+        cancelled and nothing else is emitted. fn must be picklable (eg. a module
+        level function) for the "cpu" pool.
+
+        Args:
+            fn (callable): function of an item, see `cpu_bound` for defaults
+            pool (str): executor name, "cpu" if None
+            max_in_flight (int): bound of items processed, twice the workers if None
+        """
+        if isinstance(fn, CpuBound):
+            pool = pool or fn.pool
+            max_in_flight = max_in_flight or fn.max_in_flight
+        pool = pool or "cpu"
+        executor = self.executors[pool]
+        max_in_flight = max_in_flight or 2 * self.executor_workers[pool]
+
+        def operator(source):
+            def subscribe(observer, scheduler=None):
+                futures = deque()
+                condition = threading.Condition()
+                completed = []
+                stopped = []
+                shard = None
+
+                def fail(e):
+                    # nothing is emitted after an error, items still processed
+                    # are cancelled
+                    with condition:
+                        if stopped:
+                            return
+                        stopped.append(True)
+                        for future in futures:
+                            future.cancel()
+                        futures.clear()
+                        condition.notify_all()
+                    observer.on_error(e)
+
+                def drain():
+                    while True:
+                        with condition:
+                            if stopped:
+                                return
+                            if not futures or not futures[0].done():
+                                if not futures and completed:
+                                    completed.clear()
+                                    stopped.append(True)
+                                    observer.on_completed()
+                                return
+                            future = futures.popleft()
+                            condition.notify_all()
+                        if future.exception() is not None:
+                            return fail(future.exception())
+                        observer.on_next(future.result())
+
+                def on_next(x):
+                    nonlocal shard
+                    if shard is None:
+                        shard = getattr(self._socket_thread, "shard", 0)
+                    local = getattr(self._socket_thread, "shard", None) == shard
+                    with condition:
+                        while len(futures) >= max_in_flight and not local:
+                            condition.wait()
+                    while local and len(futures) >= max_in_flight:
+                        wait([futures[0]])
+                        drain()
+                    if stopped:
+                        return
+                    future = executor.submit(fn, x)
+                    self._offloaded.add(future)
+                    future.add_done_callback(self._offloaded.discard)
+                    with condition:
+                        futures.append(future)
+                    future.add_done_callback(lambda _: self.call_soon(drain, shard))
+
+                def on_completed():
+                    with condition:
+                        completed.append(True)
+                    self.call_soon(drain, shard or 0)
+
+                return source.subscribe_(on_next, fail, on_completed, scheduler)
+
+            return rx.create(subscribe)
+
+        return operator
+
     ########################################################################################
     ## networking
     ########################################################################################
 
-    def bind_socket(self, socket_type, options, address):
+    def bind_socket(self, socket_type, options, address, **kwargs):
+        """Binds a socket serviced by a socket thread
+
+        Args:
+            socket_type (int): zmq socket type
+            options (dict): zmq socket options
+            address (str): address to bind
+            recv_budget (int): max messages read from the socket per poll cycle
+            batch (bool): emit the messages read in a poll cycle as one list
+            shard (int): socket thread servicing this socket, round-robin if None
+            zero_copy (bool): emit `zmq.Frame` parts and send buffers without copying
+            track (bool): in zero_copy mode, `send` returns a Future of the
+                `zmq.MessageTracker`, use it before reusing a sent buffer
+            max_queue (int): bound of the send queue, unbounded if 0
+            overflow (str): policy when the send queue is full, one of "block",
+                "drop_oldest", "drop_newest" or "raise" (see `SendQueue`)
+            send_timeout (float): seconds `send` blocks with the "block" policy
+                before raising `queue.Full`, forever if None, the socket thread
+                owning the socket flushes a full queue instead of blocking
+            compression (str | Compressor): compress the last frame of messages
+                above a size threshold (see `Compressor`), with a codec name or a
+                Compressor, both ends of a connection must use compression
+
+        Returns:
+            connection
+        """
         self.log.info(f"binding {socket_type} socket on {address} ...")
         socket = self.zmq_context.socket(socket_type)
-        for k, v in options.items():
-            if type(v) == str:
-                socket.setsockopt_string(k, v)
-            else:
-                socket.setsockopt(k, v)
+        self._set_socket_options(socket, options)
         socket.bind(address)
-        observable = Subject()
-        socket_name = f"{socket_type}:{address}"
-        send_queue = queue.Queue()
-        self.zmq_sockets[socket_name] = pmap(
-            {
-                "socket": socket,
-                "address": address,
-                "type": socket_type,
-                "options": options,
-                "observable": observable,
-                "send_queue": send_queue,
-                "send": lambda x: send_queue.put(x),
-            }
-        )
-        self.zmq_poller.register(socket, zmq.POLLIN)
-        return self.zmq_sockets[socket_name]
+        return self._register_socket(socket, socket_type, options, address, **kwargs)
 
-    def connect_socket(self, socket_type, options, address):
+    def connect_socket(self, socket_type, options, address, **kwargs):
+        """Connects a socket serviced by a socket thread, see `bind_socket`"""
         self.log.info(f"connecting {socket_type} socket to {address} ...")
         socket = self.zmq_context.socket(socket_type)
+        self._set_socket_options(socket, options)
+        socket.connect(address)
+        return self._register_socket(socket, socket_type, options, address, **kwargs)
+
+    def _get_shard(self, shard=None):
+        if shard is None:
+            shard = self._next_shard
+            self._next_shard = (self._next_shard + 1) % len(self.zmq_shards)
+        if not 0 <= shard < len(self.zmq_shards):
+            raise ValueError(f"shard must be in range [0, {len(self.zmq_shards)})")
+        return self.zmq_shards[shard]
+
+    def _set_socket_options(self, socket, options):
         for k, v in options.items():
             if type(v) == str:
                 socket.setsockopt_string(k, v)
             else:
                 socket.setsockopt(k, v)
-        socket.connect(address)
-        observable = Subject()
+
+    def _register_socket(
+        self,
+        socket,
+        socket_type,
+        options,
+        address,
+        recv_budget=100,
+        batch=False,
+        shard=None,
+        zero_copy=False,
+        track=False,
+        max_queue=0,
+        overflow="block",
+        send_timeout=None,
+        compression=None,
+    ):
+        if compression is not None and zero_copy:
+            raise ValueError("compression is not supported in zero_copy mode")
+        if isinstance(compression, str):
+            compression = Compressor(compression)
+        # REQ/REP must alternate recv and send
+        if socket_type in (zmq.REQ, zmq.REP):
+            recv_budget = 1
         socket_name = f"{socket_type}:{address}"
-        send_queue = queue.Queue()
-        self.zmq_sockets[socket_name] = pmap(
-            {
-                "socket": socket,
-                "address": address,
-                "type": socket_type,
-                "options": options,
-                "observable": observable,
-                "send_queue": send_queue,
-                "send": lambda x: send_queue.put(x),
-            }
+        send_queue = SendQueue(
+            maxsize=max_queue,
+            overflow=overflow,
+            timeout=send_timeout,
+            on_drop=self._cancel_tracker if zero_copy else None,
+        )
+        shard = self._get_shard(shard)
+        handle = SocketHandle(
+            socket,
+            address,
+            socket_type,
+            options,
+            Subject(),
+            send_queue,
+            shard,
+            recv_budget=recv_budget,
+            batch=batch,
+            zero_copy=zero_copy,
+            track=track,
+            compressor=compression,
+            local=self._socket_thread,
+            flush=self._flush_socket,
         )
-        self.zmq_poller.register(socket, zmq.POLLIN)
-        return self.zmq_sockets[socket_name]
+        self.zmq_sockets[socket_name] = handle
+        shard.sockets[socket_name] = handle
+        shard.handles[socket] = handle
+        shard.poller.register(socket, zmq.POLLIN)
+        # the poller is only re-read by the socket thread after it wakes up
+        shard.waker.wake()
+        return handle
 
-    def process_sockets(self):
+    def process_sockets(self, shard):
 
         # wait for initialization
         self.initialized_event.wait()
         self.log.info(
-            f"start processing sockets in thread {threading.current_thread()} ..."
+            f"start processing sockets of shard {shard.index} in thread {threading.current_thread()} ..."
         )
 
+        # block until a socket is readable or a send/shutdown wakes us up
+        self._socket_thread.shard = shard.index
+        waker = shard.waker.socket
         while not self.exit_event.is_set():
-            if self.zmq_sockets:
-                sockets = dict(self.zmq_poller.poll(50))
-                for k, v in self.zmq_sockets.items():
-                    # receive socket into observable
-                    if v.socket in sockets and sockets[v.socket] == zmq.POLLIN:
-                        v.observable.on_next(v.socket.recv_multipart())
-                    # send queue to socket (zmq is not thread safe)
-                    while not v.send_queue.empty() and not self.exit_event.is_set():
-                        try:
-                            v.socket.send_multipart(v.send_queue.get(block=False))
-                        except queue.Empty:
-                            pass
-            else:
-                time.sleep(1)
+            for socket, _ in shard.poller.poll():
+                # receive socket into observable
+                if socket is waker:
+                    shard.waker.clear()
+                else:
+                    self._drain_socket(shard.handles[socket])
+            # run calls queued by other threads
+            while shard.calls:
+                self._call_socket(*shard.calls.popleft())
+            # send queues to sockets (zmq is not thread safe)
+            while shard.pending and not self.exit_event.is_set():
+                self._flush_socket(shard.pending.pop())
+
+    def _flush_socket(self, v):
+        with suppress(queue.Empty):
+            while not self.exit_event.is_set():
+                if v.zero_copy:
+                    self._send_buffers(v, *v.send_queue.get_nowait())
+                else:
+                    v.socket.send_multipart(v.send_queue.get_nowait())
+
+    def _call_socket(self, socket, f):
+        try:
+            f(socket)
+        except Exception:
+            self.log.error(f"Failed socket call ...\n\n{traceback.format_exc()}")
+
+    def _cancel_tracker(self, x):
+        _, future = x
+        if future is not None:
+            future.cancel()
+
+    def _send_buffers(self, v, xs, future):
+        if future is None:
+            v.socket.send_multipart(xs, copy=False)
+        else:
+            future.set_result(v.socket.send_multipart(xs, copy=False, track=True))
+
+    def _drain_socket(self, v):
+        """Reads up to `recv_budget` messages without blocking, so that a busy socket
+        does not cost a poll per message nor starve the other sockets"""
+        copy = not v.zero_copy
+        compressor = v.compressor
+        if v.batch:
+            xs = []
+            with suppress(zmq.Again):
+                for _ in range(v.recv_budget):
+                    x = v.socket.recv_multipart(zmq.NOBLOCK, copy=copy)
+                    if compressor is None or self._decompress(v, x):
+                        xs.append(x)
+            if xs:
+                self._emit(v, xs)
+        else:
+            with suppress(zmq.Again):
+                for _ in range(v.recv_budget):
+                    x = v.socket.recv_multipart(zmq.NOBLOCK, copy=copy)
+                    if compressor is None or self._decompress(v, x):
+                        self._emit(v, x)
+
+    def _emit(self, v, x):
+        # a failing subscriber must not stop the socket thread of the shard
+        try:
+            v.observable.on_next(x)
+        except Exception:
+            self.log.error(f"Subscriber of {v} failed ...\n\n{traceback.format_exc()}")
+
+    def _decompress(self, v, x):
+        """Decompresses the last frame of x in place, False if it must be dropped"""
+        try:
+            x[-1] = v.compressor.decompress(x[-1])
+            return True
+        except Exception:
+            self.log.error(
+                f"Dropping message with an invalid compressed frame on {v} ...\n\n"
+                f"{traceback.format_exc()}"
+            )
+            return False
@@ -0,0 +1,159 @@
+__all__ = ["AsyncAgent", "AsyncSocket"]
+
+import asyncio
+import os
+import time
+import traceback
+from contextlib import suppress
+from signal import SIGINT
+
+import zmq
+import zmq.asyncio
+
+from agents.agent import Agent
+
+
+class AsyncSocket:
+    """zmq.asyncio socket owned by an AsyncAgent event loop
+
+    Usage:
+
+        ```python
+        async for xs in connection:
+            await connection.send(xs)
+        ```
+    """
+
+    def __init__(self, agent, socket, socket_type, options, address):
+        self.agent = agent
+        self.socket = socket
+        self.type = socket_type
+        self.options = options
+        self.address = address
+
+    async def send(self, xs):
+        await self.socket.send_multipart(xs)
+
+    async def recv(self):
+        return await self.socket.recv_multipart()
+
+    def send_threadsafe(self, xs):
+        """Sends from outside the event loop, returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(self.send(xs), self.agent.event_loop)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        # sockets are closed on shutdown, which cancels a pending receive
+        try:
+            return await self.recv()
+        except (asyncio.CancelledError, zmq.ContextTerminated, zmq.ZMQError):
+            if self.socket.closed or self.agent.exit_event.is_set():
+                raise StopAsyncIteration
+            raise
+
+
+class AsyncAgent(Agent):
+    """Agent running its sockets, modules and user tasks on a single asyncio event loop
+
+    Sockets are `zmq.asyncio` sockets and WebServerModule, WebSocketModule and their
+    connection pools default to `event_loop`, so that traffic does not cross
+    threads. `setup` may be a coroutine.
+
+    Args:
+        shutdown_grace (float): seconds given to running tasks to finish on shutdown
+            before they are cancelled
+    """
+
+    def __init__(self, *args, shutdown_grace: float = 5, **kwargs):
+        self.shutdown_grace = shutdown_grace
+        self.event_loop = asyncio.new_event_loop()
+        super().__init__(*args, **kwargs)
+
+    def boot(self, *args, **kwargs):
+        try:
+            start = time.time()
+            self.log.info("Booting up ...")
+            asyncio.set_event_loop(self.event_loop)
+            self.zmq_context = zmq.asyncio.Context()
+            self._exit = asyncio.Event()
+            self._create_executors()
+            # the event loop thread delivers offloaded results (see `call_soon`)
+            self._socket_thread.shard = 0
+
+            # user setup
+            self.log.info("Running user setup ...")
+            result = self.setup()
+            if asyncio.iscoroutine(result):
+                self.event_loop.run_until_complete(result)
+
+            # modules sharing the event loop need it running to become ready
+            self.event_loop.run_until_complete(
+                self.event_loop.run_in_executor(
+                    self.executors["thread"], self._setup_modules
+                )
+            )
+
+            self.initialized_event.set()
+            self.log.info(f"Booted in {time.time() - start} seconds ...")
+
+        except Exception as e:
+            self.log.error(f"Failed to boot ...\n\n{traceback.format_exc()}")
+            self.initialized_event.set()
+            os.kill(os.getpid(), SIGINT)
+            return
+
+        # the boot thread runs the event loop until shutdown
+        try:
+            self.event_loop.run_until_complete(self._run())
+        finally:
+            self.event_loop.close()
+
+    async def _run(self):
+        self.log.info("Start running event loop ...")
+        await self._exit.wait()
+
+        # closing the sockets cancels their pending receives
+        for k, v in self.zmq_sockets.items():
+            self.log.info(f"closing socket {k} ...")
+            v.socket.close(linger=0)
+
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        if tasks:
+            self.log.info(f"waiting for {len(tasks)} tasks ...")
+            _, pending = await asyncio.wait(tasks, timeout=self.shutdown_grace)
+            for t in pending:
+                self.log.info(f"cancelling {t} ...")
+                t.cancel()
+            with suppress(asyncio.CancelledError):
+                await asyncio.gather(*pending, return_exceptions=True)
+        self.log.info("Stopped running event loop ...")
+
+    def _notify_exit(self):
+        super()._notify_exit()
+        if not self.event_loop.is_closed():
+            self.event_loop.call_soon_threadsafe(lambda: self._exit.set())
+
+    def call_soon(self, f, shard=0):
+        """Calls f() in the event loop thread"""
+        self.event_loop.call_soon_threadsafe(f)
+
+    def create_task(self, coro):
+        """Schedules a coroutine on the event loop from any thread
+
+        Returns:
+            concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.event_loop)
+
+    def _register_socket(self, socket, socket_type, options, address, **kwargs):
+        if kwargs:
+            raise TypeError(
+                f"AsyncAgent sockets do not support {', '.join(kwargs.keys())}"
+            )
+        socket_name = f"{socket_type}:{address}"
+        self.zmq_sockets[socket_name] = AsyncSocket(
+            self, socket, socket_type, options, address
+        )
+        return self.zmq_sockets[socket_name]
@@ -0,0 +1,242 @@
+__all__ = ["AgentCluster"]
+
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future
+from signal import SIGKILL, SIGTERM
+
+import zmq
+
+from agents.agent import Agent
+
+# control messages of replicas start with an empty frame, replies with a client id
+READY = b"READY"
+DONE = b"DONE"
+STATS = b"STATS"
+
+
+class AgentCluster(Agent):
+    """Runs replicas of an agent in worker processes behind a load balancing broker
+
+    Clients (DEALER or REQ) connect to `address`. Each request is forwarded to the
+    least recently used idle replica, which calls `handle_request(frames)` and
+    returns the reply frames, a Future of them, or None for no reply. Requests wait
+    in the broker while all replicas are busy. Dead replicas are restarted, the
+    requests they were handling are lost.
+
+    Usage:
+
+        ```python
+        class Worker(Agent):
+            def handle_request(self, frames):
+                return [b"done"]
+
+        cluster = AgentCluster(Worker, replicas=4, address="tcp://0.0.0.0:5000")
+        ```
+
+    Args:
+        agent_class (type): Agent subclass implementing handle_request, picklable
+            (defined at module level) unless start_method is "fork"
+        replicas (int): number of worker processes
+        address (str): address clients connect to
+        args (tuple): positional arguments of agent_class
+        kwargs (dict): keyword arguments of agent_class
+        restart (bool): restart replicas which exited
+        stats_interval (float): seconds between stats reports of replicas
+        start_method (str): multiprocessing start method of the replicas
+    """
+
+    def __init__(
+        self,
+        agent_class,
+        replicas=None,
+        address="tcp://0.0.0.0:5000",
+        args=(),
+        kwargs=None,
+        restart=True,
+        stats_interval=1.0,
+        start_method="spawn",
+        **agent_kwargs,
+    ):
+        self.agent_class = agent_class
+        self.replicas = replicas or os.cpu_count()
+        self.address = address
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.restart = restart
+        self.stats_interval = stats_interval
+        self.mp_context = multiprocessing.get_context(start_method)
+        self.processes = [None] * self.replicas
+        self.replica_stats = [
+            {"restarts": 0, "dispatched": 0, "replied": 0} for _ in range(self.replicas)
+        ]
+        self.backend_address = os.path.join(
+            "ipc://" + tempfile.gettempdir(), f"agent-cluster-{os.getpid()}-{id(self)}"
+        )
+        # identities of idle replicas (least recently used first) and queued requests
+        self._idle = deque()
+        self._requests = deque()
+        self._identities = {}
+        super().__init__(**agent_kwargs)
+
+    def setup(self):
+        self.frontend = self.bind_socket(zmq.ROUTER, {}, self.address, shard=0)
+        self.backend = self.bind_socket(zmq.ROUTER, {}, self.backend_address, shard=0)
+        self.disposables.append(self.frontend.observable.subscribe(self._on_request))
+        self.disposables.append(self.backend.observable.subscribe(self._on_replica))
+        for i in range(self.replicas):
+            self._start_replica(i)
+        self.run_process_in_thread(self._monitor)
+
+    def stats(self):
+        """Per replica stats, reported by the replicas and counted by the broker"""
+        stats = []
+        for i, p in enumerate(self.processes):
+            x = dict(self.replica_stats[i])
+            x.update(
+                pid=p.pid if p else None,
+                alive=bool(p and p.is_alive()),
+                in_flight=x["dispatched"] - x["replied"],
+            )
+            stats.append(x)
+        return stats
+
+    def _identity(self, index):
+        # identities of restarted replicas differ, so that messages of a dead
+        # replica are not attributed to its replacement
+        return f"replica-{index}-{self.replica_stats[index]['restarts']}".encode()
+
+    def _start_replica(self, index):
+        identity = self._identity(index)
+        self._identities[identity] = index
+        p = self.mp_context.Process(
+            target=_run_replica,
+            args=(
+                self.agent_class,
+                self.args,
+                self.kwargs,
+                self.backend_address,
+                identity,
+                self.stats_interval,
+            ),
+            daemon=True,
+        )
+        p.start()
+        self.processes[index] = p
+        self.log.info(f"Started replica {index} (pid {p.pid}) ...")
+
+    def _monitor(self, exit_event):
+        while not exit_event.wait(0.1):
+            for i, p in enumerate(self.processes):
+                if p is not None and not p.is_alive() and not exit_event.is_set():
+                    self.log.warning(f"Replica {i} exited with {p.exitcode} ...")
+                    p.join()
+                    self.processes[i] = None
+                    identity = self._identity(i)
+                    self.call_soon(lambda x=identity: self._forget_replica(x))
+                    if self.restart:
+                        self.replica_stats[i]["restarts"] += 1
+                        self._start_replica(i)
+
+    def _forget_replica(self, identity):
+        index = self._identities.pop(identity)
+        if identity in self._idle:
+            self._idle.remove(identity)
+        stats = self.replica_stats[index]
+        stats["replied"] = stats["dispatched"]
+
+    def _on_request(self, xs):
+        self._requests.append(xs)
+        self._dispatch()
+
+    def _on_replica(self, xs):
+        identity, *frames = xs
+        index = self._identities.get(identity)
+        if index is None:
+            return
+        if frames[0] == b"":
+            if frames[1] == READY:
+                self._idle.append(identity)
+            elif frames[1] == DONE:
+                self.replica_stats[index]["replied"] += 1
+                self._idle.append(identity)
+            elif frames[1] == STATS:
+                self.replica_stats[index].update(json.loads(frames[2]))
+        else:
+            self.replica_stats[index]["replied"] += 1
+            self._idle.append(identity)
+            self.frontend.send(frames)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._idle and self._requests:
+            identity = self._idle.popleft()
+            index = self._identities[identity]
+            if self.processes[index] is None or not self.processes[index].is_alive():
+                continue
+            self.replica_stats[index]["dispatched"] += 1
+            self.backend.send([identity, *self._requests.popleft()])
+
+    def shutdown(self):
+        super().shutdown()
+        for p in self.processes:
+            if p is not None and p.is_alive():
+                os.kill(p.pid, SIGTERM)
+        deadline = time.time() + 5
+        for p in self.processes:
+            if p is not None:
+                p.join(max(0, deadline - time.time()))
+                if p.is_alive():
+                    os.kill(p.pid, SIGKILL)
+                    p.join()
+        path = self.backend_address[len("ipc://") :]
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def _run_replica(agent_class, args, kwargs, backend_address, identity, stats_interval):
+    agent = agent_class(*args, **kwargs)
+    stats = {"handled": 0, "errors": 0, "busy": 0.0}
+    dealer = agent.connect_socket(
+        zmq.DEALER, {zmq.IDENTITY: identity}, backend_address, shard=0
+    )
+
+    def reply(envelope, frames):
+        if frames is not None:
+            dealer.send([*envelope, *frames])
+        else:
+            dealer.send([b"", DONE])
+
+    def on_request(xs):
+        # envelope: client id, and the empty delimiter of REQ clients
+        n = 2 if len(xs) > 1 and xs[1] == b"" else 1
+        envelope, request = xs[:n], xs[n:]
+        start = time.perf_counter()
+        try:
+            result = agent.handle_request(request)
+        except Exception:
+            agent.log.error(f"Failed to handle request ...\n\n{traceback.format_exc()}")
+            stats["errors"] += 1
+            result = None
+        stats["handled"] += 1
+        stats["busy"] += time.perf_counter() - start
+        if isinstance(result, Future):
+            result.add_done_callback(
+                lambda f: reply(envelope, None if f.exception() else f.result())
+            )
+        else:
+            reply(envelope, result)
+
+    def report(exit_event):
+        while not exit_event.wait(stats_interval):
+            dealer.send([b"", STATS, json.dumps(stats).encode()])
+
+    dealer.observable.subscribe(on_request)
+    agent.run_process_in_thread(report)
+    dealer.send([b"", READY])
+    agent.exit_event.wait()
@@ -1,21 +1,66 @@
 __all__ = ["AgentModule"]
 
-from typing import Optional
+import threading
+from typing import List, Optional, Union
 
 from agents import Agent
 from agents.utils import Logger, random_uuid
 
 
 class AgentModule:
-    def __init__(self, agent: Optional[Agent] = None, uid: Optional[str] = None):
+    """Module set up and shut down by an agent (see `Agent.register_module`)
+
+    Modules are ready when `setup` returns, unless `ready_on_setup` is False, then
+    the module calls `set_ready` itself (eg. once its server is listening).
+
+    Args:
+        agent: agent owning the module
+        uid: unique id of the module
+        dependencies: modules (or their uids) which are set up before this module
+            and shut down after it
+    """
+
+    # modules which become ready asynchronously call `set_ready` themselves
+    ready_on_setup = True
+    # seconds to wait for readiness after setup
+    ready_timeout = 30.0
+
+    def __init__(
+        self,
+        agent: Optional[Agent] = None,
+        uid: Optional[str] = None,
+        dependencies: Optional[List[Union[str, "AgentModule"]]] = None,
+    ):
         if not isinstance(agent, Agent):
             raise TypeError("agent must be of type Agent")
         self.agent = agent
         self.uid = uid or random_uuid()
         self.log = Logger(agent.log, {"module": self.uid})
+        self.dependencies = [
+            d if isinstance(d, str) else d.uid for d in dependencies or []
+        ]
+        self.ready_event = threading.Event()
+        self.error = None
 
     def setup(self):
         raise NotImplementedError("AgentModule/setup")
 
     def shutdown(self):
         raise NotImplementedError("AgentModule/shutdown")
+
+    def set_ready(self, error: Optional[BaseException] = None):
+        """Marks the module ready, or failed to set up with error"""
+        self.error = error
+        self.ready_event.set()
+
+    def wait_ready(self, timeout: Optional[float] = None):
+        """Blocks until the module is ready
+
+        Raises:
+            TimeoutError: not ready within timeout
+            the error the module failed to set up with
+        """
+        if not self.ready_event.wait(timeout):
+            raise TimeoutError(f"Module {self.uid} not ready after {timeout} seconds")
+        if self.error is not None:
+            raise self.error
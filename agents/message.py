@@ -1,67 +1,322 @@
+import struct
 from dataclasses import dataclass
+from typing import TYPE_CHECKING, List, Optional, Union
 
-from aiohttp import WSMessage
-from aiohttp.web import Request
+if TYPE_CHECKING:
+    from aiohttp import WSMessage
+    from aiohttp.web import Request
+
+# Binary envelope (frame after the topic/name frame):
+#
+#   version (B) | type (B) | flags (B)
+#   [id length (H) | id]               if FLAG_ID
+#   [timestamp (d)]                    if FLAG_TIMESTAMP
+#   [content type length (B) | type]   if FLAG_CONTENT_TYPE
+#   payload                            utf-8 unless FLAG_BYTES
+#
+# Messages of 3 frames (topic, type, payload) use the legacy text format.
+#
+# Batch envelope (notifications of one topic):
+#
+#   version (B) | BATCH (B) | flags (B) | count (I)
+#   [envelope length (I) | notification envelope] * count
+_HEADER = struct.Struct("!BBB")
+_LENGTH = struct.Struct("!H")
+_TIMESTAMP = struct.Struct("!d")
+_COUNT = struct.Struct("!I")
+
+FLAG_BYTES = 0x01
+FLAG_ID = 0x02
+FLAG_TIMESTAMP = 0x04
+FLAG_CONTENT_TYPE = 0x08
+
+
+def _pack(message_type, payload, id, timestamp, content_type):
+    flags = 0
+    parts = [b""]
+    if id is not None:
+        flags |= FLAG_ID
+        x = id.encode()
+        if len(x) > 0xFFFF:
+            raise ValueError(f"message id of {len(x)} bytes, at most 65535")
+        parts += [_LENGTH.pack(len(x)), x]
+    if timestamp is not None:
+        flags |= FLAG_TIMESTAMP
+        parts.append(_TIMESTAMP.pack(timestamp))
+    if content_type is not None:
+        flags |= FLAG_CONTENT_TYPE
+        x = content_type.encode()
+        if len(x) > 0xFF:
+            raise ValueError(f"content type of {len(x)} bytes, at most 255")
+        parts += [bytes([len(x)]), x]
+    if isinstance(payload, str):
+        payload = payload.encode()
+    else:
+        flags |= FLAG_BYTES
+    parts[0] = _HEADER.pack(Message.VERSION, message_type, flags)
+    parts.append(payload)
+    return b"".join(parts)
+
+
+def _unpack(message_type, frame):
+    # zmq frames are read through a memoryview, so that only the returned fields
+    # are copied out of them
+    x = frame if isinstance(frame, bytes) else memoryview(frame)
+    version, t, flags = x[0], x[1], x[2]
+    if version != Message.VERSION:
+        raise Exception(f"unsupported message version {version}")
+    if t != message_type:
+        raise Exception(f"multipart message is not of type {message_type}")
+    offset = _HEADER.size
+    id = timestamp = content_type = None
+    if flags & ~FLAG_BYTES:
+        x = memoryview(x)
+        if flags & FLAG_ID:
+            (n,) = _LENGTH.unpack_from(x, offset)
+            offset += _LENGTH.size
+            id = str(x[offset : offset + n], "utf-8")
+            offset += n
+        if flags & FLAG_TIMESTAMP:
+            (timestamp,) = _TIMESTAMP.unpack_from(x, offset)
+            offset += _TIMESTAMP.size
+        if flags & FLAG_CONTENT_TYPE:
+            n = x[offset]
+            offset += 1
+            content_type = str(x[offset : offset + n], "utf-8")
+            offset += n
+    if flags & FLAG_BYTES:
+        payload = bytes(x[offset:])
+    elif isinstance(x, bytes):
+        payload = x[offset:].decode()
+    else:
+        payload = str(x[offset:], "utf-8")
+    return payload, id, timestamp, content_type
+
+
+def _pack_batch(envelopes):
+    parts = [
+        _HEADER.pack(Message.VERSION, Message.BATCH, 0),
+        _COUNT.pack(len(envelopes)),
+    ]
+    for x in envelopes:
+        parts += [_COUNT.pack(len(x)), x]
+    return b"".join(parts)
+
+
+def _unpack_batch(frame):
+    x = memoryview(frame)
+    version, t = x[0], x[1]
+    if version != Message.VERSION:
+        raise Exception(f"unsupported message version {version}")
+    if t != Message.BATCH:
+        raise Exception("multipart message is not of type BATCH")
+    offset = _HEADER.size
+    (count,) = _COUNT.unpack_from(x, offset)
+    offset += _COUNT.size
+    envelopes = []
+    for _ in range(count):
+        (n,) = _COUNT.unpack_from(x, offset)
+        offset += _COUNT.size
+        envelopes.append(x[offset : offset + n])
+        offset += n
+    return envelopes
+
+
+def _text(x):
+    return x.decode() if isinstance(x, bytes) else str(memoryview(x), "utf-8")
 
 
 class Message:
 
     NOTIFICATION = 0
     CLIENT = 1
+    BATCH = 2
+
+    VERSION = 1
 
     @dataclass
     class Notification:
-        payload: str
+        payload: Union[str, bytes]
         topic: str = ""
+        id: Optional[str] = None
+        timestamp: Optional[float] = None
+        content_type: Optional[str] = None
 
-        def to_multipart(self):
+        def to_multipart(self, legacy=False):
+            """Encodes [topic, envelope], or [topic, type, payload] if legacy"""
+            if legacy:
+                return [
+                    self.topic.encode(),
+                    bytes([Message.NOTIFICATION]),
+                    (
+                        self.payload.encode()
+                        if isinstance(self.payload, str)
+                        else self.payload
+                    ),
+                ]
             return [
                 self.topic.encode(),
-                bytes([Message.NOTIFICATION]),
-                self.payload.encode(),
+                _pack(
+                    Message.NOTIFICATION,
+                    self.payload,
+                    self.id,
+                    self.timestamp,
+                    self.content_type,
+                ),
             ]
 
         @classmethod
         def from_multipart(cls, xs):
-            topic, t, payload = xs
-            if int.from_bytes(t, byteorder="big") != Message.NOTIFICATION:
-                raise Exception("multipart message is not of type NOTIFICATION")
-            return cls(topic=topic.decode(), payload=payload.decode())
+            if len(xs) == 3:
+                topic, t, payload = xs
+                if int.from_bytes(t, byteorder="big") != Message.NOTIFICATION:
+                    raise Exception("multipart message is not of type NOTIFICATION")
+                return cls(topic=_text(topic), payload=_text(payload))
+            topic, envelope = xs
+            payload, id, timestamp, content_type = _unpack(
+                Message.NOTIFICATION, envelope
+            )
+            return cls(
+                topic=_text(topic),
+                payload=payload,
+                id=id,
+                timestamp=timestamp,
+                content_type=content_type,
+            )
 
-        def copy(self, topic=None, payload=None):
+        def copy(
+            self, topic=None, payload=None, id=None, timestamp=None, content_type=None
+        ):
             return self.__class__(
-                topic=topic or self.topic, payload=payload or self.payload
+                topic=topic or self.topic,
+                payload=payload or self.payload,
+                id=id or self.id,
+                timestamp=timestamp or self.timestamp,
+                content_type=content_type or self.content_type,
             )
 
+    @dataclass
+    class Batch:
+        """Notifications of one topic sent as a single message"""
+
+        notifications: List["Message.Notification"]
+        topic: str = ""
+
+        def to_multipart(self):
+            return [
+                self.topic.encode(),
+                _pack_batch(
+                    [
+                        _pack(
+                            Message.NOTIFICATION,
+                            n.payload,
+                            n.id,
+                            n.timestamp,
+                            n.content_type,
+                        )
+                        for n in self.notifications
+                    ]
+                ),
+            ]
+
+        @classmethod
+        def from_multipart(cls, xs):
+            topic, batch = xs
+            topic = _text(topic)
+            notifications = []
+            for envelope in _unpack_batch(batch):
+                payload, id, timestamp, content_type = _unpack(
+                    Message.NOTIFICATION, envelope
+                )
+                notifications.append(
+                    Message.Notification(
+                        topic=topic,
+                        payload=payload,
+                        id=id,
+                        timestamp=timestamp,
+                        content_type=content_type,
+                    )
+                )
+            return cls(topic=topic, notifications=notifications)
+
+        @staticmethod
+        def pack(envelopes):
+            """Packs encoded notification envelopes (frame 2 of their multipart)
+            into the frame of a batch"""
+            return _pack_batch(envelopes)
+
+        @staticmethod
+        def is_batch(xs):
+            """True if the multipart message xs is a batch"""
+            if len(xs) != 2:
+                return False
+            x = xs[1] if isinstance(xs[1], bytes) else memoryview(xs[1])
+            return len(x) > 1 and x[1] == Message.BATCH
+
     @dataclass
     class Client:
         name: str
-        payload: str
+        payload: Union[str, bytes]
+        id: Optional[str] = None
+        timestamp: Optional[float] = None
+        content_type: Optional[str] = None
 
-        def to_multipart(self):
+        def to_multipart(self, legacy=False):
+            """Encodes [name, envelope], or [name, type, payload] if legacy"""
+            if legacy:
+                return [
+                    self.name.encode(),
+                    bytes([Message.CLIENT]),
+                    (
+                        self.payload.encode()
+                        if isinstance(self.payload, str)
+                        else self.payload
+                    ),
+                ]
             return [
                 self.name.encode(),
-                bytes([Message.CLIENT]),
-                self.payload.encode(),
+                _pack(
+                    Message.CLIENT,
+                    self.payload,
+                    self.id,
+                    self.timestamp,
+                    self.content_type,
+                ),
             ]
 
         @classmethod
         def from_multipart(cls, xs):
-            name, t, payload = xs
-            if int.from_bytes(t, byteorder="big") != Message.CLIENT:
-                raise Exception("multipart message is not of type CLIENT")
-            return cls(name=name.decode(), payload=payload.decode())
+            if len(xs) == 3:
+                name, t, payload = xs
+                if int.from_bytes(t, byteorder="big") != Message.CLIENT:
+                    raise Exception("multipart message is not of type CLIENT")
+                return cls(name=_text(name), payload=_text(payload))
+            name, envelope = xs
+            payload, id, timestamp, content_type = _unpack(Message.CLIENT, envelope)
+            return cls(
+                name=_text(name),
+                payload=payload,
+                id=id,
+                timestamp=timestamp,
+                content_type=content_type,
+            )
 
-        def copy(self, name=None, payload=None):
+        def copy(
+            self, name=None, payload=None, id=None, timestamp=None, content_type=None
+        ):
             return self.__class__(
-                name=name or self.name, payload=payload or self.payload
+                name=name or self.name,
+                payload=payload or self.payload,
+                id=id or self.id,
+                timestamp=timestamp or self.timestamp,
+                content_type=content_type or self.content_type,
             )
 
     @dataclass
     class Websocket:
         connection_id: int
-        request: Request
-        message: WSMessage
+        request: "Request"
+        message: "WSMessage"
 
         def copy(self, connection_id=None, request=None, message=None):
             return self.__class__(
@@ -1,24 +1,243 @@
-__all__ = ["InternalConnection"]
+__all__ = [
+    "InternalConnection",
+    "InternalRegistry",
+    "RingBuffer",
+    "ConnectionClosed",
+]
 
-from collections import defaultdict
-from queue import Queue
-from typing import Optional
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from queue import Full
+from typing import Iterable, List, Optional
 
-from agents.messaging.defs import BaseConnection
+from agents.messaging.defs import BaseConnection, Serialized
 
-_pidgeon_holes = defaultdict(Queue)
 
+class ConnectionClosed(ConnectionError):
+    """The ring buffer of an internal connection was closed"""
 
+
+class RingBuffer:
+    """Bounded FIFO of serialized messages, shared by the connections of a uid
+
+    Consumers block on a condition variable instead of spinning, they are only
+    notified when waiting so that uncontended sends cost a lock and an append.
+    Bulk operations move many messages under a single lock acquisition.
+
+    Args:
+        maxsize (int): maximum number of buffered messages, unbounded if <= 0
+    """
+
+    def __init__(self, maxsize: int = 0):
+        self.maxsize = maxsize
+        self.closed = False
+        self._items: deque = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._getters = 0
+        self._putters = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _check(self) -> None:
+        if self.closed:
+            raise ConnectionClosed("ring buffer is closed")
+
+    def _wait_not_full(self, timeout: Optional[float]) -> int:
+        """Free slots, waits up to timeout for one (lock held)"""
+        if self.maxsize <= 0:
+            return -1
+        if len(self._items) >= self.maxsize:
+            self._putters += 1
+            try:
+                ready = self._not_full.wait_for(
+                    lambda: self.closed or len(self._items) < self.maxsize, timeout
+                )
+            finally:
+                self._putters -= 1
+            self._check()
+            if not ready:
+                raise Full(f"ring buffer is full ({self.maxsize} messages)")
+        return self.maxsize - len(self._items)
+
+    def put(self, x: Serialized, timeout: Optional[float] = None) -> None:
+        """Appends x, blocks up to timeout seconds while the buffer is full"""
+        with self._lock:
+            self._check()
+            self._wait_not_full(timeout)
+            self._items.append(x)
+            if self._getters:
+                self._not_empty.notify()
+
+    def put_many(self, xs: Iterable[Serialized], timeout: Optional[float] = None):
+        """Appends all of xs, blocks up to timeout seconds for each slot"""
+        xs = list(xs)
+        with self._lock:
+            self._check()
+            while xs:
+                free = self._wait_not_full(timeout)
+                if free < 0 or free >= len(xs):
+                    self._items.extend(xs)
+                    xs = []
+                else:
+                    self._items.extend(xs[:free])
+                    xs = xs[free:]
+                if self._getters:
+                    self._not_empty.notify_all()
+
+    def get_many(
+        self, max_n: Optional[int] = None, timeout: Optional[float] = 0.0
+    ) -> List[Serialized]:
+        """Pops up to max_n messages, waits up to timeout seconds for the first one
+
+        A timeout of 0 does not block, None waits until a message is received.
+        """
+        items = self._items
+        with self._lock:
+            self._check()
+            if not items and (timeout is None or timeout > 0):
+                self._getters += 1
+                try:
+                    self._not_empty.wait_for(lambda: items or self.closed, timeout)
+                finally:
+                    self._getters -= 1
+                self._check()
+            if max_n is None or max_n >= len(items):
+                xs = list(items)
+                items.clear()
+            else:
+                xs = [items.popleft() for _ in range(max_n)]
+            if xs and self._putters:
+                self._not_full.notify(len(xs))
+            return xs
+
+    def get(self, timeout: Optional[float] = 0.0) -> Optional[Serialized]:
+        """Pops a message, None if none was received within timeout seconds"""
+        with self._lock:
+            self._check()
+            if not self._items:
+                if timeout is not None and timeout <= 0:
+                    return None
+                self._getters += 1
+                try:
+                    ready = self._not_empty.wait_for(
+                        lambda: self._items or self.closed, timeout
+                    )
+                finally:
+                    self._getters -= 1
+                self._check()
+                if not ready:
+                    return None
+            x = self._items.popleft()
+            if self._putters:
+                self._not_full.notify()
+            return x
+
+    def close(self) -> None:
+        """Drops buffered messages, blocked senders and receivers raise ConnectionClosed"""
+        with self._lock:
+            self.closed = True
+            self._items.clear()
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+
+class InternalRegistry:
+    """Ring buffers of internal connections by uid
+
+    Connection pools keep a registry each, so that uids of different pools do not
+    collide. Closing a uid closes its ring buffer, connections still holding it
+    raise ConnectionClosed instead of silently recreating it, a new connection
+    opens a new ring buffer.
+
+    Args:
+        maxsize (int): default size of the ring buffers, unbounded if <= 0
+    """
+
+    def __init__(self, maxsize: int = 0):
+        self.maxsize = maxsize
+        self.buffers: dict[str, RingBuffer] = {}
+        self._lock = threading.Lock()
+
+    def open(self, uid: str, maxsize: Optional[int] = None) -> RingBuffer:
+        """Ring buffer of uid, created if it is not open"""
+        with self._lock:
+            buffer = self.buffers.get(uid)
+            if buffer is None:
+                buffer = RingBuffer(self.maxsize if maxsize is None else maxsize)
+                self.buffers[uid] = buffer
+            return buffer
+
+    def close(self, uid: str) -> None:
+        with self._lock:
+            buffer = self.buffers.pop(uid, None)
+        if buffer is not None:
+            buffer.close()
+
+
+# registry of connections created without one
+default_registry = InternalRegistry()
+
+
+@dataclass
 class InternalConnection(BaseConnection):
-    def send(self, serialized: str) -> None:
-        _pidgeon_holes[self.uid].put(serialized, block=False)
 
-    def receive(self) -> Optional[str]:
-        return (
-            None
-            if _pidgeon_holes[self.uid].empty()
-            else _pidgeon_holes[self.uid].get(block=False)
-        )
+    # default_registry if None
+    registry: Optional[InternalRegistry] = None
+    # size of the ring buffer if this connection opens it, see InternalRegistry
+    maxsize: Optional[int] = None
+    _buffer: RingBuffer = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        if self.registry is None:
+            self.registry = default_registry
+        self._buffer = self.registry.open(self.uid, self.maxsize)
+
+    def send(self, serialized: Serialized, timeout: Optional[float] = None) -> None:
+        self._buffer.put(serialized, timeout)
+
+    def send_many(
+        self, serialized: Iterable[Serialized], timeout: Optional[float] = None
+    ) -> None:
+        """Sends many serialized messages under a single lock acquisition
+
+        Args:
+            serialized: outputs of BaseMessage.serialize
+            timeout: seconds to wait for each free slot of a full ring buffer
+        """
+        self._buffer.put_many(serialized, timeout)
+
+    async def send_async(self, serialized: Serialized) -> None:
+        self._buffer.put(serialized, 0)
+
+    def receive(self, timeout: Optional[float] = 0.0) -> Optional[Serialized]:
+        """Receives a message, waiting up to timeout seconds (forever if None)
+
+        Returns:
+            Optional[Serialized]: Serialized data, None if nothing was received
+        """
+        return self._buffer.get(timeout)
+
+    def receive_many(
+        self, max_n: Optional[int] = None, timeout: Optional[float] = 0.0
+    ) -> List[Serialized]:
+        """Receives up to max_n messages, waiting up to timeout seconds for the first
+
+        Returns:
+            List[Serialized]: Serialized data, empty if nothing was received
+        """
+        return self._buffer.get_many(max_n, timeout)
+
+    async def receive_async(self) -> Optional[Serialized]:
+        return self._buffer.get(0)
 
     def close(self) -> None:
-        del _pidgeon_holes[self.uid]
+        # do not close a ring buffer opened again for the uid
+        if not self._buffer.closed:
+            self.registry.close(self.uid)
+
+    async def close_async(self) -> None:
+        self.close()
@@ -6,7 +6,8 @@ from typing import Optional
 from aiohttp import WSCloseCode, WSMessage, WSMsgType
 from aiohttp.web import WebSocketResponse
 
-from agents.messaging.defs import BaseConnection
+from agents.messaging.defs import BaseConnection, Serialized
+from agents.utils import Compressor
 
 
 @dataclass
@@ -14,13 +15,23 @@ class WebsocketConnection(BaseConnection):
 
     socket: WebSocketResponse
     timeout: float
-
-    async def send_async(self, serialized: str) -> None:
-        await self.socket.send_str(serialized)
-
-    async def receive_async(self) -> Optional[str]:
+    # compressed messages are sent as binary frames prefixed with a flag byte
+    compressor: Optional[Compressor] = None
+
+    async def send_async(self, serialized: Serialized) -> None:
+        if self.compressor is not None:
+            serialized = self.compressor.compress(serialized)
+        # binary serializers are sent as binary frames
+        if isinstance(serialized, str):
+            await self.socket.send_str(serialized)
+        else:
+            await self.socket.send_bytes(serialized)
+
+    async def receive_async(self) -> Optional[Serialized]:
         message: WSMessage = await self.socket.receive(timeout=self.timeout)
-        if message.type == WSMsgType.TEXT:
+        if message.type == WSMsgType.BINARY and self.compressor is not None:
+            return self.compressor.decompress(message.data)
+        if message.type in (WSMsgType.TEXT, WSMsgType.BINARY):
             return message.data
         return None
 
@@ -1,4 +1,4 @@
-__all__ = ["BaseMessage", "BaseConnection"]
+__all__ = ["BaseMessage", "BaseConnection", "Serialized"]
 
 from abc import abstractmethod
 from dataclasses import dataclass
@@ -6,6 +6,9 @@ from typing import Any, Generic, Optional, TypeVar, Union
 
 Deserialized_T = TypeVar("Deserialized_T")
 
+# text serializers produce str, binary serializers bytes
+Serialized = Union[str, bytes]
+
 
 @dataclass
 class BaseMessage(Generic[Deserialized_T]):
@@ -13,16 +16,16 @@ class BaseMessage(Generic[Deserialized_T]):
     data: Deserialized_T
 
     @abstractmethod
-    def serialize(self) -> str:
+    def serialize(self) -> Serialized:
         raise NotImplementedError("BaseMessage/serialize")
 
     @classmethod
     @abstractmethod
-    def deserialize(cls, serialized: str) -> Deserialized_T:
+    def deserialize(cls, serialized: Serialized) -> Deserialized_T:
         raise NotImplementedError("BaseMessage/deserialize")
 
     @classmethod
-    def from_serialized(cls, serialized: str, **kwargs: Any) -> "BaseMessage":
+    def from_serialized(cls, serialized: Serialized, **kwargs: Any) -> "BaseMessage":
         return cls(data=cls.deserialize(serialized), **kwargs)
 
 
@@ -42,7 +45,7 @@ class BaseConnection:
         return str(self.uid)
 
     @abstractmethod
-    def send(self, serialized: str) -> None:
+    def send(self, serialized: Serialized) -> None:
         """Implementation of how a serilized message is sent to the client in this connection
 
         Args:
@@ -53,20 +56,20 @@ class BaseConnection:
         raise NotImplementedError("BaseConnection/send")
 
     @abstractmethod
-    async def send_async(self, serialized: str) -> None:
+    async def send_async(self, serialized: Serialized) -> None:
         raise NotImplementedError("BaseConnection/send_async")
 
     @abstractmethod
-    def receive(self) -> Optional[str]:
+    def receive(self) -> Optional[Serialized]:
         """Polling method to receive data on the connection
 
         Returns:
-            Optional[str]: Serialized data
+            Optional[Serialized]: Serialized data
         """
         raise NotImplementedError("BaseConnection/receive")
 
     @abstractmethod
-    async def receive_async(self) -> Optional[str]:
+    async def receive_async(self) -> Optional[Serialized]:
         raise NotImplementedError("BaseConnection/receive_async")
 
     @abstractmethod
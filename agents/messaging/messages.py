@@ -1,10 +1,30 @@
-__all__ = ["JSONMessage"]
+__all__ = [
+    "JSONMessage",
+    "FastJSONMessage",
+    "MsgpackMessage",
+    "PickleMessage",
+    "SERIALIZERS",
+    "get_serializer",
+]
 
 import json
+import pickle
+import struct
+from typing import Any, List, Type, Union
 
 from agents.defs import JSONObject
 from agents.messaging.defs import BaseMessage
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 
 class JSONMessage(BaseMessage):
     def serialize(self) -> str:
@@ -13,3 +33,111 @@ class JSONMessage(BaseMessage):
     @classmethod
     def deserialize(self, raw: str) -> JSONObject:
         return json.loads(raw)
+
+
+class FastJSONMessage(BaseMessage):
+    """JSON serialized to utf-8 bytes with orjson, or the json module if orjson is
+    not installed"""
+
+    def serialize(self) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(self.data)
+        return json.dumps(self.data, separators=(",", ":")).encode()
+
+    @classmethod
+    def deserialize(cls, raw: Union[str, bytes]) -> JSONObject:
+        if orjson is not None:
+            return orjson.loads(raw)
+        return json.loads(raw)
+
+
+class MsgpackMessage(BaseMessage):
+    """Compact binary serialization of JSON like data (requires msgpack)"""
+
+    def serialize(self) -> bytes:
+        if msgpack is None:
+            raise ImportError("MsgpackMessage requires msgpack")
+        return msgpack.packb(self.data, use_bin_type=True)
+
+    @classmethod
+    def deserialize(cls, raw: bytes) -> Any:
+        if msgpack is None:
+            raise ImportError("MsgpackMessage requires msgpack")
+        return msgpack.unpackb(raw, raw=False)
+
+
+_COUNT = struct.Struct("!I")
+_LENGTH = struct.Struct("!Q")
+
+
+class PickleMessage(BaseMessage):
+    """Pickle protocol 5 serialization with out-of-band buffers
+
+    Buffers exposing the pickle buffer protocol (eg. numpy arrays) are not copied
+    into the pickle stream. `serialize_frames` returns them as separate frames, to
+    be sent as a multipart message (eg. with a zero_copy socket), `serialize` joins
+    them behind a length header into one bytes message. On deserialization the
+    buffers are memoryviews of the received data, so numpy arrays are read only.
+
+    Only deserialize messages from trusted peers, unpickling runs arbitrary code.
+    """
+
+    def serialize(self) -> bytes:
+        body, *buffers = self.serialize_frames()
+        header = _COUNT.pack(len(buffers)) + b"".join(
+            _LENGTH.pack(x.nbytes) for x in buffers
+        )
+        return b"".join([header, body, *buffers])
+
+    @classmethod
+    def deserialize(cls, raw: bytes) -> Any:
+        x = memoryview(raw)
+        (n,) = _COUNT.unpack_from(x)
+        offset = _COUNT.size
+        lengths = [
+            _LENGTH.unpack_from(x, offset + i * _LENGTH.size)[0] for i in range(n)
+        ]
+        offset += n * _LENGTH.size
+        end = len(x) - sum(lengths)
+        body = x[offset:end]
+        buffers = []
+        for length in lengths:
+            buffers.append(x[end : end + length])
+            end += length
+        return pickle.loads(body, buffers=buffers)
+
+    def serialize_frames(self) -> List[Union[bytes, memoryview]]:
+        """Returns [pickle stream, *out-of-band buffers] without copying buffers"""
+        buffers = []
+        body = pickle.dumps(
+            self.data, protocol=5, buffer_callback=lambda b: buffers.append(b.raw())
+        )
+        return [body, *buffers]
+
+    @classmethod
+    def deserialize_frames(cls, frames: List[Any]) -> Any:
+        """Inverse of `serialize_frames`, frames may be bytes or zmq.Frame"""
+        body, *buffers = frames
+        return pickle.loads(body, buffers=[memoryview(x) for x in buffers])
+
+
+SERIALIZERS = {
+    "json": JSONMessage,
+    "fastjson": FastJSONMessage,
+    "msgpack": MsgpackMessage,
+    "pickle": PickleMessage,
+}
+
+
+def get_serializer(
+    serializer: Union[str, Type[BaseMessage], None] = None,
+) -> Type[BaseMessage]:
+    """Returns a BaseMessage class from its name in SERIALIZERS, JSONMessage if None"""
+    if serializer is None:
+        return JSONMessage
+    if isinstance(serializer, str):
+        try:
+            return SERIALIZERS[serializer]
+        except KeyError:
+            raise ValueError(f"serializer must be one of {list(SERIALIZERS)}") from None
+    return serializer
@@ -2,25 +2,46 @@ __all__ = ["ConnectionPool", "SyncConnectionPool", "AsyncConnectionPool"]
 
 import asyncio
 from asyncio import AbstractEventLoop
-from typing import Optional, Union
+from typing import Optional, Type, Union
 
 from agents import Agent
-from agents.messaging.defs import BaseConnection, BaseMessage
+from agents.messaging.connections.internal import InternalConnection, InternalRegistry
+from agents.messaging.defs import BaseConnection, BaseMessage, Serialized
+from agents.messaging.messages import get_serializer
 from agents.utils import Logger, RxTxSubject, random_uuid
 
 ConnectionOrUid = Union[BaseConnection, str]
-MessageOrSerialized = Union[BaseMessage, str]
+MessageOrSerialized = Union[BaseMessage, Serialized]
 
 
 class ConnectionPool:
-    def __init__(self, agent: Optional[Agent] = None, uid: Optional[str] = None):
+    """Connections of an agent
+
+    Args:
+        agent: agent owning the pool
+        uid: pool id
+        serializer: serializer of the connections created for this pool, a
+            BaseMessage class or its name in SERIALIZERS, JSONMessage if None
+        internal_maxsize: size of the ring buffers of the internal connections
+            created for this pool, unbounded if <= 0
+    """
+
+    def __init__(
+        self,
+        agent: Optional[Agent] = None,
+        uid: Optional[str] = None,
+        serializer: Union[str, Type[BaseMessage], None] = None,
+        internal_maxsize: int = 0,
+    ):
         if not isinstance(agent, Agent):
             raise TypeError("agent must be of type Agent")
         self.agent = agent
+        self.serializer = get_serializer(serializer)
         self.rtx = RxTxSubject()
         self.uid = uid or random_uuid()
         self.log = Logger(agent.log, {"pool": self.uid})
         self.connections: dict[str, BaseConnection] = {}
+        self.internal = InternalRegistry(maxsize=internal_maxsize)
 
     def get_connection(self, con: ConnectionOrUid) -> Optional[BaseConnection]:
         if isinstance(con, BaseConnection):
@@ -33,6 +54,24 @@ class ConnectionPool:
         self.connections[con.uid] = con
         self.log.debug(f"Added {con} to pool")
 
+    def create_internal_connection(
+        self, uid: Optional[str] = None, maxsize: Optional[int] = None
+    ) -> InternalConnection:
+        """Adds an InternalConnection on the ring buffers of this pool
+
+        Args:
+            uid: connection id, random if None
+            maxsize: size of its ring buffer, internal_maxsize of the pool if None
+        """
+        con = InternalConnection(
+            uid=uid or random_uuid(),
+            serializer=self.serializer,
+            registry=self.internal,
+            maxsize=maxsize,
+        )
+        self.add(con)
+        return con
+
     def shutdown(self) -> None:
         self.rtx.dispose()
 
@@ -1,5 +1,38 @@
-from .authentication import AuthenticationMixin
-from .daemon import DaemonMixin
-from .notifications import NotificationsMixin
-from .router_client import RouterClientMixin
-from .webserver import WebserverMixin
+import importlib
+
+# typing.TYPE_CHECKING without importing typing, type checkers treat it as True
+TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from .authentication import AuthenticationMixin
+    from .daemon import DaemonMixin
+    from .mesh import MeshMixin
+    from .notifications import NotificationsMixin
+    from .router_client import RouterClientMixin
+    from .rpc import RPCMixin
+    from .webserver import WebserverMixin
+
+# mixins are imported on first access (PEP 562), eg. only WebserverMixin needs aiohttp
+_LAZY = {
+    "AuthenticationMixin": ".authentication",
+    "DaemonMixin": ".daemon",
+    "MeshMixin": ".mesh",
+    "NotificationsMixin": ".notifications",
+    "RouterClientMixin": ".router_client",
+    "RPCMixin": ".rpc",
+    "WebserverMixin": ".webserver",
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
@@ -1,69 +1,504 @@
+import asyncio
+import heapq
+import inspect
+import itertools
 import queue
-from datetime import datetime, timedelta
-from queue import Queue
-from threading import Thread
-from traceback import format_exc
-from collections import defaultdict
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+from concurrent.futures import CancelledError, Future
+from queue import PriorityQueue, Queue
+
 import rx
+from rx.disposable import Disposable
+
+# put in daemon queues at exit, so that daemons blocked on them wake up
+_EXIT = object()
+
+
+class JobStream:
+    """Chunks yielded by a streaming daemon job, consumed as an iterator or as an
+    observable
+
+    The job is paused while `buffer` chunks wait for the consumer, so that a slow
+    consumer holds at most `buffer` chunks in memory. `cancel` (or leaving a
+    `with` block, or disposing the subscription of `observable`) closes the
+    generator of the job at its next chunk. Iterating a cancelled stream raises
+    `CancelledError`, iterating a failed one raises the error of the job.
+
+    Usage:
+
+        ```python
+        with daemon.stream(query) as rows:
+            for row in rows:
+                ...
+
+        daemon.stream(query).observable.subscribe(on_next=print)
+        ```
+
+    Args:
+        buffer (int): maximum number of chunks waiting for the consumer
+    """
+
+    def __init__(self, buffer=16):
+        self.buffer = buffer
+        self.cancelled = False
+        self._chunks = deque()
+        self._condition = threading.Condition()
+        self._done = False
+        self._error = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self._condition:
+            while not self._chunks and not self._done and not self.cancelled:
+                self._condition.wait()
+            if self.cancelled:
+                raise CancelledError()
+            if self._chunks:
+                chunk = self._chunks.popleft()
+                self._condition.notify_all()
+                return chunk
+            if self._error is not None:
+                raise self._error
+            raise StopIteration
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cancel()
+
+    def cancel(self):
+        """Stops the job at its next chunk and drops the buffered chunks"""
+        with self._condition:
+            if not self._done:
+                self.cancelled = True
+                self._chunks.clear()
+            self._condition.notify_all()
+
+    @property
+    def observable(self):
+        """Observable of the chunks, iterated in a thread per subscription"""
+
+        def subscribe(observer, scheduler=None):
+            def run():
+                try:
+                    for chunk in self:
+                        observer.on_next(chunk)
+                except CancelledError:
+                    return
+                except Exception as e:
+                    observer.on_error(e)
+                    return
+                observer.on_completed()
+
+            threading.Thread(target=run, daemon=True).start()
+            return Disposable(self.cancel)
+
+        return rx.create(subscribe)
+
+    def _put(self, chunk):
+        """Buffers a chunk, blocks while the buffer is full, False if cancelled"""
+        with self._condition:
+            while len(self._chunks) >= self.buffer and not self.cancelled:
+                self._condition.wait()
+            if self.cancelled:
+                return False
+            self._chunks.append(chunk)
+            self._condition.notify_all()
+            return True
+
+    def _finish(self, error=None):
+        with self._condition:
+            self._done = True
+            self._error = error
+            self._condition.notify_all()
+
+
+class Daemon:
+    """Pool of workers calling func with the jobs submitted to it
+
+    Jobs are taken by priority (lowest first), in submission order within a
+    priority. With kind="thread" the workers call func in threads, with
+    kind="process" they hand each job to the "cpu" process pool of the agent, at
+    most `workers` jobs at a time, so func and its arguments must be picklable. At most `maxsize` jobs wait for a worker,
+    `request` blocks while the daemon is full. Jobs still waiting when the daemon
+    is disposed are cancelled, and so are the streams in progress.
+
+    When func is a generator or an async generator function, `stream` returns the
+    chunks it yields as they come (see `JobStream`), while `submit` collects them
+    in a list. Streaming jobs need kind="thread".
+
+    Usage:
+
+        ```python
+        daemon = agent.create_daemon(None, resize, workers=4)
+        future = daemon.submit(image, size=(64, 64))
+        urgent = daemon.request((image,), {"size": (8, 8)}, priority=-1)
+        tiles = daemon.stream(image, size=(64, 64))
+        ```
+
+    Args:
+        agent: agent owning the worker threads
+        func (callable): called with the args and kwargs of every job
+        workers (int): number of workers
+        kind (str): "thread" or "process"
+        maxsize (int): bound of the waiting jobs, unbounded if 0
+    """
+
+    def __init__(self, agent, func, workers=1, kind="thread", maxsize=0):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"kind must be 'thread' or 'process', not {kind!r}")
+        self.log = agent.log
+        self.func = func
+        self.workers = workers
+        self.kind = kind
+        self.jobs = PriorityQueue(maxsize)
+        self.executor = None
+        self._ids = itertools.count()
+        self._stopped = False
+        self._streams = set()
+        if kind == "process":
+            self.executor = agent.executors["cpu"]
+        for _ in range(workers):
+            agent.run_process_in_thread(self._work)
+
+    def submit(self, *args, **kwargs):
+        """Future of func(*args, **kwargs)"""
+        return self.request(args, kwargs)
+
+    def stream(self, *args, **kwargs):
+        """JobStream of the chunks of func(*args, **kwargs)"""
+        return self.request(args, kwargs, stream=True)
+
+    def request(
+        self, args=(), kwargs=None, priority=0, timeout=None, stream=False, buffer=16
+    ):
+        """Queues a job, returns the Future of its result, or its JobStream
+
+        Args:
+            args (tuple): positional arguments
+            kwargs (dict): keyword arguments
+            priority (int): jobs of lower priority run first
+            timeout (float): seconds to wait while the daemon is full before
+                raising `queue.Full`, forever if None
+            stream (bool): stream the chunks yielded by the job
+            buffer (int): chunks of a stream waiting for its consumer
+        """
+        if self._stopped:
+            raise RuntimeError("daemon is disposed")
+        if stream and self.executor is not None:
+            raise ValueError("streaming jobs need kind='thread'")
+        job = JobStream(buffer) if stream else Future()
+        self.jobs.put(
+            (priority, next(self._ids), job, args, kwargs or {}), timeout=timeout
+        )
+        return job
+
+    def _work(self, exit_event):
+        while not exit_event.is_set():
+            _, _, job, args, kwargs = self.jobs.get()
+            if job is None:
+                break
+            if isinstance(job, JobStream):
+                self._stream(job, args, kwargs)
+                continue
+            if not job.set_running_or_notify_cancel():
+                continue
+            try:
+                if self.executor is not None:
+                    result = self.executor.submit(self.func, *args, **kwargs).result()
+                else:
+                    result = self.func(*args, **kwargs)
+                    if inspect.isgenerator(result):
+                        result = list(result)
+                    elif inspect.isasyncgen(result):
+                        result = asyncio.run(_collect(result))
+            except BaseException as e:
+                job.set_exception(e)
+            else:
+                job.set_result(result)
+
+    def _stream(self, stream, args, kwargs):
+        if stream.cancelled:
+            return
+        self._streams.add(stream)
+        try:
+            result = self.func(*args, **kwargs)
+            if inspect.isgenerator(result):
+                for chunk in result:
+                    if not stream._put(chunk):
+                        result.close()
+                        break
+            elif inspect.isasyncgen(result):
+                asyncio.run(_pump(result, stream))
+            else:
+                stream._put(result)
+        except BaseException as e:
+            stream._finish(e)
+        else:
+            stream._finish()
+        finally:
+            self._streams.discard(stream)
+
+    def dispose(self):
+        self._stopped = True
+        # cancel the waiting jobs, then wake up every worker
+        while True:
+            try:
+                _, _, future, _, _ = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if future is not None:
+                future.cancel()
+        for stream in list(self._streams):
+            stream.cancel()
+        for _ in range(self.workers):
+            self.jobs.put((float("-inf"), next(self._ids), None, (), {}))
+
+
+async def _collect(agen):
+    return [chunk async for chunk in agen]
+
+
+async def _pump(agen, stream):
+    # the event loop of the job blocks while the consumer is behind
+    try:
+        async for chunk in agen:
+            if not stream._put(chunk):
+                break
+    finally:
+        await agen.aclose()
+
+
+def _hole_bytes():
+    q = Queue()
+    # queue, its deque and locks, the hole tuple and its heap entry
+    parts = (q, q.queue, q.mutex, q.not_empty, q.not_full, q.all_tasks_done)
+    return sum(sys.getsizeof(x) for x in parts) + 2 * sys.getsizeof((q, 0.0))
+
+
+_HOLE_BYTES = _hole_bytes()
+
+
+class PigeonHoles:
+    """Result queues of jobs by uid, expiring `ttl` seconds after their creation
+
+    Expiry times are kept in a min-heap, so that reaping expired holes costs
+    O(log n) per hole instead of a scan of all holes. Holes are also kept in least
+    recently used order, beyond `max_holes` the least recently used hole is
+    evicted. Evicted holes leave stale heap entries behind, which are skipped when
+    popped and compacted away when they outnumber the holes. `run` reaps holes in
+    a background thread as they expire.
+
+    Args:
+        ttl (float): seconds from creation until a hole expires
+        max_holes (int): maximum number of holes, unbounded if None
+    """
+
+    def __init__(self, ttl=3600.0, max_holes=None):
+        self.ttl = ttl
+        self.max_holes = max_holes
+        self.expired = 0
+        self.evicted = 0
+        # uid -> (queue, expires_at), least recently used first
+        self._holes = OrderedDict()
+        # (expires_at, uid)
+        self._heap = []
+        self._condition = threading.Condition()
+        self._stopped = False
+
+    def __len__(self):
+        return len(self._holes)
+
+    def __contains__(self, uid):
+        return uid in self._holes
+
+    def create(self, uid):
+        """Creates (or replaces) the hole uid, returns its queue"""
+        with self._condition:
+            return self._create(uid)
+
+    def get(self, uid):
+        """Queue of the hole uid, created if it does not exist"""
+        with self._condition:
+            hole = self._holes.get(uid)
+            if hole is None:
+                return self._create(uid)
+            self._holes.move_to_end(uid)
+            return hole[0]
+
+    def _create(self, uid):
+        expires_at = time.monotonic() + self.ttl
+        q = Queue()
+        self._holes[uid] = (q, expires_at)
+        self._holes.move_to_end(uid)
+        heapq.heappush(self._heap, (expires_at, uid))
+        if self.max_holes is not None:
+            while len(self._holes) > self.max_holes:
+                self._holes.popitem(last=False)
+                self.evicted += 1
+        if len(self._heap) > 2 * len(self._holes) + 64:
+            self._heap = [(e, k) for k, (_, e) in self._holes.items()]
+            heapq.heapify(self._heap)
+        if self._heap[0][1] == uid:
+            self._condition.notify()
+        return q
+
+    def reap(self, now=None):
+        """Removes the expired holes, returns their number"""
+        now = time.monotonic() if now is None else now
+        n = 0
+        with self._condition:
+            while self._heap and self._heap[0][0] <= now:
+                expires_at, uid = heapq.heappop(self._heap)
+                hole = self._holes.get(uid)
+                # stale entry of an evicted or replaced hole
+                if hole is not None and hole[1] == expires_at:
+                    del self._holes[uid]
+                    n += 1
+            self.expired += n
+        return n
+
+    def gauges(self):
+        """Sizes and approximate memory of the holes, computed in O(n)"""
+        with self._condition:
+            holes = list(self._holes.values())
+            heap = len(self._heap)
+            memory = sys.getsizeof(self._holes) + sys.getsizeof(self._heap)
+        results = sum(q.qsize() for q, _ in holes)
+        memory += len(holes) * _HOLE_BYTES
+        return {
+            "holes": len(holes),
+            "heap_entries": heap,
+            "results": results,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "memory_bytes": memory,
+        }
+
+    def run(self, exit_event):
+        """Reaps holes as they expire, until disposed"""
+        with self._condition:
+            while not self._stopped:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                timeout = self._heap[0][0] - time.monotonic()
+                if timeout > 0:
+                    self._condition.wait(timeout)
+                    continue
+                self.reap()
+
+    def dispose(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
 
 
 class DaemonMixin:
-    
+    # seconds until a pigeon hole expires, and maximum number of pigeon holes
+    pidgeon_ttl = 3600.0
+    max_pidgeon_holes = 1_000_000
+
     def setup(self, *args, **kwargs):
-        self.pidgeon_hole = defaultdict(dict)
+        self._daemon_state()
+
+    def _daemon_state(self):
+        # agents do not run the setup of their mixins
+        holes = self.__dict__.get("pidgeon_hole")
+        if holes is None:
+            holes = PigeonHoles(ttl=self.pidgeon_ttl, max_holes=self.max_pidgeon_holes)
+            if self.__dict__.setdefault("pidgeon_hole", holes) is holes:
+                self.disposables.append(holes)
+                self.run_process_in_thread(holes.run)
+        return self.__dict__["pidgeon_hole"]
 
     def clean_up_pidgeon_hole(self):
-        for uid in self.pidgeon_hole:
-            if datetime.now() > self.pidgeon_hole[uid]["expired_at"]:
-                del self.pidgeon_hole[uid]
-
-    def create_daemon(self, queue, func):
-        t = Thread(
-            target=self.run,
-            args=(queue, func),
-        )
-        self.threads.append(t)
-        t.start()
+        """Removes expired pigeon holes, also done in the background"""
+        return self._daemon_state().reap()
+
+    def pidgeon_gauges(self):
+        """Number, results and approximate memory of the pigeon holes"""
+        return self._daemon_state().gauges()
+
+    def create_daemon(self, queue, func, workers=1, kind="thread", maxsize=0):
+        """Starts a Daemon calling func, see `Daemon`
+
+        Jobs are submitted with `daemon.submit`, or put in queue as (args, kwargs)
+        tuples. The result of a job put in queue is put in the pigeon hole
+        kwargs["pidgeon_uid"], if any, see `get_pidgeon`.
+
+        Args:
+            queue (Queue): queue of (args, kwargs) jobs, None to only submit jobs
+            func (callable): called with the args and kwargs of every job
+            workers (int): number of workers
+            kind (str): "thread" or "process"
+            maxsize (int): bound of the jobs waiting for a worker
+
+        Returns:
+            Daemon
+        """
+        daemon = Daemon(self, func, workers=workers, kind=kind, maxsize=maxsize)
+        self.disposables.append(daemon)
+        if queue is not None:
+            self.run_process_in_thread(lambda exit_event: self.run(queue, daemon))
+            self.on_exit(lambda: self._wake_daemon(queue))
+        return daemon
+
+    def _wake_daemon(self, q):
+        try:
+            q.put_nowait(_EXIT)
+        except Exception:
+            pass  # a full queue has work for the daemon, it sees the exit event next
 
     def create_pidgeon_hole(self, pidgeon_uid):
-        current_time = datetime.now()
-        self.pidgeon_hole[pidgeon_uid] = {
-            "queue": Queue(),
-            "created_at": current_time,
-            "expired_at": current_time + timedelta(hours=1),
-        }
-        # clean up pidgeon holes
-        self.clean_up_pidgeon_hole()
+        self._daemon_state().create(pidgeon_uid)
 
     def put_pidgeon(self, pidgeon_uid, result):
-        if pidgeon_uid not in self.pidgeon_hole:
-            self.create_pidgeon_hole(pidgeon_uid)
         try:
-            self.pidgeon_hole[pidgeon_uid]["queue"].put(result, timeout=1)
+            self._daemon_state().get(pidgeon_uid).put(result, timeout=1)
         except Exception as e:
-            self.log.exception(e)  # queue might be full, no remedy, but just log it for now
+            # queue might be full, no remedy, but just log it for now
+            self.log.exception(e)
 
     def get_pidgeon(self, pidgeon_uid, timeout=60):
-        if pidgeon_uid not in self.pidgeon_hole:
-            self.create_pidgeon_hole(pidgeon_uid)
         try:
-            return self.pidgeon_hole[pidgeon_uid]["queue"].get(timeout=timeout)
+            return self._daemon_state().get(pidgeon_uid).get(timeout=timeout)
         except queue.Empty:
             self.log.error(f"[puid={pidgeon_uid}] Timeout for get_pidgeon")
 
         return None
 
-    def run(self, q, func):
+    def run(self, q, daemon):
+        """Submits the (args, kwargs) jobs of q to daemon, the results of jobs with a
+        pidgeon_uid are put in its pigeon hole"""
         while not self.exit_event.is_set():
+            item = q.get()
+            if item is _EXIT:
+                break
             try:
-                args, kwargs = q.get(timeout=1)
-                pidgeon_uid = kwargs.pop("pidgeon_uid")
-                result = func(*args, **kwargs)
-                if pidgeon_uid:
-                    self.put_pidgeon(pidgeon_uid, result)
-            
-            except queue.Empty:
-                pass
-            
+                args, kwargs = item
+                pidgeon_uid = kwargs.pop("pidgeon_uid", None)
+                future = daemon.request(args, kwargs)
             except Exception as e:
                 self.log.exception(e)
+                continue
+            future.add_done_callback(
+                lambda f, uid=pidgeon_uid: self._put_result(uid, f)
+            )
+
+    def _put_result(self, pidgeon_uid, future):
+        if future.cancelled():
+            return
+        e = future.exception()
+        if e is not None:
+            trace = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+            self.log.error(f"Daemon job failed ...\n\n{trace}")
+        elif pidgeon_uid:
+            self.put_pidgeon(pidgeon_uid, future.result())
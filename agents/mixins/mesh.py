@@ -0,0 +1,254 @@
+import socket
+import struct
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+
+import zmq
+from rx.subject import Subject
+
+from agents.message import Message
+from agents.mixins.notifications import NotificationSubscriber
+from agents.utils import Waker, random_uuid
+
+# beacon: magic, version, flags, PUB port, then "<uid>\0<group>"
+_BEACON = struct.Struct("!3sBBH")
+_MAGIC = b"VPA"
+_VERSION = 1
+ALIVE = 0
+LEAVING = 1
+
+
+class UDPDiscovery:
+    """Discovery backend broadcasting beacons over UDP
+
+    All nodes of a network listen on the same UDP port, SO_REUSEPORT lets several
+    nodes of one host share it. Use `broadcast="127.255.255.255"` to discover nodes
+    of the local host only.
+
+    A discovery backend is any object with `fileno()` (readable when beacons were
+    received), `send(payload)`, `recv()` returning the received `(payload, host)`
+    pairs without blocking, and `close()`.
+
+    Args:
+        port (int): UDP port of the beacons
+        broadcast (str): broadcast address beacons are sent to
+        interface (str): address listened on, all interfaces if empty
+    """
+
+    def __init__(self, port=5670, broadcast="255.255.255.255", interface=""):
+        self.port = port
+        self.broadcast = broadcast
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.socket.bind((interface, port))
+        self.socket.setblocking(False)
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def send(self, payload):
+        self.socket.sendto(payload, (self.broadcast, self.port))
+
+    def recv(self):
+        beacons = []
+        while True:
+            try:
+                payload, (host, _) = self.socket.recvfrom(1024)
+            except BlockingIOError:
+                return beacons
+            beacons.append((payload, host))
+
+    def close(self):
+        self.socket.close()
+
+
+@dataclass
+class Peer:
+    uid: str
+    endpoint: str
+    last_seen: float
+
+
+class MeshNode:
+    """Member of a brokerless notifications mesh
+
+    Every node binds a PUB socket and announces it with a beacon every `interval`
+    seconds. Nodes of the same group connect their SUB socket directly to the PUB
+    socket of every discovered peer, so notifications take a single hop and there
+    is no broker to cap bandwidth. Beacons double as heartbeats: peers not heard of
+    for `timeout` seconds are evicted and disconnected, nodes leaving the mesh
+    announce it so that peers evict them immediately.
+
+    `peers` is the membership view, changes are emitted on `membership` as
+    `("join", peer)` and `("leave", peer)` from the discovery thread. The SUB socket
+    is connected to the node's own PUB socket too, like broker clients receive
+    their own notifications.
+
+    Args:
+        agent: agent owning the sockets and the discovery thread
+        group (str): only nodes of the same group are connected
+        discovery: discovery backend, `UDPDiscovery()` if None
+        address (str): address of the PUB socket, a random port with `*`
+        options (dict): zmq socket options
+        interval (float): seconds between beacons
+        timeout (float): seconds without beacon before a peer is evicted,
+            3 intervals if None
+        topics (str): SUB filter, None to only receive the topics of the handlers
+            registered with `on`
+    """
+
+    def __init__(
+        self,
+        agent,
+        group="default",
+        discovery=None,
+        address="tcp://0.0.0.0:*",
+        options=None,
+        interval=1.0,
+        timeout=None,
+        topics="",
+    ):
+        self.log = agent.log
+        self.uid = random_uuid()
+        self.group = group
+        self.discovery = discovery or UDPDiscovery()
+        self.interval = interval
+        self.timeout = 3 * interval if timeout is None else timeout
+        self.peers = {}
+        self.membership = Subject()
+        self._waker = Waker()
+        self._stopped = False
+
+        options = options or {}
+        self.pub = agent.bind_socket(zmq.PUB, options, address)
+        endpoint = self.pub.socket.getsockopt_string(zmq.LAST_ENDPOINT)
+        self.port = int(endpoint.rsplit(":", 1)[1])
+        sub = agent.connect_socket(zmq.SUB, options, f"tcp://127.0.0.1:{self.port}")
+        self.sub = NotificationSubscriber(agent, sub)
+        if topics is not None:
+            self.sub.subscribe(topics)
+        self.observable = self.sub.observable
+        agent.run_process_in_thread(self._run)
+
+    def send(self, x):
+        """Publishes a notification, either a `Message.Notification` or its multipart"""
+        if isinstance(x, Message.Notification):
+            x = x.to_multipart()
+        self.pub.send(x)
+
+    def on(self, topic_prefix, handler):
+        """See `NotificationSubscriber.on`"""
+        return self.sub.on(topic_prefix, handler)
+
+    def _beacon(self, flags):
+        return _BEACON.pack(_MAGIC, _VERSION, flags, self.port) + (
+            f"{self.uid}\0{self.group}".encode()
+        )
+
+    def _on_beacon(self, payload, host):
+        try:
+            magic, version, flags, port = _BEACON.unpack_from(payload)
+            uid, group = payload[_BEACON.size :].decode().split("\0")
+        except Exception:
+            return
+        if magic != _MAGIC or version != _VERSION:
+            return
+        if uid == self.uid or group != self.group:
+            return
+        peer = self.peers.get(uid)
+        if flags == LEAVING:
+            if peer is not None:
+                self._evict(peer)
+        elif peer is None:
+            peer = Peer(uid, f"tcp://{host}:{port}", time.monotonic())
+            self.peers[uid] = peer
+            endpoint = peer.endpoint
+            self.sub.connection.call(lambda socket: socket.connect(endpoint))
+            self.log.info(f"Mesh peer {uid} joined on {endpoint} ...")
+            self.membership.on_next(("join", peer))
+        else:
+            peer.last_seen = time.monotonic()
+
+    def _evict(self, peer):
+        del self.peers[peer.uid]
+        endpoint = peer.endpoint
+        self.sub.connection.call(lambda socket: socket.disconnect(endpoint))
+        self.log.info(f"Mesh peer {peer.uid} left ...")
+        self.membership.on_next(("leave", peer))
+
+    def _run(self, exit_event):
+        poller = zmq.Poller()
+        poller.register(self.discovery, zmq.POLLIN)
+        poller.register(self._waker.socket, zmq.POLLIN)
+        next_beacon = 0
+        try:
+            while not self._stopped:
+                now = time.monotonic()
+                if now >= next_beacon:
+                    self.discovery.send(self._beacon(ALIVE))
+                    next_beacon = now + self.interval
+                    for peer in list(self.peers.values()):
+                        if now - peer.last_seen > self.timeout:
+                            self._evict(peer)
+                events = dict(poller.poll(max(0, next_beacon - now) * 1000))
+                if self._waker.socket in events:
+                    self._waker.clear()
+                if self.discovery.fileno() in events:
+                    for payload, host in self.discovery.recv():
+                        self._on_beacon(payload, host)
+            self.discovery.send(self._beacon(LEAVING))
+        except Exception:
+            self.log.error(f"Mesh discovery failed ...\n\n{traceback.format_exc()}")
+        finally:
+            self.discovery.close()
+            self._waker.close()
+
+    def dispose(self):
+        self._stopped = True
+        self._waker.wake()
+        self.sub.dispose()
+
+
+class MeshMixin:
+    def create_mesh_node(
+        self,
+        group="default",
+        discovery=None,
+        address="tcp://0.0.0.0:*",
+        options=None,
+        interval=1.0,
+        timeout=None,
+        topics="",
+    ):
+        """Joins a brokerless notifications mesh, see `MeshNode`
+
+        Args:
+            group (str): only nodes of the same group are connected
+            discovery: discovery backend, `UDPDiscovery()` if None
+            address (str): address of the PUB socket, a random port with `*`
+            options (dict): zmq socket options
+            interval (float): seconds between beacons
+            timeout (float): seconds without beacon before a peer is evicted
+            topics (str): SUB filter, None to only receive the topics of the
+                handlers registered with `node.on`
+
+        Returns:
+            MeshNode
+        """
+        node = MeshNode(
+            self,
+            group=group,
+            discovery=discovery,
+            address=address,
+            options=options,
+            interval=interval,
+            timeout=timeout,
+            topics=topics,
+        )
+        self.disposables.append(node)
+        return node
@@ -1,22 +1,355 @@
+import struct
+import threading
+import time
+import traceback
+from collections import deque
+
 import zmq
-from rx import operators as ops
+from rx.disposable import Disposable
+from rx.subject import Subject
 
 from agents.message import Message
+from agents.utils import PrefixTrie, random_uuid
+
+
+class SteerableProxy:
+    """`zmq.proxy_steerable` device running in a dedicated thread
+
+    Messages are forwarded by libzmq without entering the interpreter. The proxy is
+    steered through a control socket (`terminate`, `statistics`) and may publish a
+    copy of all traffic on a capture socket whose messages and bytes are counted in
+    `captured`. PAUSE/RESUME are not exposed, libzmq 4.3.5 keeps forwarding while
+    paused.
+
+    Args:
+        agent: agent owning the zmq context and the proxy thread
+        frontend (tuple): (socket_type, address) bound for incoming traffic
+        backend (tuple): (socket_type, address) bound for outgoing traffic
+        options (dict): zmq socket options of the frontend and backend sockets
+        capture (bool): capture traffic into `capture` (SUB connection)
+    """
+
+    STATISTICS = (
+        "frontend_messages_received",
+        "frontend_bytes_received",
+        "frontend_messages_sent",
+        "frontend_bytes_sent",
+        "backend_messages_received",
+        "backend_bytes_received",
+        "backend_messages_sent",
+        "backend_bytes_sent",
+    )
+
+    def __init__(self, agent, frontend, backend, options=None, capture=False):
+        self.agent = agent
+        self.log = agent.log
+        self.frontend = frontend
+        self.backend = backend
+        self.options = options or {}
+        self.captured = {"messages": 0, "bytes": 0}
+        self.capture = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._error = None
+        self._terminated = False
+
+        uid = random_uuid()
+        self.control_address = f"inproc://proxy-control-{uid}"
+        self.capture_address = f"inproc://proxy-capture-{uid}" if capture else None
+        self._control = agent.zmq_context.socket(zmq.PAIR)
+        self._control.bind(self.control_address)
+
+        agent.run_process_in_thread(self.run)
+        self._ready.wait()
+        if self._error:
+            raise self._error
+
+        if capture:
+            self.capture = agent.connect_socket(
+                zmq.SUB, {zmq.SUBSCRIBE: b""}, self.capture_address
+            )
+            agent.disposables.append(self.capture.observable.subscribe(self._count))
+
+    def _count(self, xs):
+        self.captured["messages"] += 1
+        self.captured["bytes"] += sum(len(x) for x in xs)
+
+    def run(self, exit_event):
+        context = self.agent.zmq_context
+        sockets = []
+        try:
+            for socket_type, address in (self.frontend, self.backend):
+                socket = context.socket(socket_type)
+                sockets.append(socket)
+                self.agent._set_socket_options(socket, self.options)
+                socket.bind(address)
+            capture = None
+            if self.capture_address:
+                capture = context.socket(zmq.PUB)
+                sockets.append(capture)
+                capture.bind(self.capture_address)
+            control = context.socket(zmq.PAIR)
+            sockets.append(control)
+            control.connect(self.control_address)
+        except zmq.ZMQError as e:
+            self._error = e
+            return
+        finally:
+            self._ready.set()
+
+        self.log.info(f"Starting steerable proxy {self.frontend} -> {self.backend} ...")
+        try:
+            zmq.proxy_steerable(sockets[0], sockets[1], capture, control)
+        except zmq.ContextTerminated:
+            pass
+        finally:
+            for socket in sockets:
+                socket.close(linger=0)
+        self.log.info("Steerable proxy terminated ...")
+
+    def _command(self, command):
+        with self._lock:
+            if self._terminated:
+                raise RuntimeError("proxy is terminated")
+            self._control.send(command)
+            if command == b"STATISTICS":
+                return self._control.recv_multipart()
+            if command == b"TERMINATE":
+                self._terminated = True
+                self._control.close(linger=0)
+
+    def terminate(self):
+        self._command(b"TERMINATE")
+
+    def statistics(self):
+        """Message and byte counters of the frontend and backend sockets"""
+        xs = self._command(b"STATISTICS")
+        return {k: struct.unpack("=Q", x)[0] for k, x in zip(self.STATISTICS, xs)}
+
+    def dispose(self):
+        if not self._terminated:
+            self.terminate()
+
+
+class CoalescingPublisher:
+    """PUB connection coalescing notifications of the same topic into batches
+
+    Notifications are buffered per topic and sent as one `Message.Batch` when a
+    topic buffers `max_messages` notifications or `max_bytes` bytes, or when its
+    oldest notification has waited `linger` seconds. Subscribers unpack batches
+    into individual notifications. The order of notifications is kept per topic,
+    not across topics. Batches which fail to send (eg. `queue.Full` from the send
+    queue of the connection) are logged and counted in `drops`.
+
+    Args:
+        agent: agent owning the connection and the linger thread
+        connection: PUB connection (see `Agent.connect_socket`)
+        max_messages (int): notifications per batch
+        max_bytes (int): encoded notification bytes per batch
+        linger (float): seconds a notification may wait for a batch
+    """
+
+    def __init__(
+        self, agent, connection, max_messages=100, max_bytes=65536, linger=0.005
+    ):
+        self.log = agent.log
+        self.connection = connection
+        self.socket = connection.socket
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.linger = linger
+        self.batches = 0
+        self.messages = 0
+        self.drops = 0
+        # topic -> [deadline, size, envelopes]
+        self._buffers = {}
+        self._condition = threading.Condition()
+        # flushed batches, sent in order without holding the condition
+        self._outbox = deque()
+        self._send_lock = threading.Lock()
+        self._stopped = False
+        agent.run_process_in_thread(self._run)
+
+    def send(self, x):
+        """Queues a notification, either a `Message.Notification` or its multipart"""
+        if isinstance(x, Message.Notification):
+            x = x.to_multipart()
+        elif len(x) == 3:
+            x = Message.Notification.from_multipart(x).to_multipart()
+        topic, envelope = x
+        with self._condition:
+            if self._stopped:
+                self._outbox.append(x)
+            else:
+                buffer = self._buffers.get(topic)
+                if buffer is None:
+                    buffer = [time.monotonic() + self.linger, 0, []]
+                    self._buffers[topic] = buffer
+                    self._condition.notify()
+                buffer[1] += len(envelope)
+                buffer[2].append(envelope)
+                if len(buffer[2]) < self.max_messages and buffer[1] < self.max_bytes:
+                    return
+                self._flush(topic)
+        self._drain()
+
+    def flush(self):
+        """Sends all buffered notifications"""
+        with self._condition:
+            for topic in list(self._buffers):
+                self._flush(topic)
+        self._drain()
+
+    def _flush(self, topic):
+        # moves the buffer of topic to the outbox, with the condition held
+        _, _, envelopes = self._buffers.pop(topic)
+        self.messages += len(envelopes)
+        if len(envelopes) == 1:
+            self._outbox.append([topic, envelopes[0]])
+        else:
+            self.batches += 1
+            self._outbox.append([topic, Message.Batch.pack(envelopes)])
+
+    def _drain(self):
+        # a slow send (eg. a full send queue) only holds the threads sending
+        with self._send_lock:
+            while self._outbox:
+                x = self._outbox.popleft()
+                try:
+                    self.connection.send(x)
+                except Exception:
+                    self.drops += 1
+                    self.log.error(
+                        f"Dropping notifications of {x[0]} ...\n\n{traceback.format_exc()}"
+                    )
+
+    def _run(self, exit_event):
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                if not self._buffers:
+                    self._condition.wait()
+                    continue
+                now = time.monotonic()
+                deadline = min(x[0] for x in self._buffers.values())
+                if deadline > now:
+                    self._condition.wait(deadline - now)
+                    continue
+                for topic, x in list(self._buffers.items()):
+                    if x[0] <= now:
+                        self._flush(topic)
+            self._drain()
+
+    def dispose(self):
+        with self._condition:
+            if not self._stopped:
+                self._stopped = True
+                for topic in list(self._buffers):
+                    self._flush(topic)
+                self._condition.notify()
+        self._drain()
+
+
+class NotificationSubscriber:
+    """SUB connection decoding every notification once and dispatching it to the
+    handlers registered for a prefix of its topic
+
+    Decoded notifications are emitted on `observable`. Handlers run in the socket
+    thread, the SUB filters they need are added and removed in that thread too.
+
+    Args:
+        agent: agent owning the connection
+        connection: SUB connection (see `Agent.connect_socket`)
+    """
+
+    def __init__(self, agent, connection):
+        self.log = agent.log
+        self.connection = connection
+        self.socket = connection.socket
+        self.observable = Subject()
+        self.handlers = PrefixTrie()
+        self._disposable = connection.observable.subscribe(self._dispatch)
+
+    def _dispatch(self, xs):
+        try:
+            if Message.Batch.is_batch(xs):
+                notifications = Message.Batch.from_multipart(xs).notifications
+            else:
+                notifications = [Message.Notification.from_multipart(xs)]
+        except Exception:
+            self.log.error(
+                f"Failed to decode notification ...\n\n{traceback.format_exc()}"
+            )
+            return
+        # batches share their topic
+        handlers = self.handlers.match(notifications[0].topic) if notifications else []
+        for notification in notifications:
+            self.observable.on_next(notification)
+            for handler in handlers:
+                try:
+                    handler(notification)
+                except Exception:
+                    self.log.error(
+                        f"Notification handler failed ...\n\n{traceback.format_exc()}"
+                    )
+
+    def subscribe(self, topic):
+        """Adds a SUB filter for topic"""
+        self.connection.call(lambda socket: socket.subscribe(topic))
+
+    def unsubscribe(self, topic):
+        """Removes a SUB filter for topic"""
+        self.connection.call(lambda socket: socket.unsubscribe(topic))
+
+    def on(self, topic_prefix, handler):
+        """Calls handler with every notification whose topic starts with topic_prefix
+
+        Returns:
+            disposable removing the handler, and its SUB filter if it was the last
+            handler of topic_prefix
+        """
+        if self.handlers.add(topic_prefix, handler):
+            self.subscribe(topic_prefix)
+
+        def remove():
+            if self.handlers.remove(topic_prefix, handler):
+                self.unsubscribe(topic_prefix)
+
+        return Disposable(remove)
+
+    def dispose(self):
+        self._disposable.dispose()
 
 
 class NotificationsMixin:
-    def create_notification_broker(self, pub_address, sub_address, options=None):
+    def create_notification_broker(
+        self, pub_address, sub_address, options=None, steerable=False, capture=False
+    ):
         """Starts a pub-sub notifications broker
 
         Args:
             pub_address (str): agents publish to this address to notify other agents
             sub_address (str): agents listen on this address for notifications
+            steerable (bool): forward in a `zmq.proxy_steerable` thread instead of
+                through the agent's socket threads
+            capture (bool): capture forwarded traffic (steerable only)
 
         Returns:
-            connections (pub, sub)
+            connections (pub, sub), or SteerableProxy if steerable
         """
         if options is None:
             options = {}
+        if steerable:
+            proxy = SteerableProxy(
+                self,
+                (zmq.XSUB, pub_address),
+                (zmq.XPUB, sub_address),
+                options=options,
+                capture=capture,
+            )
+            self.disposables.append(proxy)
+            return proxy
         xpub = self.bind_socket(zmq.XPUB, options, sub_address)
         xsub = self.bind_socket(zmq.XSUB, options, pub_address)
         self.disposables.append(xsub.observable.subscribe(lambda x: xpub.send(x)))
@@ -24,26 +357,44 @@ class NotificationsMixin:
         return xsub, xpub
 
     def create_notification_client(
-        self, pub_address, sub_address, options=None, topics=""
+        self,
+        pub_address,
+        sub_address,
+        options=None,
+        topics="",
+        coalesce=False,
+        max_messages=100,
+        max_bytes=65536,
+        linger=0.005,
     ):
         """Creates 2 connections (pub, sub) to a notifications broker
 
         Args:
             pub_address (str): publish to this address to notify other agents
             sub_address (str): listen on this address for notifications
+            topics (str): SUB filter, None to only receive the topics of the
+                handlers registered with `sub.on`
+            coalesce (bool): batch published notifications per topic, see
+                `CoalescingPublisher` for max_messages, max_bytes and linger
 
         Returns:
-            connections (pub, sub)
+            connection or CoalescingPublisher pub, NotificationSubscriber sub
         """
         if options is None:
             options = {}
         pub = self.connect_socket(zmq.PUB, options, pub_address)
+        if coalesce:
+            pub = CoalescingPublisher(
+                self,
+                pub,
+                max_messages=max_messages,
+                max_bytes=max_bytes,
+                linger=linger,
+            )
+            self.disposables.append(pub)
         sub = self.connect_socket(zmq.SUB, options, sub_address)
-        sub.socket.subscribe(topics)
-        return pub, sub.update(
-            {
-                "observable": sub.observable.pipe(
-                    ops.map(Message.Notification.from_multipart)
-                )
-            }
-        )
+        sub = NotificationSubscriber(self, sub)
+        if topics is not None:
+            sub.subscribe(topics)
+        self.disposables.append(sub)
+        return pub, sub
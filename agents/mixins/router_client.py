@@ -1,14 +1,173 @@
+import threading
+from contextlib import suppress
+
 import zmq
 from rx import operators as ops
+from rx.subject import Subject
 
 from agents.message import Message
+from agents.utils import Waker, random_uuid
+
+
+class RouterEngine:
+    """ROUTER sockets forwarding client messages in dedicated threads
+
+    Every address is bound by a shard owning a ROUTER socket and a thread. Messages
+    `[source, dest, *frames]` are drained in batches of up to `recv_budget`, their
+    first two frames are swapped in place and they are sent to `dest`, through the
+    shard `dest` last sent from. Sockets are `ROUTER_MANDATORY`, messages which
+    cannot be delivered are emitted on `undeliverable` as `(message, error)`.
+
+    Args:
+        agent: agent owning the zmq context and the shard threads
+        addresses (list[str]): one address per shard
+        options (dict): zmq socket options of the ROUTER sockets
+        recv_budget (int): max messages read from a socket per poll cycle
+        on_undeliverable (callable): subscribed to `undeliverable`
+    """
+
+    def __init__(
+        self, agent, addresses, options=None, recv_budget=100, on_undeliverable=None
+    ):
+        self.agent = agent
+        self.log = agent.log
+        self.addresses = addresses
+        self.options = options or {}
+        self.recv_budget = recv_budget
+        self.undeliverable = Subject()
+        self.clients = {}
+        self.stats = [
+            {"routed": 0, "forwarded": 0, "undeliverable": 0} for _ in addresses
+        ]
+        self._inboxes = [f"inproc://router-{random_uuid()}" for _ in addresses]
+        self._wakers = [Waker() for _ in addresses]
+        self._stopped = False
+        self._ready = threading.Barrier(len(addresses) + 1)
+        self._errors = []
+
+        if on_undeliverable:
+            self.undeliverable.subscribe(on_undeliverable)
+
+        for i in range(len(addresses)):
+            agent.run_process_in_thread(lambda exit_event, i=i: self.run(i))
+        self._ready.wait()
+        if self._errors:
+            self.dispose()
+            raise self._errors[0]
+
+    def run(self, index):
+        context = self.agent.zmq_context
+        waker = self._wakers[index]
+        try:
+            router = context.socket(zmq.ROUTER)
+            self.agent._set_socket_options(router, self.options)
+            router.setsockopt(zmq.ROUTER_MANDATORY, 1)
+            router.bind(self.addresses[index])
+            inbox = context.socket(zmq.PULL)
+            inbox.bind(self._inboxes[index])
+        except zmq.ZMQError as e:
+            self._errors.append(e)
+            self._ready.wait()
+            return
+
+        # all inboxes are bound once every shard is ready
+        self._ready.wait()
+        outboxes = {}
+        for i, address in enumerate(self._inboxes):
+            if i != index:
+                outboxes[i] = context.socket(zmq.PUSH)
+                outboxes[i].connect(address)
+
+        poller = zmq.Poller()
+        poller.register(router, zmq.POLLIN)
+        poller.register(inbox, zmq.POLLIN)
+        poller.register(waker.socket, zmq.POLLIN)
+        stats = self.stats[index]
+        clients = self.clients
+
+        self.log.info(f"Starting router shard {index} on {self.addresses[index]} ...")
+        try:
+            while not self._stopped:
+                events = dict(poller.poll())
+                if router in events:
+                    with suppress(zmq.Again):
+                        for _ in range(self.recv_budget):
+                            x = router.recv_multipart(zmq.NOBLOCK)
+                            if len(x) < 2:
+                                continue
+                            clients[x[0]] = index
+                            x[0], x[1] = x[1], x[0]
+                            shard = clients.get(x[0], index)
+                            if shard == index:
+                                self._send(router, x, stats)
+                            else:
+                                outboxes[shard].send_multipart(x)
+                                stats["forwarded"] += 1
+                if inbox in events:
+                    with suppress(zmq.Again):
+                        for _ in range(self.recv_budget):
+                            self._send(router, inbox.recv_multipart(zmq.NOBLOCK), stats)
+        finally:
+            for socket in [router, inbox, *outboxes.values()]:
+                socket.close(linger=0)
+            waker.close()
+        self.log.info(f"Router shard {index} stopped ...")
+
+    def _send(self, router, x, stats):
+        try:
+            router.send_multipart(x, zmq.NOBLOCK)
+            stats["routed"] += 1
+        except zmq.ZMQError as e:
+            # EHOSTUNREACH for unknown identities, EAGAIN if the client is full
+            if e.errno not in (zmq.EHOSTUNREACH, zmq.EAGAIN):
+                raise
+            stats["undeliverable"] += 1
+            self.undeliverable.on_next((x, e))
+
+    def dispose(self):
+        if not self._stopped:
+            self._stopped = True
+            for waker in self._wakers:
+                waker.wake()
 
 
 class RouterClientMixin:
-    def create_router(self, address, options=None):
+    def create_router(
+        self,
+        address,
+        options=None,
+        engine=False,
+        recv_budget=100,
+        on_undeliverable=None,
+    ):
+        """Starts a router forwarding `[dest, *frames]` from a client to client `dest`
+
+        Args:
+            address (str | list[str]): router address, or one address per shard
+            options (dict): zmq socket options
+            engine (bool): route in dedicated threads (RouterEngine) instead of
+                through the agent's socket threads, implied by several addresses
+            recv_budget (int): max messages read from a socket per poll cycle
+            on_undeliverable (callable): called with `(message, error)` for messages
+                to unknown or unreachable clients (engine only)
+
+        Returns:
+            connection, or RouterEngine if engine
+        """
         if options is None:
             options = {}
-        router = self.bind_socket(zmq.ROUTER, options, address)
+        if engine or not isinstance(address, str):
+            router = RouterEngine(
+                self,
+                [address] if isinstance(address, str) else list(address),
+                options=options,
+                recv_budget=recv_budget,
+                on_undeliverable=on_undeliverable,
+            )
+            self.disposables.append(router)
+            return router
+
+        router = self.bind_socket(zmq.ROUTER, options, address, recv_budget=recv_budget)
 
         def route(x):
             source, dest = x[0:2]
@@ -21,12 +180,6 @@ class RouterClientMixin:
         if options is None:
             options = {}
         if zmq.IDENTITY not in options:
-            options[zmq.IDENTITY] = self.name.encode("utf-8")
+            options[zmq.IDENTITY] = self.uid.encode("utf-8")
         dealer = self.connect_socket(zmq.DEALER, options, address)
-        return dealer.update(
-            {
-                "observable": dealer.observable.pipe(
-                    ops.map(Message.Client.from_multipart)
-                )
-            }
-        )
+        return dealer.pipe(ops.map(Message.Client.from_multipart))
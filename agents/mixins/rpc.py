@@ -0,0 +1,288 @@
+import asyncio
+import heapq
+import itertools
+import struct
+import threading
+import time
+import traceback
+from concurrent.futures import Future, InvalidStateError
+from contextlib import suppress
+
+import zmq
+
+from agents.messaging.messages import get_serializer
+
+# request:  [call id, method, payload]
+# response: [call id, status, payload]
+_CALL_ID = struct.Struct("!Q")
+OK = b"\x00"
+ERROR = b"\x01"
+
+
+class RPCError(Exception):
+    """Error raised by a remote endpoint, or by the RPC layer itself"""
+
+    def __init__(self, message, remote_type=None):
+        super().__init__(message)
+        self.remote_type = remote_type
+
+
+class RPCTimeout(RPCError, TimeoutError):
+    """No response received within the timeout of a call"""
+
+
+def _encode(serializer, data):
+    x = serializer(data=data).serialize()
+    return x.encode() if isinstance(x, str) else x
+
+
+class RPCServer:
+    """Endpoints called by RPCClients over a ROUTER socket
+
+    Requests are handled in the socket thread, in the order they are received. Slow
+    endpoints should return a `concurrent.futures.Future` (eg. from an executor),
+    the response is sent when it completes without holding the socket thread.
+
+    Args:
+        agent: agent owning the ROUTER socket
+        address (str): address to bind
+        options (dict): zmq socket options
+        serializer: serializer of arguments and results (see `get_serializer`)
+    """
+
+    def __init__(self, agent, address, options=None, serializer=None):
+        self.log = agent.log
+        self.serializer = get_serializer(serializer)
+        self.endpoints = {}
+        self.router = agent.bind_socket(zmq.ROUTER, options or {}, address)
+        self._disposable = self.router.observable.subscribe(self._handle)
+
+    def register(self, name, f=None):
+        """Registers f as endpoint name, or returns a decorator if f is None"""
+        if f is None:
+            return lambda f: self.register(name, f)
+        self.endpoints[name] = f
+        return f
+
+    def _handle(self, xs):
+        if len(xs) != 4:
+            return self.log.error(f"Dropping malformed RPC request {xs} ...")
+        identity, call_id, method, payload = xs
+        try:
+            f = self.endpoints[method.decode()]
+        except (KeyError, ValueError):
+            # ValueError: method names which are not valid UTF-8
+            return self._error(identity, call_id, RPCError(f"unknown method {method}"))
+        try:
+            args, kwargs = self.serializer.deserialize(payload)
+            result = f(*args, **kwargs)
+        except Exception as e:
+            self.log.error(f"RPC endpoint failed ...\n\n{traceback.format_exc()}")
+            return self._error(identity, call_id, e)
+        if isinstance(result, Future):
+            result.add_done_callback(
+                lambda future: self._reply_future(identity, call_id, future)
+            )
+        else:
+            self._reply(identity, call_id, result)
+
+    def _reply_future(self, identity, call_id, future):
+        if future.cancelled():
+            return self._error(identity, call_id, RPCError("call cancelled"))
+        e = future.exception()
+        if e is not None:
+            return self._error(identity, call_id, e)
+        self._reply(identity, call_id, future.result())
+
+    def _reply(self, identity, call_id, result):
+        try:
+            payload = _encode(self.serializer, result)
+        except Exception as e:
+            return self._error(identity, call_id, e)
+        self.router.send([identity, call_id, OK, payload])
+
+    def _error(self, identity, call_id, e):
+        payload = _encode(self.serializer, [type(e).__name__, str(e)])
+        self.router.send([identity, call_id, ERROR, payload])
+
+    def dispose(self):
+        self._disposable.dispose()
+
+
+class RPCClient:
+    """Calls endpoints of an RPCServer, pipelining requests over one DEALER socket
+
+    Every call returns a `concurrent.futures.Future` immediately, matched to its
+    response by a call id, so that any number of calls may be outstanding without
+    blocking a thread each. At most `max_in_flight` calls are outstanding, further
+    calls block until one completes. Calls without a response after their timeout
+    fail with RPCTimeout, deadlines are kept in a heap checked by a reaper thread.
+    Deadlines of completed calls are skipped when popped, and compacted away when
+    they outnumber the pending calls.
+    Responses are handled in the socket thread, so do not block on a Future there.
+
+    Args:
+        agent: agent owning the DEALER socket and the reaper thread
+        address (str): address of the RPCServer
+        options (dict): zmq socket options
+        serializer: serializer of arguments and results (see `get_serializer`)
+        timeout (float): default timeout of calls in seconds, None for no timeout
+        max_in_flight (int): maximum number of outstanding calls
+    """
+
+    def __init__(
+        self,
+        agent,
+        address,
+        options=None,
+        serializer=None,
+        timeout=None,
+        max_in_flight=1000,
+    ):
+        self.log = agent.log
+        self.serializer = get_serializer(serializer)
+        self.timeout = timeout
+        self.pending = {}
+        self._ids = itertools.count()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._deadlines = []
+        self._condition = threading.Condition()
+        self._stopped = False
+        self.dealer = agent.connect_socket(zmq.DEALER, options or {}, address)
+        self._disposable = self.dealer.observable.subscribe(self._handle)
+        agent.run_process_in_thread(self._reap)
+
+    @property
+    def in_flight(self):
+        return len(self.pending)
+
+    def request(self, method, args=(), kwargs=None, timeout=None):
+        """Sends a call of method, returns the Future of its result
+
+        Args:
+            method (str): endpoint name
+            args (tuple): positional arguments
+            kwargs (dict): keyword arguments
+            timeout (float): seconds until the call fails with RPCTimeout, the
+                client timeout if None
+        """
+        timeout = self.timeout if timeout is None else timeout
+        payload = _encode(self.serializer, [list(args), kwargs or {}])
+        if not self._slots.acquire(timeout=timeout):
+            raise RPCTimeout(f"{self.in_flight} calls in flight")
+        call_id = _CALL_ID.pack(next(self._ids))
+        future = Future()
+        self.pending[call_id] = future
+        future.add_done_callback(lambda _: self._release(call_id))
+        if timeout is not None:
+            with self._condition:
+                heapq.heappush(self._deadlines, (time.monotonic() + timeout, call_id))
+                if len(self._deadlines) > 2 * len(self.pending) + 64:
+                    pending = self.pending
+                    self._deadlines = [x for x in self._deadlines if x[1] in pending]
+                    heapq.heapify(self._deadlines)
+                self._condition.notify()
+        self.dealer.send([call_id, method.encode(), payload])
+        return future
+
+    def call(self, method, *args, **kwargs):
+        """Future of method(*args, **kwargs), with the client timeout"""
+        return self.request(method, args, kwargs)
+
+    def call_async(self, method, *args, **kwargs):
+        """asyncio Future of method(*args, **kwargs), in the running event loop"""
+        return asyncio.wrap_future(self.request(method, args, kwargs))
+
+    def _release(self, call_id):
+        if self.pending.pop(call_id, None) is not None:
+            self._slots.release()
+
+    def _handle(self, xs):
+        if len(xs) != 3:
+            return self.log.error(f"Dropping malformed RPC response {xs} ...")
+        call_id, status, payload = xs
+        future = self.pending.get(call_id)
+        if future is None or future.done():
+            return  # unknown, duplicate, timed out or cancelled
+        try:
+            result = self.serializer.deserialize(payload)
+            if status == OK:
+                future.set_result(result)
+            else:
+                remote_type, message = result
+                future.set_exception(RPCError(message, remote_type=remote_type))
+        except InvalidStateError:
+            pass  # timed out or cancelled meanwhile
+        except Exception as e:
+            with suppress(InvalidStateError):
+                future.set_exception(e)
+
+    def _reap(self, exit_event):
+        with self._condition:
+            while not self._stopped:
+                if not self._deadlines:
+                    self._condition.wait()
+                    continue
+                deadline, call_id = self._deadlines[0]
+                timeout = deadline - time.monotonic()
+                if timeout > 0:
+                    self._condition.wait(timeout)
+                    continue
+                heapq.heappop(self._deadlines)
+                future = self.pending.get(call_id)
+                if future is not None:
+                    try:
+                        future.set_exception(RPCTimeout("no response"))
+                    except InvalidStateError:
+                        pass
+
+    def dispose(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._disposable.dispose()
+        for future in list(self.pending.values()):
+            future.cancel()
+
+
+class RPCMixin:
+    def create_rpc_server(self, address, options=None, serializer=None):
+        """Binds an RPCServer, register endpoints with `server.register`
+
+        Args:
+            address (str): address to bind
+            options (dict): zmq socket options
+            serializer: serializer of arguments and results, JSONMessage if None
+
+        Returns:
+            RPCServer
+        """
+        server = RPCServer(self, address, options=options, serializer=serializer)
+        self.disposables.append(server)
+        return server
+
+    def create_rpc_client(
+        self, address, options=None, serializer=None, timeout=None, max_in_flight=1000
+    ):
+        """Connects an RPCClient to an RPCServer
+
+        Args:
+            address (str): address of the RPCServer
+            options (dict): zmq socket options
+            serializer: serializer of arguments and results, JSONMessage if None
+            timeout (float): default timeout of calls in seconds
+            max_in_flight (int): maximum number of outstanding calls
+
+        Returns:
+            RPCClient
+        """
+        client = RPCClient(
+            self,
+            address,
+            options=options,
+            serializer=serializer,
+            timeout=timeout,
+            max_in_flight=max_in_flight,
+        )
+        self.disposables.append(client)
+        return client
@@ -5,7 +5,6 @@ from contextlib import suppress
 
 from aiohttp import WSCloseCode, WSMsgType, web
 from rx import operators as ops
-from rxpipes import observable_to_async_queue
 
 from agents.message import Message
 from agents.utils import RxTxSubject
@@ -20,10 +19,6 @@ class WebserverMixin:
         if self.web_application:
             self.log.info("Starting webserver ...")
 
-            async def _until_exit():
-                while not self.exit_event.is_set():
-                    await asyncio.sleep(1)
-
             def _run_server_thread():
                 try:
                     loop = asyncio.new_event_loop()
@@ -37,11 +32,11 @@ class WebserverMixin:
                         self.web_application["port"],
                     )
                     loop.run_until_complete(site.start())
-                    loop.run_until_complete(_until_exit())
+                    loop.run_until_complete(self.exit_future(loop))
                 finally:
                     loop.close()
 
-            t = threading.Thread(target=_run_server_thread)
+            t = threading.Thread(target=_run_server_thread, daemon=True)
             self.threads.append(t)
             t.start()
 
@@ -91,6 +86,7 @@ class WebserverMixin:
             close_reason = (WSCloseCode.OK, "Closed OK")
 
             async def rtx_loop():
+                from rxpipes import observable_to_async_queue
 
                 tx_queue, tx_disposable = observable_to_async_queue(
                     rtx._tx.pipe(
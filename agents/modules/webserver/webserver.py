@@ -18,10 +18,14 @@ class WebServerModule(AgentModule):
 
     Args:
         app: AIOHTTP web application. Creates new web application if None
-        event_loop: asyncio event loop. Creates new loop if None
+        event_loop: asyncio event loop. Uses the agent's loop (AsyncAgent) or
+            creates new loop if None
         routes: eg. [('GET', '/index.html', get_index), ...]
     """
 
+    # ready once the site is listening
+    ready_on_setup = False
+
     def __init__(
         self,
         host: str = "127.0.0.1",
@@ -35,13 +39,34 @@ class WebServerModule(AgentModule):
         self.host = host
         self.port = port
         self.app = app or web.Application()
-        self.event_loop = event_loop or asyncio.new_event_loop()
+        self.event_loop = (
+            event_loop
+            or getattr(self.agent, "event_loop", None)
+            or asyncio.new_event_loop()
+        )
         self.routes = routes or []
 
         # add routes
         self.app.add_routes([getattr(web, m.lower())(r, h) for m, r, h in self.routes])
 
     def setup(self):
+        async def run(exit_event):
+            # start web
+            _runner = web.AppRunner(self.app)
+            try:
+                await _runner.setup()
+                await web.TCPSite(_runner, self.host, self.port).start()
+            except Exception as e:
+                self.set_ready(e)
+                raise
+            self.set_ready()
+
+            # wait till exit
+            await self.agent.exit_future()
+
+            # cleanup
+            await _runner.cleanup()
+
         def _process(exit_event):
 
             self.log.info(f"Starting web server on {self.host}:{self.port} ...")
@@ -49,26 +74,19 @@ class WebServerModule(AgentModule):
             # Set event_loop as a current event loop for this current thread
             asyncio.set_event_loop(self.event_loop)
 
-            async def run(exit_event):
-                # start web
-                _runner = web.AppRunner(self.app)
-                await _runner.setup()
-                await web.TCPSite(_runner, self.host, self.port).start()
-
-                # wait till exit
-                while not exit_event.is_set():
-                    await asyncio.sleep(1)
-
-                # cleanup
-                await _runner.cleanup()
-
             try:
                 self.event_loop.run_until_complete(run(exit_event))
             finally:
                 self.event_loop.close()
 
-        # run socket server
-        self.agent.run_process_in_thread(_process)
+        # share the agent's event loop, or run socket server in its own thread
+        if self.event_loop is getattr(self.agent, "event_loop", None):
+            self.log.info(f"Starting web server on {self.host}:{self.port} ...")
+            asyncio.run_coroutine_threadsafe(
+                run(self.agent.exit_event), self.event_loop
+            )
+        else:
+            self.agent.run_process_in_thread(_process)
 
     def shutdown(self):
         pass
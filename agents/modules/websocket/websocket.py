@@ -1,30 +1,51 @@
 __all__ = ["WebSocketModule"]
 
-from typing import Optional
+from typing import Type, Union
 
 from aiohttp import web
 
 from agents.messaging.connections import WebsocketConnection
 from agents.messaging.defs import BaseMessage
-from agents.messaging.messages import JSONMessage
+from agents.messaging.messages import PickleMessage, get_serializer
 from agents.messaging.pools import AsyncConnectionPool
 from agents.modules.webserver import WebServerModule
+from agents.utils import Compressor
 
 
 class WebSocketModule(WebServerModule):
-    """Websocket Agent Module"""
+    """Websocket Agent Module
+
+    Args:
+        serializer: BaseMessage class or its name in SERIALIZERS ("json",
+            "fastjson", "msgpack"), binary serializers use binary frames, pickle
+            is refused as clients are not trusted (unpickling runs arbitrary code)
+        websocket_route: route of the websocket endpoint
+        compression: codec name or Compressor compressing the messages of all
+            connections (see `Compressor`), clients must decompress them too
+    """
 
     def __init__(
         self,
-        serializer: Optional[BaseMessage] = None,
+        serializer: Union[str, Type[BaseMessage], None] = None,
         websocket_route: str = "/ws",
+        compression: Union[str, Compressor, None] = None,
         **kwargs,
     ):
+        serializer = get_serializer(serializer)
+        if issubclass(serializer, PickleMessage):
+            raise ValueError(
+                "pickle must not deserialize messages of websocket clients"
+            )
         super().__init__(**kwargs)
 
-        self.pool = AsyncConnectionPool(agent=self.agent, event_loop=self.event_loop)
-        self.serializer = serializer or JSONMessage
+        self.pool = AsyncConnectionPool(
+            agent=self.agent, event_loop=self.event_loop, serializer=serializer
+        )
+        self.serializer = self.pool.serializer
         self.websocket_route = websocket_route
+        self.compressor = (
+            Compressor(compression) if isinstance(compression, str) else compression
+        )
 
         # register websocket_route
         self.app.add_routes([web.get(self.websocket_route, self.websocket_handler)])
@@ -38,7 +59,11 @@ class WebSocketModule(WebServerModule):
         socket = web.WebSocketResponse()
         await socket.prepare(request)
         connection = WebsocketConnection(
-            socket=socket, serializer=self.serializer, uid=id(socket), timeout=0.005
+            socket=socket,
+            serializer=self.serializer,
+            uid=id(socket),
+            timeout=0.005,
+            compressor=self.compressor,
         )
         self.pool.add(connection)
 
@@ -6,8 +6,6 @@ from collections.abc import MutableMapping
 from pathlib import Path
 from signal import SIGINT, SIGTERM, signal
 
-import h5py
-
 from .utils import delete_directory
 
 
@@ -195,6 +193,8 @@ class HDF5Store(MutableMapping):
     """
 
     def __init__(self, storage_path):
+        import h5py
+
         # create storage_path parent directory
         self.storage_path = storage_path
         Path(storage_path).parent.mkdir(exist_ok=True, parents=True)
@@ -241,6 +241,8 @@ class HDF5Store(MutableMapping):
             self.ledger[k] = v
 
     def getr(self, k):
+        import h5py
+
         if isinstance(self.ledger[k], h5py.Dataset):
             return self.ledger[k]
         elif isinstance(self.ledger[k], h5py.Group):
@@ -1 +1,2 @@
+from .compression import *
 from .utils import *
@@ -0,0 +1,205 @@
+__all__ = [
+    "Codec",
+    "ZlibCodec",
+    "LzmaCodec",
+    "register_codec",
+    "get_codec",
+    "Compressor",
+]
+
+import lzma
+import threading
+import zlib
+from collections import deque
+from typing import Union
+
+##############################################################################
+## Codecs
+##############################################################################
+
+
+class Codec:
+    """Compression algorithm, identified on the wire by `id` (1-127)"""
+
+    id = 0
+    name = ""
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError("Codec/compress")
+
+    def decompress(self, data) -> bytes:
+        raise NotImplementedError("Codec/decompress")
+
+
+class ZlibCodec(Codec):
+
+    id = 1
+    name = "zlib"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data) -> bytes:
+        return zlib.decompress(data)
+
+
+class LzmaCodec(Codec):
+
+    id = 2
+    name = "lzma"
+
+    def __init__(self, preset: int = 1):
+        self.preset = preset
+
+    def compress(self, data: bytes) -> bytes:
+        return lzma.compress(data, format=lzma.FORMAT_XZ, preset=self.preset)
+
+    def decompress(self, data) -> bytes:
+        return lzma.decompress(data, format=lzma.FORMAT_XZ)
+
+
+_codecs = {}
+
+
+def register_codec(codec: Codec) -> None:
+    """Registers a codec instance used to decompress data flagged with its id"""
+    if not 0 < codec.id < 0x80:
+        raise ValueError("codec id must be in range [1, 128)")
+    _codecs[codec.id] = codec
+    _codecs[codec.name] = codec
+
+
+def get_codec(codec: Union[str, int, Codec]) -> Codec:
+    if isinstance(codec, Codec):
+        return codec
+    try:
+        return _codecs[codec]
+    except KeyError:
+        raise ValueError(f"unknown codec {codec}") from None
+
+
+register_codec(ZlibCodec())
+register_codec(LzmaCodec())
+
+##############################################################################
+## Compressor
+##############################################################################
+
+# flag byte prefixed to compressed frames: codec id (0 if not compressed)
+# and whether the frame was text before compression
+FLAG_TEXT = 0x80
+CODEC_MASK = 0x7F
+
+
+class Compressor:
+    """Compresses frames above a size threshold, and stops compressing when the
+    measured compression ratio is poor
+
+    Frames are prefixed with a flag byte holding the id of the codec, 0 if the
+    frame was sent uncompressed, so that both ends only need to agree on using a
+    Compressor. The ratio (compressed / original bytes) is measured over the last
+    `window` compressed frames. When it exceeds `max_ratio` compression is turned
+    off, and one frame in `probe_interval` is compressed to measure it again.
+
+    Args:
+        codec: codec, or name or id of a registered codec
+        threshold (int): frames smaller than this many bytes are not compressed
+        max_ratio (float): compression is turned off above this ratio
+        window (int): number of compressed frames the ratio is measured on
+        probe_interval (int): frames above threshold between probes when off
+    """
+
+    def __init__(
+        self,
+        codec: Union[str, int, Codec] = "zlib",
+        threshold: int = 1024,
+        max_ratio: float = 0.9,
+        window: int = 100,
+        probe_interval: int = 100,
+    ):
+        self.codec = get_codec(codec)
+        self.threshold = threshold
+        self.max_ratio = max_ratio
+        self.probe_interval = probe_interval
+        self.enabled = True
+        self.frames = 0
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._window = deque(maxlen=window)
+        self._skipped = 0
+        self._lock = threading.Lock()
+
+    @property
+    def ratio(self) -> float:
+        """Compressed / original bytes of the last `window` compressed frames"""
+        with self._lock:
+            original = sum(x for x, _ in self._window)
+            return sum(x for _, x in self._window) / original if original else 1.0
+
+    def stats(self) -> dict:
+        return {
+            "codec": self.codec.name,
+            "enabled": self.enabled,
+            "frames": self.frames,
+            "compressed": self.compressed,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": self.ratio,
+        }
+
+    def compress(self, data: Union[str, bytes]) -> bytes:
+        """Returns data prefixed with its flag byte, compressed if worth it"""
+        flag = 0
+        if isinstance(data, str):
+            flag = FLAG_TEXT
+            data = data.encode()
+        self.frames += 1
+        self.bytes_in += len(data)
+        if len(data) >= self.threshold and self._should_compress():
+            compressed = self.codec.compress(data)
+            self._measure(len(data), len(compressed))
+            if len(compressed) < len(data):
+                self.compressed += 1
+                self.bytes_out += len(compressed) + 1
+                return bytes([flag | self.codec.id]) + compressed
+        self.bytes_out += len(data) + 1
+        return bytes([flag]) + data
+
+    def decompress(self, frame) -> Union[str, bytes]:
+        """Inverse of `compress`, frame may be bytes or any buffer (eg. zmq.Frame)
+
+        Raises:
+            ValueError: frame is empty or flagged with an unknown codec, or the
+                codec's error if the frame is not valid compressed data
+        """
+        x = memoryview(frame)
+        if not len(x):
+            raise ValueError("empty frame has no flag byte")
+        flag = x[0]
+        codec = flag & CODEC_MASK
+        data = get_codec(codec).decompress(x[1:]) if codec else x[1:].tobytes()
+        return data.decode() if flag & FLAG_TEXT else data
+
+    def _should_compress(self):
+        if self.enabled:
+            return True
+        self._skipped += 1
+        if self._skipped >= self.probe_interval:
+            self._skipped = 0
+            return True
+        return False
+
+    def _measure(self, original, compressed):
+        with self._lock:
+            self._window.append((original, compressed))
+            total = sum(x for x, _ in self._window)
+            ratio = sum(x for _, x in self._window) / total
+        # wait for a full window before turning compression off
+        if self.enabled and len(self._window) == self._window.maxlen:
+            self.enabled = ratio <= self.max_ratio
+        elif not self.enabled:
+            self.enabled = compressed / original <= self.max_ratio
@@ -5,15 +5,22 @@ __all__ = [
     "stdout_logger",
     "Logger",
     "Singleton",
+    "Waker",
+    "SendQueue",
+    "PrefixTrie",
 ]
 
 import logging
 import os
 import shutil
 import sys
+import threading
 import uuid
+from collections import deque
 from itertools import cycle
+from queue import Empty, Full
 
+import zmq
 from rx.subject import Subject
 
 ##############################################################################
@@ -97,6 +104,263 @@ class Logger(logging.LoggerAdapter):
         )
 
 
+##############################################################################
+## Threading
+##############################################################################
+
+
+class Waker:
+    """Inproc PAIR sockets used to wake up a thread blocked in `zmq.Poller.poll`
+
+    The polling thread registers `socket` with its poller (POLLIN) and calls
+    `clear` when it wakes up, any other thread calls `wake` after handing it work.
+    Unlike a self-pipe, an inproc socket pair also works on Windows.
+
+    Usage:
+
+        ```python
+        waker = Waker()
+        poller.register(waker.socket, zmq.POLLIN)
+
+        # polling thread
+        events = dict(poller.poll())
+        if waker.socket in events:
+            waker.clear()
+
+        # any thread
+        waker.wake()
+        ```
+
+    Args:
+        context (zmq.Context): context of the socket pair, the global instance if None
+    """
+
+    def __init__(self, context=None):
+        context = context or zmq.Context.instance()
+        address = f"inproc://waker-{uuid.uuid4()}"
+        self.socket = context.socket(zmq.PAIR)
+        self.socket.bind(address)
+        self._sender = context.socket(zmq.PAIR)
+        self._sender.connect(address)
+        self._pending = False
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def wake(self):
+        """Wakes up the polling thread, does nothing once closed"""
+        # at most one message in flight, drained before the flag is reset
+        if not self._pending and not self.closed:
+            self._pending = True
+            # zmq sockets are not thread safe
+            with self._lock:
+                if self.closed:
+                    return
+                try:
+                    self._sender.send(b"", zmq.NOBLOCK)
+                except zmq.Again:
+                    pass
+
+    def clear(self):
+        if self.closed:
+            return
+        try:
+            while True:
+                self.socket.recv(zmq.NOBLOCK)
+        except zmq.Again:
+            pass
+        self._pending = False
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            self._sender.close(linger=0)
+            self.socket.close(linger=0)
+
+
+class SendQueue:
+    """Thread safe FIFO with an optional bound, overflow policy and depth metrics
+
+    Overflow policies when `maxsize` items are queued:
+
+        - block: wait up to `timeout` seconds for room, then raise `queue.Full`
+        - drop_oldest: discard the oldest queued item to make room
+        - drop_newest: discard the item being put
+        - raise: raise `queue.Full`
+
+    Args:
+        maxsize (int): maximum number of queued items, unbounded if <= 0
+        overflow (str): overflow policy
+        timeout (float): seconds to wait for the block policy, forever if None
+        on_drop (callable): called with every discarded item
+    """
+
+    OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest", "raise")
+
+    def __init__(self, maxsize=0, overflow="block", timeout=None, on_drop=None):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {self.OVERFLOW_POLICIES}")
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.timeout = timeout
+        self.on_drop = on_drop
+        self.high_water = 0
+        self.drops = 0
+        self._items = deque()
+        self._not_full = threading.Condition(threading.Lock())
+
+    @property
+    def depth(self):
+        return len(self._items)
+
+    def qsize(self):
+        return len(self._items)
+
+    def empty(self):
+        return not self._items
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "high_water": self.high_water,
+            "drops": self.drops,
+        }
+
+    def put(self, item, block=True):
+        """Queues item, returns False if it was dropped by the drop_newest policy
+
+        With `block=False` the block policy raises `queue.Full` instead of waiting.
+        """
+        queued = True
+        dropped = []
+        with self._not_full:
+            if 0 < self.maxsize <= len(self._items):
+                if self.overflow == "drop_newest":
+                    queued = False
+                    dropped.append(item)
+                elif self.overflow == "drop_oldest":
+                    dropped.append(self._items.popleft())
+                elif (
+                    self.overflow == "raise"
+                    or not block
+                    or not self._not_full.wait_for(
+                        lambda: len(self._items) < self.maxsize, self.timeout
+                    )
+                ):
+                    self.drops += 1
+                    raise Full
+            self.drops += len(dropped)
+            if queued:
+                self._items.append(item)
+                self.high_water = max(self.high_water, len(self._items))
+        if self.on_drop:
+            for x in dropped:
+                self.on_drop(x)
+        return queued
+
+    def drop(self, item):
+        """Discards item without queueing it, counted in drops"""
+        with self._not_full:
+            self.drops += 1
+        if self.on_drop:
+            self.on_drop(item)
+
+    def get_nowait(self):
+        with self._not_full:
+            if not self._items:
+                raise Empty
+            item = self._items.popleft()
+            self._not_full.notify()
+            return item
+
+
+##############################################################################
+## Collections
+##############################################################################
+
+
+class _TrieNode:
+    __slots__ = ("children", "values")
+
+    def __init__(self):
+        self.children = {}
+        self.values = ()
+
+
+class PrefixTrie:
+    """Values stored under string prefixes, `match(key)` returns the values of every
+    stored prefix of `key` in O(len(key) + matches)
+
+    Writers are serialized with a lock and replace the values of a node instead of
+    mutating them, so `match` may run concurrently in another thread without one.
+
+    Usage:
+
+        ```python
+        trie = PrefixTrie()
+        trie.add("sensors/", handler)
+        trie.match("sensors/temperature")  # [handler]
+        ```
+    """
+
+    def __init__(self):
+        self._root = _TrieNode()
+        self._lock = threading.Lock()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, prefix, value):
+        """Stores value under prefix, returns True if prefix had no values before"""
+        with self._lock:
+            node = self._root
+            for c in prefix:
+                node = node.children.setdefault(c, _TrieNode())
+            node.values = node.values + (value,)
+            self._size += 1
+            return len(node.values) == 1
+
+    def remove(self, prefix, value):
+        """Removes value from prefix, returns True if prefix has no values left
+
+        Raises:
+            KeyError: value is not stored under prefix
+        """
+        with self._lock:
+            path = [self._root]
+            for c in prefix:
+                node = path[-1].children.get(c)
+                if node is None:
+                    raise KeyError(prefix)
+                path.append(node)
+            node = path[-1]
+            if value not in node.values:
+                raise KeyError(prefix)
+            values = list(node.values)
+            values.remove(value)
+            node.values = tuple(values)
+            self._size -= 1
+            # prune branches left without values
+            for c, parent in zip(reversed(prefix), reversed(path[:-1])):
+                child = parent.children[c]
+                if child.values or child.children:
+                    break
+                del parent.children[c]
+            return not node.values
+
+    def match(self, key):
+        node = self._root
+        matches = list(node.values)
+        for c in key:
+            node = node.children.get(c)
+            if node is None:
+                break
+            matches.extend(node.values)
+        return matches
+
+
 ####################################################################################
 ## Meta Programming
 ####################################################################################
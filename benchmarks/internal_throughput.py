@@ -0,0 +1,82 @@
+"""Throughput of InternalConnection against a ZMQ inproc socket pair
+
+A producer thread sends messages to a consumer thread of the same process,
+through a PUSH/PULL pair over inproc, through the ring buffer of an
+InternalConnection one message at a time (the consumer blocks in receive), and
+in batches with send_many and receive_many.
+
+    python -m benchmarks.internal_throughput
+"""
+
+import threading
+import time
+
+import zmq
+
+from agents.messaging.connections import InternalConnection, InternalRegistry
+from agents.messaging.messages import JSONMessage
+
+MESSAGES = 200_000
+BATCH = 100
+PAYLOAD = b"x" * 64
+
+
+def run_zmq():
+    context = zmq.Context()
+    pull = context.socket(zmq.PULL)
+    pull.bind("inproc://throughput")
+    push = context.socket(zmq.PUSH)
+    push.connect("inproc://throughput")
+
+    def produce():
+        for _ in range(MESSAGES):
+            push.send(PAYLOAD)
+
+    try:
+        start = time.perf_counter()
+        threading.Thread(target=produce).start()
+        for _ in range(MESSAGES):
+            pull.recv()
+        return MESSAGES / (time.perf_counter() - start)
+    finally:
+        push.close(linger=0)
+        pull.close(linger=0)
+        context.term()
+
+
+def run_internal(batch):
+    con = InternalConnection(
+        uid="throughput", serializer=JSONMessage, registry=InternalRegistry()
+    )
+
+    def produce():
+        if batch:
+            for _ in range(MESSAGES // BATCH):
+                con.send_many([PAYLOAD] * BATCH)
+        else:
+            for _ in range(MESSAGES):
+                con.send(PAYLOAD)
+
+    try:
+        start = time.perf_counter()
+        threading.Thread(target=produce).start()
+        received = 0
+        if batch:
+            while received < MESSAGES:
+                received += len(con.receive_many(BATCH, timeout=None))
+        else:
+            while received < MESSAGES:
+                con.receive(timeout=None)
+                received += 1
+        return MESSAGES / (time.perf_counter() - start)
+    finally:
+        con.close()
+
+
+if __name__ == "__main__":
+    for name, f in [
+        ("zmq inproc", run_zmq),
+        ("internal", lambda: run_internal(False)),
+        ("internal bulk", lambda: run_internal(True)),
+    ]:
+        print(f"{name:<14} {f():,.0f} msgs/sec")
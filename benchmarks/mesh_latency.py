@@ -0,0 +1,96 @@
+"""Notification round trip latency through a broker and through a mesh
+
+Two agents play ping-pong with notifications, either through a notifications
+broker (forwarded by the broker's socket thread, or by a steerable proxy) or
+directly between the PUB and SUB sockets of mesh nodes discovered on loopback.
+
+    python -m benchmarks.mesh_latency
+"""
+
+import statistics
+import threading
+import time
+
+from agents import Agent, Message
+from agents.mixins import MeshMixin, NotificationsMixin
+from agents.mixins.mesh import UDPDiscovery
+
+SAMPLES = 2000
+PUB_ADDRESS = "tcp://127.0.0.1:5150"
+SUB_ADDRESS = "tcp://127.0.0.1:5151"
+DISCOVERY_PORT = 5690
+
+
+class BenchmarkAgent(MeshMixin, NotificationsMixin, Agent):
+    def __init__(self, mode, reply):
+        self.mode = mode
+        self.reply = reply
+        self.received = threading.Event()
+        super().__init__()
+
+    def setup(self):
+        if self.mode == "mesh":
+            self.pub = self.sub = self.create_mesh_node(
+                group="benchmark",
+                discovery=UDPDiscovery(DISCOVERY_PORT, broadcast="127.255.255.255"),
+                address="tcp://127.0.0.1:*",
+                interval=0.1,
+                topics=None,
+            )
+        else:
+            self.pub, self.sub = self.create_notification_client(
+                PUB_ADDRESS, SUB_ADDRESS, topics=None
+            )
+        if self.reply:
+            self.sub.on("ping", self.on_ping)
+        else:
+            self.sub.on("pong", lambda x: self.received.set())
+
+    def on_ping(self, x):
+        self.pub.send(
+            Message.Notification(topic="pong", payload=x.payload).to_multipart()
+        )
+
+
+class Broker(NotificationsMixin, Agent):
+    def __init__(self, steerable):
+        self.steerable = steerable
+        super().__init__()
+
+    def setup(self):
+        self.create_notification_broker(
+            PUB_ADDRESS, SUB_ADDRESS, steerable=self.steerable
+        )
+
+
+def run(mode):
+    broker = Broker(mode == "steerable") if mode != "mesh" else None
+    ping, pong = BenchmarkAgent(mode, False), BenchmarkAgent(mode, True)
+    try:
+        time.sleep(1)
+        latencies = []
+        for _ in range(SAMPLES):
+            ping.received.clear()
+            start = time.perf_counter()
+            ping.pub.send(Message.Notification(topic="ping", payload="").to_multipart())
+            ping.received.wait()
+            latencies.append(time.perf_counter() - start)
+        xs = sorted(latencies)
+        return {
+            "mean_ms": statistics.mean(xs) * 1e3,
+            "p50_ms": xs[len(xs) // 2] * 1e3,
+            "p99_ms": xs[int(len(xs) * 0.99)] * 1e3,
+        }
+    finally:
+        ping.shutdown()
+        pong.shutdown()
+        if broker is not None:
+            broker.shutdown()
+
+
+if __name__ == "__main__":
+    for mode in ["broker", "steerable", "mesh"]:
+        r = run(mode)
+        print(
+            f"{mode:<10} mean={r['mean_ms']:.3f}ms p50={r['p50_ms']:.3f}ms p99={r['p99_ms']:.3f}ms"
+        )
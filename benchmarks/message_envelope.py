@@ -0,0 +1,52 @@
+"""Per-message cost of Message.Notification formats
+
+Compares the legacy 3 frames text format against the binary envelope, for text
+and bytes payloads: encoding, decoding, and a full encode/send/recv/decode round
+over an inproc PUSH/PULL pair, where the envelope saves a frame per message.
+
+    python -m benchmarks.message_envelope
+"""
+
+import time
+import timeit
+
+import zmq
+
+from agents import Message
+
+NUMBER = 100_000
+
+
+def run(message, legacy, push, pull):
+    xs = message.to_multipart(legacy=legacy)
+    encode = timeit.timeit(lambda: message.to_multipart(legacy=legacy), number=NUMBER)
+    decode = timeit.timeit(
+        lambda: Message.Notification.from_multipart(xs), number=NUMBER
+    )
+    start = time.perf_counter()
+    for i in range(NUMBER):
+        push.send_multipart(message.to_multipart(legacy=legacy))
+        Message.Notification.from_multipart(pull.recv_multipart())
+    send = time.perf_counter() - start
+    return [x / NUMBER * 1e9 for x in (encode, decode, send)]
+
+
+if __name__ == "__main__":
+    context = zmq.Context()
+    push = context.socket(zmq.PUSH)
+    pull = context.socket(zmq.PULL)
+    push.bind("inproc://message-envelope")
+    pull.connect("inproc://message-envelope")
+    cases = [
+        ("text", Message.Notification(topic="sensors", payload="x" * 64), True),
+        ("text", Message.Notification(topic="sensors", payload="x" * 64), False),
+        ("bytes", Message.Notification(topic="sensors", payload=b"x" * 64), False),
+    ]
+    for name, message, legacy in cases:
+        encode, decode, send = run(message, legacy, push, pull)
+        fmt = "legacy" if legacy else "binary"
+        print(
+            f"{fmt:<7} {name:<6} encode {encode:,.0f} ns  decode {decode:,.0f} ns  "
+            f"inproc round {send:,.0f} ns"
+        )
+    context.destroy(linger=0)
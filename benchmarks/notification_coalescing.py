@@ -0,0 +1,79 @@
+"""Notification throughput with and without a coalescing publisher
+
+A publisher sends small notifications of one topic through a steerable broker to
+a subscriber, either one message per notification or coalesced into batches.
+
+    python -m benchmarks.notification_coalescing
+"""
+
+import threading
+import time
+
+import zmq
+
+from agents import Agent, Message
+from agents.mixins import NotificationsMixin
+
+MESSAGES = 100_000
+PUB_ADDRESS = "tcp://127.0.0.1:5140"
+SUB_ADDRESS = "tcp://127.0.0.1:5141"
+# no high water marks, so that PUB sockets do not drop notifications
+OPTIONS = {zmq.SNDHWM: 0, zmq.RCVHWM: 0}
+
+
+class NotificationsAgent(NotificationsMixin, Agent):
+    pass
+
+
+class Broker(NotificationsAgent):
+    def setup(self):
+        self.create_notification_broker(
+            PUB_ADDRESS, SUB_ADDRESS, options=OPTIONS, steerable=True
+        )
+
+
+class Subscriber(NotificationsAgent):
+    def setup(self):
+        self.count = 0
+        self.done = threading.Event()
+        _, self.sub = self.create_notification_client(
+            PUB_ADDRESS, SUB_ADDRESS, options=dict(OPTIONS)
+        )
+        self.sub.on("telemetry", self.on_notification)
+
+    def on_notification(self, x):
+        self.count += 1
+        if self.count == MESSAGES:
+            self.done.set()
+
+
+class Publisher(NotificationsAgent):
+    def __init__(self, coalesce):
+        self.coalesce = coalesce
+        super().__init__()
+
+    def setup(self):
+        self.pub, _ = self.create_notification_client(
+            PUB_ADDRESS, SUB_ADDRESS, options=dict(OPTIONS), coalesce=self.coalesce
+        )
+
+
+def run(coalesce):
+    broker, subscriber, publisher = Broker(), Subscriber(), Publisher(coalesce)
+    try:
+        time.sleep(0.5)
+        notification = Message.Notification(topic="telemetry", payload="x" * 64)
+        start = time.perf_counter()
+        for i in range(MESSAGES):
+            publisher.pub.send(notification.to_multipart())
+        subscriber.done.wait()
+        return MESSAGES / (time.perf_counter() - start)
+    finally:
+        publisher.shutdown()
+        subscriber.shutdown()
+        broker.shutdown()
+
+
+if __name__ == "__main__":
+    for coalesce in [False, True]:
+        print(f"coalesce={coalesce!s:<5} {run(coalesce):,.0f} msgs/sec")
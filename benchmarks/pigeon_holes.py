@@ -0,0 +1,45 @@
+"""Cost of creating pigeon holes as their number grows
+
+Compares the expiry heap of `PigeonHoles` against the legacy store, which scanned
+every hole for expired ones on each creation.
+
+    python -m benchmarks.pigeon_holes
+"""
+
+import time
+from datetime import datetime, timedelta
+from queue import Queue
+
+from agents.mixins.daemon import PigeonHoles
+
+SIZES = [1_000, 5_000, 20_000]
+
+
+class LegacyPigeonHoles:
+    def __init__(self):
+        self.holes = {}
+
+    def create(self, uid):
+        current_time = datetime.now()
+        self.holes[uid] = {
+            "queue": Queue(),
+            "created_at": current_time,
+            "expired_at": current_time + timedelta(hours=1),
+        }
+        for k in list(self.holes):
+            if current_time > self.holes[k]["expired_at"]:
+                del self.holes[k]
+
+
+def run(holes, n):
+    start = time.perf_counter()
+    for i in range(n):
+        holes.create(i)
+    return (time.perf_counter() - start) / n
+
+
+if __name__ == "__main__":
+    for n in SIZES:
+        legacy = run(LegacyPigeonHoles(), n)
+        heap = run(PigeonHoles(), n)
+        print(f"{n:>7} holes  legacy={legacy * 1e6:8.1f}us  heap={heap * 1e6:6.1f}us")
@@ -0,0 +1,94 @@
+"""Routed message throughput of RouterClientMixin.create_router
+
+Pairs of DEALER clients send messages to each other through the router, comparing
+the rx route in the agent's socket threads against the router engine with one and
+two shards.
+
+    python -m benchmarks.router_throughput
+"""
+
+import threading
+import time
+
+import zmq
+
+from agents import Agent
+from agents.mixins import RouterClientMixin
+
+CLIENTS = 10
+MESSAGES = 10_000
+PORT = 5130
+
+
+class RouterAgent(RouterClientMixin, Agent):
+    def __init__(self, addresses, engine):
+        self.addresses = addresses
+        self.engine = engine
+        super().__init__()
+
+    def setup(self):
+        if self.engine:
+            self.router = self.create_router(self.addresses, engine=True)
+        else:
+            self.router = self.create_router(self.addresses[0])
+
+
+def client(context, address, identity, peer, start, done):
+    dealer = context.socket(zmq.DEALER)
+    dealer.setsockopt(zmq.IDENTITY, identity)
+    dealer.connect(address)
+    # register with the router before the peer starts sending
+    dealer.send_multipart([identity, b"hello"])
+    dealer.recv_multipart()
+    start.wait()
+    received = 0
+    for i in range(MESSAGES):
+        dealer.send_multipart([peer, b"x" * 64])
+        while dealer.poll(0):
+            dealer.recv_multipart()
+            received += 1
+    while received < MESSAGES:
+        dealer.recv_multipart()
+        received += 1
+    dealer.close(linger=0)
+    done()
+
+
+def run(shards, engine):
+    addresses = [f"tcp://127.0.0.1:{PORT + i}" for i in range(shards)]
+    agent = RouterAgent(addresses, engine)
+    context = zmq.Context()
+    start = threading.Barrier(CLIENTS + 1)
+    remaining = threading.Semaphore(0)
+    try:
+        threads = [
+            threading.Thread(
+                target=client,
+                args=(
+                    context,
+                    addresses[i % shards],
+                    f"client-{i}".encode(),
+                    f"client-{i ^ 1}".encode(),
+                    start,
+                    remaining.release,
+                ),
+            )
+            for i in range(CLIENTS)
+        ]
+        for t in threads:
+            t.start()
+        start.wait()
+        begin = time.perf_counter()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - begin
+        return CLIENTS * MESSAGES / elapsed
+    finally:
+        context.destroy(linger=0)
+        agent.shutdown()
+
+
+if __name__ == "__main__":
+    for shards, engine in [(1, False), (1, True), (2, True)]:
+        rate = run(shards, engine)
+        print(f"shards={shards} engine={engine!s:<5} {rate:,.0f} msgs/sec")
@@ -0,0 +1,64 @@
+"""Encode/decode throughput and allocations of the messaging serializers
+
+For a JSON like document and, if numpy is installed, a document holding a 1 MB
+array (pickle only), reports operations per second and the peak memory allocated
+by one encode and one decode (tracemalloc). Serializers whose backend is not
+installed are skipped.
+
+    python -m benchmarks.serializers
+"""
+
+import importlib.util
+import timeit
+import tracemalloc
+
+from agents.messaging.messages import (
+    FastJSONMessage,
+    JSONMessage,
+    MsgpackMessage,
+    PickleMessage,
+)
+
+NUMBER = 20_000
+
+DOCUMENT = {
+    "id": 123456,
+    "name": "sensor",
+    "tags": ["a", "b", "c"],
+    "values": [x * 0.5 for x in range(50)],
+    "nested": {"ok": True, "error": None, "text": "x" * 100},
+}
+
+
+def peak(f):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    f()
+    size = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size
+
+
+def run(serializer, data, number):
+    raw = serializer(data=data).serialize()
+    encode = timeit.timeit(lambda: serializer(data=data).serialize(), number=number)
+    decode = timeit.timeit(lambda: serializer.deserialize(raw), number=number)
+    print(
+        f"{serializer.__name__:<16} {len(raw):>9,} bytes  "
+        f"encode {number / encode:>10,.0f}/s {peak(lambda: serializer(data=data).serialize()):>10,} B  "
+        f"decode {number / decode:>10,.0f}/s {peak(lambda: serializer.deserialize(raw)):>10,} B"
+    )
+
+
+if __name__ == "__main__":
+    serializers = [JSONMessage, FastJSONMessage, PickleMessage]
+    if importlib.util.find_spec("msgpack"):
+        serializers.append(MsgpackMessage)
+    for serializer in serializers:
+        run(serializer, DOCUMENT, NUMBER)
+
+    if importlib.util.find_spec("numpy"):
+        import numpy as np
+
+        print("\n1 MB array")
+        run(PickleMessage, {"array": np.zeros(1 << 17)}, 1000)
@@ -0,0 +1,79 @@
+"""Send latency of an idle Agent socket loop
+
+Compares the event-driven socket loop against the legacy loop which only drains
+send queues after `zmq_poller.poll(50)` returns.
+
+    python -m benchmarks.socket_latency
+"""
+
+import queue
+import statistics
+import threading
+import time
+
+import zmq
+
+from agents import Agent
+
+SAMPLES = 200
+IDLE = 0.01
+
+
+class LatencyAgent(Agent):
+    def setup(self):
+        self.latencies = []
+        self.received = threading.Event()
+        self.rx = self.bind_socket(zmq.PULL, {}, f"inproc://latency-{self.uid}")
+        self.tx = self.connect_socket(zmq.PUSH, {}, f"inproc://latency-{self.uid}")
+        self.rx.observable.subscribe(self.on_message)
+
+    def on_message(self, xs):
+        self.latencies.append(time.perf_counter() - float(xs[0]))
+        self.received.set()
+
+
+class LegacyLatencyAgent(LatencyAgent):
+    def process_sockets(self, shard):
+        # sends no longer interrupt the poll
+        shard.poller.unregister(shard.waker.socket)
+        self.initialized_event.wait()
+        while not self.exit_event.is_set():
+            if shard.sockets:
+                sockets = dict(shard.poller.poll(50))
+                for k, v in shard.sockets.items():
+                    if v.socket in sockets and sockets[v.socket] == zmq.POLLIN:
+                        v.observable.on_next(v.socket.recv_multipart())
+                    while not v.send_queue.empty() and not self.exit_event.is_set():
+                        try:
+                            v.socket.send_multipart(v.send_queue.get_nowait())
+                        except queue.Empty:
+                            pass
+            else:
+                time.sleep(1)
+
+
+def run(agent_cls):
+    agent = agent_cls()
+    try:
+        for _ in range(SAMPLES):
+            # let the loop go idle before every send
+            time.sleep(IDLE)
+            agent.received.clear()
+            agent.tx.send([str(time.perf_counter()).encode()])
+            agent.received.wait()
+        xs = sorted(agent.latencies)
+        return {
+            "mean_ms": statistics.mean(xs) * 1e3,
+            "p50_ms": xs[len(xs) // 2] * 1e3,
+            "p99_ms": xs[int(len(xs) * 0.99)] * 1e3,
+        }
+    finally:
+        agent.shutdown()
+
+
+if __name__ == "__main__":
+    for name, cls in [("legacy", LegacyLatencyAgent), ("event", LatencyAgent)]:
+        r = run(cls)
+        print(
+            f"{name:<8} mean={r['mean_ms']:.3f}ms p50={r['p50_ms']:.3f}ms p99={r['p99_ms']:.3f}ms"
+        )
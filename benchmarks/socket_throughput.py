@@ -0,0 +1,68 @@
+"""Sustained receive throughput of a hot Agent socket
+
+Compares reading one message per poll cycle against draining up to
+`recv_budget` messages per cycle, emitted singly or as a batch.
+
+    python -m benchmarks.socket_throughput
+"""
+
+import threading
+import time
+
+import zmq
+
+from agents import Agent
+
+MESSAGES = 200_000
+
+
+class ThroughputAgent(Agent):
+    def __init__(self, recv_budget, batch):
+        self.recv_budget = recv_budget
+        self.batch = batch
+        super().__init__()
+
+    def setup(self):
+        self.count = 0
+        self.done = threading.Event()
+        self.pull = self.bind_socket(
+            zmq.PULL,
+            {},
+            f"inproc://throughput-{self.uid}",
+            recv_budget=self.recv_budget,
+            batch=self.batch,
+        )
+        self.pull.observable.subscribe(self.on_batch if self.batch else self.on_message)
+
+    def on_message(self, xs):
+        self.count += 1
+        if self.count == MESSAGES:
+            self.done.set()
+
+    def on_batch(self, xs):
+        self.count += len(xs)
+        if self.count == MESSAGES:
+            self.done.set()
+
+
+def run(recv_budget, batch):
+    agent = ThroughputAgent(recv_budget, batch)
+    try:
+        # push from outside the socket thread so that sending is not measured
+        push = agent.zmq_context.socket(zmq.PUSH)
+        push.connect(f"inproc://throughput-{agent.uid}")
+        start = time.perf_counter()
+        for i in range(MESSAGES):
+            push.send(b"x" * 64)
+        agent.done.wait()
+        elapsed = time.perf_counter() - start
+        push.close(linger=0)
+        return MESSAGES / elapsed
+    finally:
+        agent.shutdown()
+
+
+if __name__ == "__main__":
+    for recv_budget, batch in [(1, False), (100, False), (100, True)]:
+        rate = run(recv_budget, batch)
+        print(f"recv_budget={recv_budget:<4} batch={batch!s:<5} {rate:,.0f} msgs/sec")
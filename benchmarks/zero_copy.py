@@ -0,0 +1,67 @@
+"""Large payload throughput and memory with and without zero copy sockets
+
+Sends payloads of 1 to 100 MB through a PUSH/PULL pair serviced by an Agent and
+reports throughput and the peak of Python allocations (tracemalloc) made while
+sending and receiving them. Zero copy frames are owned by libzmq and are not
+counted by tracemalloc, the copying mode allocates a bytes object per receive.
+
+    python -m benchmarks.zero_copy
+"""
+
+import threading
+import time
+import tracemalloc
+
+import zmq
+
+from agents import Agent
+
+SIZES_MB = [1, 10, 100]
+REPEAT = 5
+
+
+class PayloadAgent(Agent):
+    def __init__(self, zero_copy):
+        self.zero_copy = zero_copy
+        super().__init__()
+
+    def setup(self):
+        self.received = threading.Semaphore(0)
+        address = f"inproc://payload-{self.uid}"
+        self.pull = self.bind_socket(zmq.PULL, {}, address, zero_copy=self.zero_copy)
+        self.push = self.connect_socket(zmq.PUSH, {}, address, zero_copy=self.zero_copy)
+        self.pull.observable.subscribe(self.on_message)
+
+    def on_message(self, xs):
+        # touch the payload the way a consumer would
+        memoryview(xs[0]).cast("B")[-1]
+        self.received.release()
+
+
+def run(zero_copy, size):
+    agent = PayloadAgent(zero_copy)
+    payload = bytearray(size)
+    try:
+        tracemalloc.start()
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            if zero_copy:
+                agent.push.send(memoryview(payload))
+            else:
+                agent.push.send([bytes(payload)])
+            agent.received.acquire()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return REPEAT * size / elapsed / 2**20, peak / 2**20
+    finally:
+        agent.shutdown()
+
+
+if __name__ == "__main__":
+    for size_mb in SIZES_MB:
+        for zero_copy in (False, True):
+            throughput, peak = run(zero_copy, size_mb * 2**20)
+            print(
+                f"{size_mb:>4} MB zero_copy={zero_copy!s:<5} {throughput:>9,.0f} MB/s peak python allocations {peak:>7,.1f} MB"
+            )
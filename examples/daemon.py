@@ -1,11 +1,13 @@
-from agents import Agent
 import logging
 import math
 import time
 import uuid
 from queue import Queue
 
-class DaemonAgent(Agent):
+from agents import Agent
+from agents.mixins import DaemonMixin
+
+class DaemonAgent(DaemonMixin, Agent):
 
     def setup(self):
         self.queue = Queue()
@@ -26,4 +28,4 @@ if __name__ == "__main__":
     ))
     result = agent.get_pidgeon(pidgeon_uid)
 
-    print(f"result: {result}")
\ No newline at end of file
+    print(f"result: {result}")
@@ -8,7 +8,7 @@ setup(
     version=__version__,
     author="shirecoding",
     author_email="shirecoding@gmail.com",
-    install_requires=["pyzmq", "rx", "rxpipes", "pyrsistent", "aiohttp"],
+    install_requires=["pyzmq", "rx", "rxpipes", "aiohttp"],
     extras_require={
         "test": [
             "pytest",
@@ -20,6 +20,7 @@ setup(
         ],
         "docs": ["mkdocs", "mkdocstrings", "mkdocs-material"],
         "chatserver": ["jinja2"],
+        "serializers": ["msgpack", "orjson"],
     },
     url="https://github.com/shirecoding/VeryPowerfulAgents.git",
     download_url=f"https://github.com/shirecoding/VeryPowerfulAgents/archive/{__version__}.tar.gz",
@@ -1,8 +1,16 @@
 import logging
+import threading
+import time
+from queue import Full
 
 import pytest
 
-from agents.messaging.connections import InternalConnection, WebsocketConnection
+from agents.messaging.connections import (
+    ConnectionClosed,
+    InternalConnection,
+    InternalRegistry,
+    WebsocketConnection,
+)
 from agents.messaging.messages import JSONMessage
 
 log = logging.getLogger(__name__)
@@ -33,6 +41,97 @@ def test_internal_connection():
     assert ic1.receive_message() == JSONMessage(data=d2)
 
 
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_internal_connection_bulk():
+    """Messages sent in bulk are received in order, in bulk or one by one"""
+
+    registry = InternalRegistry()
+    ic = InternalConnection(uid="ic", serializer=JSONMessage, registry=registry)
+
+    assert ic.receive() is None
+    assert ic.receive_many(10) == []
+
+    ic.send_many([f"{i}" for i in range(10)])
+    assert ic.receive_many(4) == ["0", "1", "2", "3"]
+    assert ic.receive() == "4"
+    assert ic.receive_many() == ["5", "6", "7", "8", "9"]
+
+    # uids of different registries do not collide
+    other = InternalConnection(uid="ic", serializer=JSONMessage)
+    ic.send("x")
+    assert other.receive() is None
+    assert ic.receive() == "x"
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_internal_connection_blocking():
+    """Blocked receivers wake up on send, full ring buffers block senders"""
+
+    registry = InternalRegistry(maxsize=2)
+    ic = InternalConnection(uid="ic", serializer=JSONMessage, registry=registry)
+
+    start = time.perf_counter()
+    assert ic.receive(timeout=0.05) is None
+    assert ic.receive_many(10, timeout=0.05) == []
+    assert time.perf_counter() - start >= 0.1
+
+    threading.Timer(0.05, lambda: ic.send_many(["a", "b"])).start()
+    assert ic.receive_many(10, timeout=5) == ["a", "b"]
+
+    ic.send_many(["a", "b"])
+    with pytest.raises(Full):
+        ic.send("c", timeout=0.05)
+
+    # a blocked sender resumes once a message is received
+    threading.Timer(0.05, ic.receive).start()
+    ic.send("c", timeout=5)
+    assert ic.receive_many() == ["b", "c"]
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_internal_connection_close():
+    """Closed uids are not recreated by their connections, but may be opened again"""
+
+    registry = InternalRegistry()
+    ic = InternalConnection(uid="ic", serializer=JSONMessage, registry=registry)
+    ic.send("x")
+    assert ic.receive() == "x"
+
+    # blocked receivers are woken up
+    threading.Timer(0.05, ic.close).start()
+    with pytest.raises(ConnectionClosed):
+        ic.receive(timeout=5)
+    with pytest.raises(ConnectionClosed):
+        ic.send("y")
+    assert "ic" not in registry.buffers
+
+    ic2 = InternalConnection(uid="ic", serializer=JSONMessage, registry=registry)
+    ic.close()
+    ic2.send("z")
+    assert ic2.receive() == "z"
+
+
 @pytest.mark.report(
     specification="""
     """,
@@ -1,8 +1,15 @@
+import importlib.util
 import logging
 
 import pytest
 
-from agents.messaging.messages import JSONMessage
+from agents.messaging.messages import (
+    FastJSONMessage,
+    JSONMessage,
+    MsgpackMessage,
+    PickleMessage,
+    get_serializer,
+)
 
 log = logging.getLogger(__name__)
 
@@ -26,3 +33,56 @@ def test_json_messaging():
 
     # test from_serialized
     assert JSONMessage.from_serialized(s) == m
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_binary_messaging():
+    """binary serializers round trip through bytes"""
+
+    d = {"hello": "world", "nest": {"nest": "nest"}, "n": [1, 2.5, None]}
+    serializers = [FastJSONMessage, PickleMessage]
+    if importlib.util.find_spec("msgpack"):
+        serializers.append(MsgpackMessage)
+
+    for serializer in serializers:
+        s = serializer(data=d).serialize()
+        assert isinstance(s, bytes)
+        assert serializer.deserialize(s) == d
+        assert serializer.from_serialized(s) == serializer(data=d)
+
+    assert get_serializer() is JSONMessage
+    assert get_serializer("pickle") is PickleMessage
+    assert get_serializer(MsgpackMessage) is MsgpackMessage
+    with pytest.raises(ValueError):
+        get_serializer("unknown")
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_pickle_out_of_band():
+    """pickle message buffers are not copied into the pickle stream"""
+
+    np = pytest.importorskip("numpy")
+
+    a = np.arange(1000, dtype=np.float64)
+    frames = PickleMessage(data={"a": a}).serialize_frames()
+    assert len(frames) == 2
+    assert len(frames[0]) < a.nbytes
+    assert np.array_equal(PickleMessage.deserialize_frames(frames)["a"], a)
+
+    d = PickleMessage.deserialize(PickleMessage(data={"a": a, "b": a * 2}).serialize())
+    assert np.array_equal(d["a"], a)
+    assert np.array_equal(d["b"], a * 2)
@@ -76,3 +76,18 @@ async def test_module_websocket(start_agents):
             "http://127.0.0.1:8080/hello"
         ) as resp2:
             assert await resp.text() == await resp2.text() == "world"
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_module_websocket_pickle():
+    """pickle is refused for messages of websocket clients"""
+
+    with pytest.raises(ValueError):
+        WebSocketModule(agent=None, serializer="pickle")
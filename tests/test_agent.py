@@ -1,8 +1,10 @@
 import logging
+import threading
 import time
 
 import pytest
 import zmq
+from rx import operators as ops
 
 from agents import Agent
 
@@ -100,3 +102,348 @@ def test_socket(start_agents):
     assert res[0] == [b"message"]
     d.dispose()
     d2.dispose()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_socket_wakeup(start_agents):
+    """sends on an idle socket are flushed without waiting for a poll timeout"""
+
+    (agent_one, agent_two, agent_three) = start_agents
+
+    pull = agent_one.bind_socket(zmq.PULL, {}, "inproc://wakeup")
+    push = agent_one.connect_socket(zmq.PUSH, {}, "inproc://wakeup")
+
+    received = threading.Event()
+    d = pull.observable.subscribe(lambda x: received.set())
+
+    latencies = []
+    for _ in range(20):
+        time.sleep(0.01)
+        received.clear()
+        start = time.perf_counter()
+        push.send([b"ping"])
+        assert received.wait(1)
+        latencies.append(time.perf_counter() - start)
+    log.debug(latencies)
+    assert sum(latencies) / len(latencies) < 0.01
+    d.dispose()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_socket_batch(start_agents):
+    """messages drained in one poll cycle are emitted together in batch mode"""
+
+    (agent_one, agent_two, agent_three) = start_agents
+
+    pull = agent_one.bind_socket(
+        zmq.PULL, {}, "inproc://batch", recv_budget=10, batch=True
+    )
+    push = agent_one.connect_socket(zmq.PUSH, {}, "inproc://batch")
+
+    res = []
+    d = pull.observable.subscribe(lambda xs: res.append(xs))
+    for i in range(50):
+        push.send([str(i).encode()])
+    time.sleep(0.5)
+    log.debug(res)
+    assert all(0 < len(xs) <= 10 for xs in res)
+    assert [x for xs in res for x in xs] == [[str(i).encode()] for i in range(50)]
+    d.dispose()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_socket_shards():
+    """sockets are spread round-robin or pinned across socket threads"""
+
+    class ShardedAgent(Agent):
+        def setup(self):
+            self.pull = self.bind_socket(zmq.PULL, {}, "inproc://shards")
+            self.push = self.connect_socket(zmq.PUSH, {}, "inproc://shards")
+            self.pinned = self.bind_socket(zmq.PUB, {}, "inproc://pinned", shard=0)
+
+    agent = ShardedAgent(shards=2)
+    try:
+        assert (agent.pull.shard, agent.push.shard, agent.pinned.shard) == (0, 1, 0)
+        assert set(agent.zmq_shards[0].sockets) == {
+            f"{zmq.PULL}:inproc://shards",
+            f"{zmq.PUB}:inproc://pinned",
+        }
+
+        res = []
+        received = threading.Event()
+
+        def on_message(x):
+            res.append((x, threading.current_thread()))
+            received.set()
+
+        d = agent.pull.observable.subscribe(on_message)
+        agent.push.send([b"message"])
+        assert received.wait(1)
+        assert res[0][0] == [b"message"]
+        assert res[0][1] is agent.threads[1]
+        d.dispose()
+
+        with pytest.raises(ValueError):
+            agent.bind_socket(zmq.PUB, {}, "inproc://invalid", shard=2)
+    finally:
+        agent.shutdown()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_socket_zero_copy(start_agents):
+    """zero copy sockets emit frames and send buffers without copying"""
+
+    (agent_one, agent_two, agent_three) = start_agents
+
+    pull = agent_one.bind_socket(zmq.PULL, {}, "inproc://zero_copy", zero_copy=True)
+    push = agent_one.connect_socket(
+        zmq.PUSH, {}, "inproc://zero_copy", zero_copy=True, track=True
+    )
+
+    res = []
+    received = threading.Event()
+    d = pull.observable.subscribe(lambda x: (res.append(x), received.set()))
+
+    payload = bytearray(b"x" * 1024 * 1024)
+    tracker = push.send(memoryview(payload)).result(1)
+    assert received.wait(1)
+
+    assert len(res[0]) == 1
+    assert isinstance(res[0][0], zmq.Frame)
+    assert res[0][0].buffer == payload
+
+    # inproc shares the buffer with the receiver until its frame is released
+    res.clear()
+    tracker.wait(1)
+    assert tracker.done
+    d.dispose()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_socket_send_queue(start_agents):
+    """send queues are bounded and report their depth"""
+
+    (agent_one, agent_two, agent_three) = start_agents
+
+    pull = agent_one.bind_socket(zmq.PULL, {}, "inproc://send_queue")
+    push = agent_one.connect_socket(
+        zmq.PUSH, {}, "inproc://send_queue", max_queue=10, overflow="drop_newest"
+    )
+
+    res = []
+    d = pull.observable.subscribe(lambda x: res.append(x))
+    for i in range(5):
+        push.send([str(i).encode()])
+    time.sleep(0.2)
+    assert len(res) == 5
+    assert push.send_queue.maxsize == 10
+    assert push.stats()["depth"] == 0
+    assert 1 <= push.stats()["high_water"] <= 5
+    assert push.stats()["drops"] == 0
+    d.dispose()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_socket_handle(start_agents):
+    """piped handles share the socket and send queue of the registered handle"""
+
+    (agent_one, agent_two, agent_three) = start_agents
+
+    pull = agent_one.bind_socket(zmq.PULL, {}, "inproc://handle")
+    push = agent_one.connect_socket(zmq.PUSH, {}, "inproc://handle")
+    assert agent_one.zmq_shards[0].handles[pull.socket] is pull
+
+    decoded = pull.pipe(ops.map(lambda xs: xs[0].decode()))
+    assert decoded.socket is pull.socket
+    assert decoded.send_queue is pull.send_queue
+    assert decoded.observable is not pull.observable
+    with pytest.raises(AttributeError):
+        decoded.unknown = None
+
+    res = []
+    d = decoded.observable.subscribe(lambda x: res.append(x))
+    push.replace(options={"copy": True}).send([b"message"])
+    time.sleep(0.2)
+    assert res == ["message"]
+    assert push.stats() == {"depth": 0, "high_water": 1, "drops": 0}
+    d.dispose()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_socket_compression(start_agents):
+    """last frames above the threshold are compressed on the wire"""
+
+    (agent_one, agent_two, agent_three) = start_agents
+
+    pull = agent_one.bind_socket(
+        zmq.PULL, {}, "inproc://compression", compression="zlib"
+    )
+    push = agent_one.connect_socket(
+        zmq.PUSH, {}, "inproc://compression", compression="zlib"
+    )
+
+    res = []
+    d = pull.observable.subscribe(lambda x: res.append(x))
+    push.send([b"topic", b"x" * 10000])
+    push.send([b"small"])
+    time.sleep(0.2)
+    assert res == [[b"topic", b"x" * 10000], [b"small"]]
+    assert push.compressor.compressed == 1
+    assert push.compressor.ratio < 0.1
+
+    with pytest.raises(ValueError):
+        agent_one.connect_socket(
+            zmq.PUSH, {}, "inproc://compression", zero_copy=True, compression="zlib"
+        )
+    d.dispose()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_socket_send_queue_owned(start_agents):
+    """handlers sending on their own socket thread do not wait for a full queue"""
+
+    (agent_one, agent_two, agent_three) = start_agents
+
+    source = agent_one.bind_socket(zmq.PULL, {}, "inproc://owned_source")
+    sink = agent_one.bind_socket(zmq.PULL, {}, "inproc://owned_sink")
+    push = agent_one.connect_socket(zmq.PUSH, {}, "inproc://owned_source")
+    forward = agent_one.connect_socket(
+        zmq.PUSH, {}, "inproc://owned_sink", max_queue=2
+    )
+    assert source.shard == forward.shard
+
+    res = []
+    received = threading.Event()
+
+    def on_message(x):
+        res.append(x)
+        if len(res) == 50:
+            received.set()
+
+    d1 = source.observable.subscribe(forward.send)
+    d2 = sink.observable.subscribe(on_message)
+    for i in range(50):
+        push.send([str(i).encode()])
+    assert received.wait(2)
+    assert res == [[str(i).encode()] for i in range(50)]
+    assert forward.stats()["high_water"] <= 2
+    d1.dispose()
+    d2.dispose()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_socket_compression_invalid(start_agents):
+    """invalid frames received by a compressing socket are dropped"""
+
+    (agent_one, agent_two, agent_three) = start_agents
+
+    pull = agent_one.bind_socket(
+        zmq.PULL, {}, "inproc://compression_invalid", compression="zlib"
+    )
+    push = agent_one.connect_socket(zmq.PUSH, {}, "inproc://compression_invalid")
+
+    res = []
+    d = pull.observable.subscribe(lambda x: res.append(x))
+    # empty, not compressed, unknown codec and truncated zlib frames
+    push.send([b""])
+    push.send([b"not compressed"])
+    push.send([b"\x7funknown codec"])
+    push.send([b"\x01" + b"x" * 10])
+    push.send([b"\x00valid"])
+    time.sleep(0.2)
+    assert res == [[b"valid"]]
+    d.dispose()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_socket_failing_subscriber(start_agents):
+    """a failing subscriber does not stop the socket thread"""
+
+    (agent_one, agent_two, agent_three) = start_agents
+
+    pull = agent_one.bind_socket(zmq.PULL, {}, "inproc://failing_subscriber")
+    push = agent_one.connect_socket(zmq.PUSH, {}, "inproc://failing_subscriber")
+
+    res = []
+
+    def on_message(x):
+        if x == [b"fail"]:
+            raise ValueError("failed")
+        res.append(x)
+
+    d = pull.observable.subscribe(on_message)
+    push.send([b"fail"])
+    push.send([b"message"])
+    time.sleep(0.2)
+    assert res == [[b"message"]]
+    d.dispose()
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+
+import aiohttp
+import pytest
+import zmq
+from aiohttp.web import Response
+
+from agents import AsyncAgent
+from agents.modules.webserver import WebServerModule
+
+log = logging.getLogger(__name__)
+
+
+@pytest.fixture(scope="module")
+def start_agents():
+    class EchoAgent(AsyncAgent):
+        async def setup(self):
+            self.web = WebServerModule(
+                agent=self, port=8081, routes=[("GET", "/hello", self.get_hello)]
+            )
+            self.register_module(self.web)
+            self.rep = self.bind_socket(zmq.ROUTER, {}, "tcp://127.0.0.1:5010")
+            self.echo_task = self.event_loop.create_task(self.echo())
+
+        async def echo(self):
+            async for xs in self.rep:
+                await self.rep.send(xs)
+
+        async def get_hello(self, request):
+            return Response(text="world")
+
+    class ClientAgent(AsyncAgent):
+        def setup(self):
+            self.req = self.connect_socket(
+                zmq.DEALER, {zmq.IDENTITY: b"client"}, "tcp://127.0.0.1:5010"
+            )
+
+    echo_agent = EchoAgent()
+    client_agent = ClientAgent()
+    yield echo_agent, client_agent
+    client_agent.shutdown()
+    echo_agent.shutdown()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_async_agent_socket(start_agents):
+    """sockets are zmq.asyncio sockets served by the agent's event loop"""
+
+    echo_agent, client_agent = start_agents
+
+    async def request():
+        await client_agent.req.send([b"hello"])
+        return await asyncio.wait_for(client_agent.req.recv(), 5)
+
+    assert client_agent.create_task(request()).result(5) == [b"hello"]
+
+    # from outside the loop
+    client_agent.req.send_threadsafe([b"world"]).result(5)
+    assert client_agent.create_task(client_agent.req.recv()).result(5) == [b"world"]
+
+    with pytest.raises(TypeError):
+        client_agent.connect_socket(zmq.PUSH, {}, "inproc://x", batch=True)
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+@pytest.mark.asyncio
+async def test_async_agent_webserver(start_agents):
+    """modules share the agent's event loop"""
+
+    echo_agent, client_agent = start_agents
+    assert echo_agent.web.event_loop is echo_agent.event_loop
+    assert len(echo_agent.threads) == 1
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get("http://127.0.0.1:8081/hello") as resp:
+            assert await resp.text() == "world"
@@ -0,0 +1,100 @@
+import logging
+import os
+import time
+from signal import SIGKILL
+
+import pytest
+import zmq
+
+from agents import Agent, AgentCluster
+
+log = logging.getLogger(__name__)
+
+ADDRESS = "tcp://127.0.0.1:5060"
+
+
+class PidAgent(Agent):
+    def handle_request(self, frames):
+        time.sleep(0.01)
+        return [frames[0], str(os.getpid()).encode()]
+
+
+@pytest.fixture(scope="module")
+def start_cluster():
+    cluster = AgentCluster(PidAgent, replicas=2, address=ADDRESS, stats_interval=0.1)
+    context = zmq.Context()
+    client = context.socket(zmq.DEALER)
+    client.connect(ADDRESS)
+    time.sleep(0.5)
+
+    yield cluster, client
+
+    context.destroy(linger=0)
+    cluster.shutdown()
+
+
+def request_all(client, n):
+    for i in range(n):
+        client.send_multipart([str(i).encode()])
+    replies = []
+    for i in range(n):
+        assert client.poll(2000)
+        replies.append(client.recv_multipart())
+    return replies
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_cluster_load_balancing(start_cluster):
+    """requests to one endpoint are balanced over the replicas"""
+
+    cluster, client = start_cluster
+
+    replies = request_all(client, 20)
+    assert sorted(int(x) for x, _ in replies) == list(range(20))
+    pids = {int(pid) for _, pid in replies}
+    assert pids == {x["pid"] for x in cluster.stats()}
+    assert os.getpid() not in pids
+
+    time.sleep(0.3)
+    stats = cluster.stats()
+    log.debug(stats)
+    assert sum(x["handled"] for x in stats) == 20
+    assert sum(x["dispatched"] for x in stats) == 20
+    assert all(x["in_flight"] == 0 for x in stats)
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_cluster_restart(start_cluster):
+    """dead replicas are restarted"""
+
+    cluster, client = start_cluster
+
+    pid = cluster.stats()[0]["pid"]
+    os.kill(pid, SIGKILL)
+    time.sleep(1)
+
+    stats = cluster.stats()
+    assert stats[0]["restarts"] == 1
+    assert stats[0]["alive"] and stats[0]["pid"] != pid
+    # only the identity of the dead replica is forgotten
+    assert b"replica-0-0" not in cluster._identities
+    assert cluster._identities[b"replica-0-1"] == 0
+    assert len(cluster._identities) == cluster.replicas
+
+    replies = request_all(client, 10)
+    assert sorted(int(x) for x, _ in replies) == list(range(10))
+    assert pid not in {int(p) for _, p in replies}
@@ -1,19 +1,22 @@
 import logging
 import math
+import threading
 import time
 import uuid
-from queue import Queue
+from concurrent.futures import CancelledError
+from queue import Full, Queue
 
 import pytest
 
 from agents import Agent
+from agents.mixins import DaemonMixin
 
 log = logging.getLogger(__name__)
 
 
 @pytest.fixture(scope="module")
 def start_agents():
-    class AgentWithDaemon(Agent):
+    class AgentWithDaemon(DaemonMixin, Agent):
         def setup(self):
             pass
 
@@ -151,3 +154,195 @@ def test_agent_with_daemon_error(start_agents):
         execinfo.value.args[0]
         == "create_daemon() missing 2 required positional arguments: 'queue' and 'func'"
     )
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_daemon_workers(start_agents):
+    """jobs submitted to a pool of workers return futures"""
+
+    agent = start_agents
+
+    def slow_add(a, b):
+        time.sleep(0.2)
+        return a + b
+
+    daemon = agent.create_daemon(None, slow_add, workers=4)
+    start = time.time()
+    futures = [daemon.submit(i, b=1) for i in range(8)]
+    assert [f.result(timeout=2) for f in futures] == list(range(1, 9))
+    # 4 workers run 8 jobs of 0.2s in 2 rounds
+    assert time.time() - start < 0.6
+
+    failing = daemon.submit(1, b="a")
+    with pytest.raises(TypeError):
+        failing.result(timeout=1)
+
+    processes = agent.create_daemon(None, sum, workers=2, kind="process")
+    # jobs run in the process pool of the agent
+    assert processes.executor is agent.executors["cpu"]
+    assert processes.submit([1, 2, 4]).result(timeout=30) == 7
+
+    with pytest.raises(ValueError):
+        agent.create_daemon(None, sum, kind="fiber")
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_daemon_priority(start_agents):
+    """waiting jobs run by priority, and a bounded daemon blocks when full"""
+
+    agent = start_agents
+    release = threading.Event()
+    order = []
+
+    def job(name):
+        if name == "block":
+            release.wait()
+        order.append(name)
+
+    daemon = agent.create_daemon(None, job, maxsize=3)
+    daemon.submit("block")
+    time.sleep(0.1)
+    daemon.request(("low",), priority=10)
+    daemon.request(("first",), priority=0)
+    last = daemon.request(("high",), priority=-1)
+
+    with pytest.raises(Full):
+        daemon.request(("overflow",), timeout=0.1)
+
+    release.set()
+    last.result(timeout=1)
+    time.sleep(0.1)
+    assert order == ["block", "high", "first", "low"]
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_pigeon_holes():
+    """pigeon holes expire from a heap and are evicted least recently used first"""
+
+    from agents.mixins.daemon import PigeonHoles
+
+    holes = PigeonHoles(ttl=10, max_holes=3)
+    for uid in "abc":
+        holes.create(uid)
+    holes.get("a").put(1)
+    holes.create("d")
+    # b is the least recently used hole
+    assert "b" not in holes and len(holes) == 3
+    assert holes.get("a").get_nowait() == 1
+
+    # replaced holes leave a stale heap entry behind
+    holes.create("c")
+    now = time.monotonic()
+    assert holes.reap(now) == 0
+    assert holes.reap(now + 11) == 3
+    assert len(holes) == 0
+
+    gauges = holes.gauges()
+    assert gauges["expired"] == 3 and gauges["evicted"] == 1
+    assert gauges["holes"] == 0 and gauges["heap_entries"] == 0
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_pigeon_holes_reaper():
+    """expired pigeon holes are reaped in the background"""
+
+    class ShortLivedHoles(DaemonMixin, Agent):
+        pidgeon_ttl = 0.2
+
+    agent = ShortLivedHoles()
+    try:
+        agent.put_pidgeon("job", 7)
+        agent.create_pidgeon_hole("other")
+        gauges = agent.pidgeon_gauges()
+        assert gauges["holes"] == 2 and gauges["results"] == 1
+        assert gauges["memory_bytes"] > 0
+        time.sleep(0.4)
+        assert agent.pidgeon_gauges()["holes"] == 0
+        assert agent.pidgeon_gauges()["expired"] == 2
+    finally:
+        agent.shutdown()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_daemon_streaming(start_agents):
+    """generator jobs stream their chunks with backpressure and cancellation"""
+
+    agent = start_agents
+    produced = []
+    closed = threading.Event()
+
+    def rows(n):
+        try:
+            for i in range(n):
+                produced.append(i)
+                yield i
+        finally:
+            closed.set()
+
+    async def async_rows(n):
+        for i in range(n):
+            yield i
+
+    daemon = agent.create_daemon(None, rows)
+    assert list(daemon.stream(5)) == [0, 1, 2, 3, 4]
+    assert daemon.submit(3).result(timeout=1) == [0, 1, 2]
+
+    # the job waits for the consumer once the buffer is full
+    closed.clear()
+    produced.clear()
+    stream = daemon.request((1000,), stream=True, buffer=4)
+    assert next(stream) == 0
+    time.sleep(0.1)
+    assert len(produced) <= 6
+    stream.cancel()
+    assert closed.wait(1)
+    with pytest.raises(CancelledError):
+        next(stream)
+
+    res = []
+    done = threading.Event()
+    async_daemon = agent.create_daemon(None, async_rows)
+    async_daemon.stream(3).observable.subscribe(
+        on_next=res.append, on_completed=done.set
+    )
+    assert done.wait(1)
+    assert res == [0, 1, 2]
+
+    processes = agent.create_daemon(None, rows, kind="process")
+    with pytest.raises(ValueError):
+        processes.stream(3)
@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+
+import pytest
+
+log = logging.getLogger(__name__)
+
+# import time of the package itself (zmq and rx already imported), as a fraction
+# of the import time of zmq and rx in the same interpreter (about 0.25 measured),
+# so that the budget does not depend on the speed of the machine
+BUDGET = float(os.environ.get("AGENTS_IMPORT_BUDGET", "0.5"))
+RUNS = 3
+
+# modules imported by the statement, not by the interpreter start up or setup
+SCRIPT = """
+import json, sys, time
+startup = sorted(sys.modules)
+start = time.perf_counter()
+{setup}
+baseline = time.perf_counter() - start
+before = set(sys.modules)
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+modules = sorted(set(sys.modules) - before)
+print(json.dumps({{
+    "elapsed": elapsed, "baseline": baseline, "startup": startup, "modules": modules
+}}))
+"""
+
+
+def cold_import(statement, setup=""):
+    """Best of RUNS imports in a fresh interpreter, and the modules imported"""
+    runs = []
+    for _ in range(RUNS):
+        out = subprocess.run(
+            [sys.executable, "-c", SCRIPT.format(statement=statement, setup=setup)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        runs.append(json.loads(out.splitlines()[-1]))
+    return runs, set(runs[0]["modules"])
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_lazy_imports():
+    """importing the package only imports the features in use"""
+
+    _, modules = cold_import("import agents")
+    assert "agents.agent" not in modules
+    assert (
+        not {
+            "zmq",
+            "rx",
+            "asyncio",
+            "multiprocessing",
+            "concurrent.futures",
+            "typing",
+        }
+        & modules
+    )
+
+    _, modules = cold_import(
+        "from agents import Agent, Message\nfrom agents.mixins import NotificationsMixin"
+    )
+    assert "agents.mixins.notifications" in modules
+    assert not {"aiohttp", "h5py", "agents.mixins.webserver"} & modules
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_import_time_budget():
+    """cold import of a pure zmq agent stays within the budget"""
+
+    runs, _ = cold_import("from agents import Agent", setup="import zmq, rx")
+    if {"zmq", "rx"} & set(runs[0]["startup"]):
+        pytest.skip("zmq or rx imported by the interpreter start up, no baseline")
+    ratio = min(x["elapsed"] / x["baseline"] for x in runs)
+    log.debug(f"cold import of Agent: {ratio:.2f} of zmq and rx (budget {BUDGET})")
+    assert ratio < BUDGET
@@ -0,0 +1,106 @@
+import logging
+import socket
+import time
+
+import pytest
+
+from agents import Agent, Message
+from agents.mixins import MeshMixin
+from agents.mixins.mesh import _BEACON, UDPDiscovery
+
+log = logging.getLogger(__name__)
+
+DISCOVERY_PORT = 5680
+BROADCAST = "127.255.255.255"
+
+
+class MeshAgent(MeshMixin, Agent):
+    def setup(self):
+        self.node = self.create_mesh_node(
+            group="test",
+            discovery=UDPDiscovery(DISCOVERY_PORT, broadcast=BROADCAST),
+            address="tcp://127.0.0.1:*",
+            interval=0.1,
+        )
+
+
+def wait_for(condition, timeout=3):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+@pytest.fixture(scope="module")
+def start_agents():
+    agents = [MeshAgent() for _ in range(3)]
+
+    yield agents
+
+    for agent in agents:
+        if not agent.exit_event.is_set():
+            agent.shutdown()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_mesh_discovery(start_agents):
+    """nodes discover each other and notify their peers directly"""
+
+    a, b, c = start_agents
+
+    assert wait_for(lambda: all(len(x.node.peers) == 2 for x in start_agents))
+    assert set(a.node.peers) == {b.node.uid, c.node.uid}
+    time.sleep(0.3)
+
+    res = []
+    d1 = b.node.on("mesh", lambda x: res.append(("b", x)))
+    d2 = c.node.observable.subscribe(lambda x: res.append(("c", x)))
+    time.sleep(0.3)
+
+    notification = Message.Notification(topic="mesh", payload="1")
+    a.node.send(notification)
+    assert wait_for(lambda: len(res) == 2)
+    assert sorted(res) == [("b", notification), ("c", notification)]
+    d1.dispose()
+    d2.dispose()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_mesh_eviction(start_agents):
+    """silent peers are evicted after the timeout, leaving peers immediately"""
+
+    a, b, _ = start_agents
+    events = []
+    d = a.node.membership.subscribe(lambda x: events.append((x[0], x[1].uid)))
+
+    # a single beacon of a peer which never sends heartbeats again
+    beacon = _BEACON.pack(b"VPA", 1, 0, 5999) + b"ghost\0test"
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        s.sendto(beacon, (BROADCAST, DISCOVERY_PORT))
+    assert wait_for(lambda: "ghost" in a.node.peers)
+    assert wait_for(lambda: "ghost" not in a.node.peers)
+    assert ("join", "ghost") in events and ("leave", "ghost") in events
+
+    # leaving peers are evicted before the timeout
+    uid = b.node.uid
+    start = time.time()
+    b.shutdown()
+    assert wait_for(lambda: uid not in a.node.peers)
+    assert time.time() - start < a.node.timeout
+    assert ("leave", uid) in events
+    d.dispose()
@@ -0,0 +1,82 @@
+import logging
+
+import pytest
+import zmq
+
+from agents import Message
+
+log = logging.getLogger(__name__)
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_message_envelope():
+    """messages round trip through the binary envelope and the legacy format"""
+
+    messages = [
+        Message.Notification(topic="a", payload="text"),
+        Message.Notification(
+            topic="a",
+            payload=b"\x00\xff",
+            id="1",
+            timestamp=1.5,
+            content_type="application/octet-stream",
+        ),
+        Message.Client(name="b", payload="hé", id="2"),
+        Message.Client(name="b", payload=b"", timestamp=0.0),
+    ]
+    for m in messages:
+        xs = m.to_multipart()
+        assert len(xs) == 2
+        assert m.from_multipart(xs) == m
+        # zero copy frames decode without converting them to bytes first
+        assert m.from_multipart([zmq.Frame(x) for x in xs]) == m
+
+    # legacy 3 frames format
+    m = Message.Notification(topic="a", payload="text")
+    xs = m.to_multipart(legacy=True)
+    assert xs == [b"a", bytes([Message.NOTIFICATION]), b"text"]
+    assert Message.Notification.from_multipart(xs) == m
+
+    with pytest.raises(Exception):
+        Message.Client.from_multipart(m.to_multipart())
+    with pytest.raises(Exception):
+        Message.Client.from_multipart(xs)
+
+    # lengths beyond the envelope fields
+    with pytest.raises(ValueError):
+        Message.Client(name="b", payload="", id="x" * 65536).to_multipart()
+    with pytest.raises(ValueError):
+        Message.Client(name="b", payload="", content_type="é" * 128).to_multipart()
+    m = Message.Client(name="b", payload="", id="x" * 65535, content_type="x" * 255)
+    assert m.from_multipart(m.to_multipart()) == m
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_message_batch():
+    """batches round trip and are told apart from single notifications"""
+
+    notifications = [
+        Message.Notification(topic="a", payload="1"),
+        Message.Notification(topic="a", payload=b"2", id="2", timestamp=2.0),
+    ]
+    batch = Message.Batch(topic="a", notifications=notifications)
+    xs = batch.to_multipart()
+    assert Message.Batch.is_batch(xs)
+    assert not Message.Batch.is_batch(notifications[0].to_multipart())
+    assert not Message.Batch.is_batch(notifications[0].to_multipart(legacy=True))
+    assert Message.Batch.from_multipart(xs) == batch
+    assert Message.Batch.from_multipart([zmq.Frame(x) for x in xs]) == batch
@@ -1,4 +1,6 @@
 import logging
+import threading
+import time
 
 import pytest
 
@@ -46,3 +48,55 @@ def test_module(start_agents):
 
     # test unique names
     assert len({agent_one.uid, agent_two.uid, agent_three.uid}) == 3
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_module_dependencies():
+    """modules are set up concurrently in dependency order and shut down in reverse"""
+
+    events = []
+
+    class SlowModule(AgentModule):
+        def setup(self):
+            events.append(("setup", self.uid))
+            time.sleep(0.3)
+
+        def shutdown(self):
+            events.append(("shutdown", self.uid))
+
+    class AsyncReadyModule(SlowModule):
+        ready_on_setup = False
+
+        def setup(self):
+            events.append(("setup", self.uid))
+            threading.Timer(0.3, self.set_ready).start()
+
+    class DependentAgent(Agent):
+        def setup(self):
+            a = SlowModule(self, uid="a")
+            b = AsyncReadyModule(self, uid="b")
+            self.register_module(SlowModule(self, uid="c", dependencies=[a, "b"]))
+            self.register_module(a)
+            self.register_module(b)
+
+    start = time.time()
+    agent = DependentAgent()
+    elapsed = time.time() - start
+
+    # a and b in parallel, then c
+    assert 0.6 <= elapsed < 0.85
+    assert events.index(("setup", "c")) == 2
+    assert set(agent.module_boot_times) == {"a", "b", "c"}
+    assert agent.module_boot_times["b"]["setup"] < 0.1
+    assert agent.module_boot_times["b"]["ready"] >= 0.3
+
+    agent.shutdown()
+    assert events[3] == ("shutdown", "c")
+    assert set(events[4:]) == {("shutdown", "a"), ("shutdown", "b")}
@@ -0,0 +1,200 @@
+import logging
+import queue
+import time
+
+import pytest
+
+from agents import Agent, Message
+from agents.mixins import NotificationsMixin
+from agents.mixins.notifications import CoalescingPublisher
+
+log = logging.getLogger(__name__)
+
+PUB_ADDRESS = "tcp://127.0.0.1:5020"
+SUB_ADDRESS = "tcp://127.0.0.1:5021"
+
+
+class NotificationsAgent(NotificationsMixin, Agent):
+    pass
+
+
+@pytest.fixture(scope="module")
+def start_agents():
+    class Broker(NotificationsAgent):
+        def setup(self):
+            self.proxy = self.create_notification_broker(
+                PUB_ADDRESS, SUB_ADDRESS, steerable=True, capture=True
+            )
+
+    class Client(NotificationsAgent):
+        def setup(self):
+            self.pub, self.sub = self.create_notification_client(
+                PUB_ADDRESS, SUB_ADDRESS
+            )
+
+    class FilteredClient(NotificationsAgent):
+        def setup(self):
+            self.pub, self.sub = self.create_notification_client(
+                PUB_ADDRESS, SUB_ADDRESS, topics=None
+            )
+
+    class CoalescingClient(NotificationsAgent):
+        def setup(self):
+            self.pub, self.sub = self.create_notification_client(
+                PUB_ADDRESS, SUB_ADDRESS, coalesce=True, max_messages=10, linger=0.1
+            )
+
+    broker = Broker()
+    sender = Client()
+    listener = Client()
+    filtered = FilteredClient()
+    coalescing = CoalescingClient()
+    time.sleep(0.5)
+
+    yield broker, sender, listener, filtered, coalescing
+
+    sender.shutdown()
+    listener.shutdown()
+    filtered.shutdown()
+    coalescing.shutdown()
+    broker.shutdown()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_steerable_broker(start_agents):
+    """notifications are forwarded by a steerable proxy reporting statistics"""
+
+    broker, sender, listener, _, _ = start_agents
+
+    res = []
+    d = listener.sub.observable.subscribe(lambda x: res.append(x))
+
+    sender.pub.send(Message.Notification(topic="a", payload="1").to_multipart())
+    time.sleep(0.2)
+    assert res == [Message.Notification(topic="a", payload="1")]
+
+    sender.pub.send(Message.Notification(topic="a", payload="2").to_multipart())
+    time.sleep(0.2)
+    assert res[1] == Message.Notification(topic="a", payload="2")
+
+    stats = broker.proxy.statistics()
+    log.debug(stats)
+    assert stats["frontend_messages_received"] >= 2
+    assert stats["backend_messages_sent"] >= 2
+    assert broker.proxy.captured["messages"] >= 2
+    d.dispose()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_notification_handlers(start_agents):
+    """notifications are dispatched to the handlers of their topic prefixes"""
+
+    _, sender, _, filtered, _ = start_agents
+
+    received, sensors, temperature = [], [], []
+    d = filtered.sub.observable.subscribe(lambda x: received.append(x.topic))
+    d_sensors = filtered.sub.on("sensors/", lambda x: sensors.append(x.topic))
+    d_temperature = filtered.sub.on(
+        "sensors/temperature", lambda x: temperature.append(x.payload)
+    )
+    time.sleep(0.2)
+
+    for topic in ["sensors/temperature", "sensors/humidity", "other"]:
+        sender.pub.send(Message.Notification(topic=topic, payload="1").to_multipart())
+    time.sleep(0.2)
+    # only the topics of the handlers pass the SUB filters
+    assert received == ["sensors/temperature", "sensors/humidity"]
+    assert sensors == ["sensors/temperature", "sensors/humidity"]
+    assert temperature == ["1"]
+
+    # removing the last handler of a prefix removes its SUB filter
+    d_sensors.dispose()
+    time.sleep(0.2)
+    for topic in ["sensors/temperature", "sensors/humidity"]:
+        sender.pub.send(Message.Notification(topic=topic, payload="2").to_multipart())
+    time.sleep(0.2)
+    assert received[2:] == ["sensors/temperature"]
+    assert sensors == ["sensors/temperature", "sensors/humidity"]
+    assert temperature == ["1", "2"]
+
+    d_temperature.dispose()
+    d.dispose()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_coalescing_publisher(start_agents):
+    """coalesced notifications are received one by one and in order"""
+
+    _, _, listener, _, coalescing = start_agents
+
+    res = []
+    d = listener.sub.on("coalesced", lambda x: res.append(x.payload))
+
+    for i in range(25):
+        coalescing.pub.send(Message.Notification(topic="coalesced", payload=str(i)))
+    time.sleep(0.05)
+    # 2 full batches are sent, the rest waits for the linger time
+    assert coalescing.pub.batches == 2
+    assert res == [str(i) for i in range(20)]
+
+    time.sleep(0.2)
+    assert coalescing.pub.batches == 3
+    assert res == [str(i) for i in range(25)]
+
+    # a single notification is not wrapped in a batch
+    coalescing.pub.send(Message.Notification(topic="coalesced", payload="x"))
+    coalescing.pub.flush()
+    time.sleep(0.05)
+    assert coalescing.pub.batches == 3
+    assert res[-1] == "x"
+    d.dispose()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_coalescing_publisher_drops(start_agents):
+    """batches failing to send are dropped and counted, the linger thread goes on"""
+
+    _, _, _, _, coalescing = start_agents
+
+    class FullConnection:
+        socket = None
+
+        def send(self, x):
+            raise queue.Full()
+
+    pub = CoalescingPublisher(coalescing, FullConnection(), linger=0.01)
+    try:
+        for i in range(3):
+            pub.send(Message.Notification(topic="dropped", payload=str(i)))
+            time.sleep(0.1)
+            assert pub.drops == i + 1
+    finally:
+        pub.dispose()
@@ -0,0 +1,130 @@
+import logging
+import os
+import threading
+import time
+
+import pytest
+import zmq
+
+from agents import Agent
+
+log = logging.getLogger(__name__)
+
+
+@Agent.cpu_bound
+def square(x):
+    return int(x[0]) ** 2, os.getpid()
+
+
+def slow(x):
+    time.sleep(0.1 * (int(x[0]) % 3))
+    return int(x[0])
+
+
+@pytest.fixture(scope="module")
+def start_agents():
+    class OffloadAgent(Agent):
+        def setup(self):
+            self.pull = self.bind_socket(zmq.PULL, {}, "inproc://offload")
+            self.push = self.connect_socket(zmq.PUSH, {}, "inproc://offload")
+
+    agent = OffloadAgent(cpu_workers=2)
+
+    yield agent
+
+    agent.shutdown()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_offload_process_pool(start_agents):
+    """offloaded items are processed in worker processes, results in order"""
+
+    agent = start_agents
+
+    res, threads = [], set()
+
+    def on_next(x):
+        res.append(x)
+        threads.add(threading.current_thread().name)
+
+    d = agent.pull.observable.pipe(agent.offload(square)).subscribe(on_next)
+    for i in range(20):
+        agent.push.send([str(i).encode()])
+
+    for _ in range(100):
+        if len(res) == 20:
+            break
+        time.sleep(0.1)
+    assert [x for x, _ in res] == [i**2 for i in range(20)]
+    assert os.getpid() not in {pid for _, pid in res}
+    # results are delivered in the socket thread
+    assert len(threads) == 1 and threads != {threading.current_thread().name}
+    d.dispose()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_offload_in_order(start_agents):
+    """results are emitted in order even when later items finish first"""
+
+    agent = start_agents
+
+    res = []
+    d = agent.pull.observable.pipe(
+        agent.offload(slow, pool="thread", max_in_flight=4)
+    ).subscribe(res.append)
+    for i in range(12):
+        agent.push.send([str(i).encode()])
+    time.sleep(1.5)
+    assert res == list(range(12))
+    d.dispose()
+
+
+def fail_on_two(x):
+    if int(x[0]) == 2:
+        raise ValueError("two")
+    time.sleep(0.1)
+    return int(x[0])
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_offload_error(start_agents):
+    """nothing is emitted after the first error, remaining items are cancelled"""
+
+    agent = start_agents
+    assert agent.executor_workers["cpu"] == 2
+
+    events = []
+    d = agent.pull.observable.pipe(
+        agent.offload(fail_on_two, pool="thread", max_in_flight=2)
+    ).subscribe(
+        lambda x: events.append(("next", x)),
+        lambda e: events.append(("error", str(e))),
+        lambda: events.append(("completed",)),
+    )
+    for i in range(8):
+        agent.push.send([str(i).encode()])
+    time.sleep(1)
+    assert events == [("next", 0), ("next", 1), ("error", "two")]
+    assert not agent._offloaded
+    d.dispose()
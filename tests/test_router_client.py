@@ -0,0 +1,86 @@
+import logging
+import time
+
+import pytest
+import zmq
+
+from agents import Agent, Message
+from agents.mixins import RouterClientMixin
+
+log = logging.getLogger(__name__)
+
+ADDRESSES = ["tcp://127.0.0.1:5030", "tcp://127.0.0.1:5031"]
+
+
+class RouterClientAgent(RouterClientMixin, Agent):
+    pass
+
+
+@pytest.fixture(scope="module")
+def start_agents():
+    class Router(RouterClientAgent):
+        def setup(self):
+            self.undeliverable = []
+            self.router = self.create_router(
+                ADDRESSES,
+                on_undeliverable=lambda x: self.undeliverable.append(x),
+            )
+
+    class Client(RouterClientAgent):
+        def __init__(self, address):
+            self.address = address
+            super().__init__()
+
+        def setup(self):
+            self.received = []
+            self.client = self.create_client(self.address)
+            self.disposables.append(
+                self.client.observable.subscribe(lambda x: self.received.append(x))
+            )
+
+    router = Router()
+    alice = Client(ADDRESSES[0])
+    bob = Client(ADDRESSES[1])
+    time.sleep(0.5)
+
+    yield router, alice, bob
+
+    alice.shutdown()
+    bob.shutdown()
+    router.shutdown()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_router_engine(start_agents):
+    """sharded router engine forwards between shards and reports undeliverables"""
+
+    router, alice, bob = start_agents
+
+    # bob has not sent anything yet, so is unknown to the router
+    alice.client.send(Message.Client(name=bob.uid, payload="1").to_multipart())
+    time.sleep(0.2)
+    assert len(router.undeliverable) == 1
+    message, error = router.undeliverable[0]
+    assert message[0] == bob.uid.encode()
+    assert error.errno == zmq.EHOSTUNREACH
+
+    bob.client.send(Message.Client(name=alice.uid, payload="2").to_multipart())
+    time.sleep(0.2)
+    assert alice.received == [Message.Client(name=bob.uid, payload="2")]
+
+    alice.client.send(Message.Client(name=bob.uid, payload="3").to_multipart())
+    time.sleep(0.2)
+    assert bob.received == [Message.Client(name=alice.uid, payload="3")]
+
+    stats = router.router.stats
+    log.debug(stats)
+    assert stats[0]["forwarded"] == 1 and stats[1]["forwarded"] == 1
+    assert stats[0]["routed"] == 1 and stats[1]["routed"] == 1
+    assert stats[0]["undeliverable"] == 1
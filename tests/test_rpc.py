@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+import zmq
+
+from agents import Agent
+from agents.mixins import RPCMixin
+from agents.mixins.rpc import RPCError, RPCTimeout
+
+log = logging.getLogger(__name__)
+
+ADDRESS = "tcp://127.0.0.1:5050"
+
+
+class RPCAgent(RPCMixin, Agent):
+    pass
+
+
+@pytest.fixture(scope="module")
+def start_agents():
+    class Server(RPCAgent):
+        def setup(self):
+            self.server = self.create_rpc_server(ADDRESS)
+            self.server.register("add", lambda a, b: a + b)
+
+            @self.server.register("fail")
+            def fail():
+                raise ValueError("failed")
+
+            @self.server.register("later")
+            def later(x, delay=0.1):
+                # completes in another thread without holding the socket thread
+                future = Future()
+                threading.Timer(delay, lambda: future.set_result(x)).start()
+                return future
+
+    class Client(RPCAgent):
+        def setup(self):
+            self.client = self.create_rpc_client(ADDRESS, timeout=1, max_in_flight=50)
+
+    server = Server()
+    client = Client()
+    time.sleep(0.5)
+
+    yield server, client
+
+    client.shutdown()
+    server.shutdown()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_rpc_call(start_agents):
+    """calls resolve futures with results or remote errors"""
+
+    _, client = start_agents
+
+    assert client.client.call("add", 1, 2).result(timeout=1) == 3
+
+    with pytest.raises(RPCError) as e:
+        client.client.call("fail").result(timeout=1)
+    assert e.value.remote_type == "ValueError"
+
+    with pytest.raises(RPCError):
+        client.client.call("unknown").result(timeout=1)
+
+    assert client.client.in_flight == 0
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_rpc_pipelining(start_agents):
+    """many calls are outstanding at once over one socket"""
+
+    _, client = start_agents
+
+    start = time.time()
+    futures = [client.client.call("later", i, delay=0.2) for i in range(40)]
+    assert client.client.in_flight == 40
+    assert [f.result(timeout=1) for f in futures] == list(range(40))
+    # calls overlap instead of taking 40 * 0.2 seconds
+    assert time.time() - start < 1
+
+    # calls beyond max_in_flight wait for a slot
+    futures = [client.client.call("later", i, delay=0.2) for i in range(60)]
+    assert client.client.in_flight <= 50
+    assert [f.result(timeout=2) for f in futures] == list(range(60))
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_rpc_timeout(start_agents):
+    """calls without a response in time fail and free their slot"""
+
+    _, client = start_agents
+
+    future = client.client.request("later", (1,), {"delay": 0.5}, timeout=0.1)
+    with pytest.raises(RPCTimeout):
+        future.result(timeout=1)
+    assert client.client.in_flight == 0
+
+    # the late response is ignored
+    time.sleep(0.5)
+    assert client.client.call("add", 2, 2).result(timeout=1) == 4
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_rpc_deadlines_compacted(start_agents):
+    """deadlines of completed calls do not accumulate until they expire"""
+
+    _, client = start_agents
+
+    for _ in range(10):
+        futures = [client.client.call("add", i, 1) for i in range(50)]
+        assert [f.result(timeout=1) for f in futures] == list(range(1, 51))
+    # 500 completed calls with a deadline of 1s
+    assert len(client.client._deadlines) <= 2 * 50 + 64 + 1
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_rpc_asyncio(start_agents):
+    """calls are awaitable in an asyncio event loop"""
+
+    _, client = start_agents
+
+    async def main():
+        return await asyncio.gather(
+            *[client.client.call_async("add", i, i) for i in range(10)]
+        )
+
+    assert asyncio.run(main()) == [2 * i for i in range(10)]
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_rpc_malformed_response():
+    """malformed, unknown and duplicate responses are dropped"""
+
+    context = zmq.Context()
+    router = context.socket(zmq.ROUTER)
+    router.bind("tcp://127.0.0.1:5052")
+
+    class Client(RPCAgent):
+        def setup(self):
+            self.client = self.create_rpc_client("tcp://127.0.0.1:5052", timeout=2)
+
+    agent = Client()
+    try:
+        future = agent.client.call("add", 1, 2)
+        assert router.poll(1000)
+        identity, call_id, method, payload = router.recv_multipart()
+
+        router.send_multipart([identity, b"malformed"])
+        router.send_multipart([identity, b"unknown", b"\x00", b"0"])
+        router.send_multipart([identity, call_id, b"\x00", b"3"])
+        router.send_multipart([identity, call_id, b"\x00", b"4"])
+        assert future.result(timeout=1) == 3
+
+        # the socket thread survived
+        future = agent.client.call("add", 1, 2)
+        identity, call_id, method, payload = router.recv_multipart()
+        router.send_multipart([identity, call_id, b"\x00", b"5"])
+        assert future.result(timeout=1) == 5
+    finally:
+        agent.shutdown()
+        router.close(linger=0)
+        context.term()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_rpc_invalid_method(start_agents):
+    """methods which are not valid UTF-8 fail without killing the socket thread"""
+
+    _, client = start_agents
+
+    client.client.dealer.send([b"\x00" * 8, b"\xff\xfe", b"[[], {}]"])
+    time.sleep(0.2)
+    assert client.client.call("add", 1, 2).result(timeout=1) == 3
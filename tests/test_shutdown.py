@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import threading
+import time
+from queue import Queue
+
+import pytest
+import zmq
+
+from agents import Agent
+from agents.defs import AgentModule
+from agents.mixins import DaemonMixin
+from agents.modules.webserver import WebServerModule
+
+log = logging.getLogger(__name__)
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_fast_shutdown():
+    """threads blocked on a web server, a daemon queue or an exit future exit at once"""
+
+    class BusyAgent(DaemonMixin, Agent):
+        def setup(self):
+            self.register_module(WebServerModule(agent=self, port=8082))
+            self.create_daemon(Queue(), lambda: None)
+            self.run_process_in_thread(self.wait_for_exit)
+
+        def wait_for_exit(self, exit_event):
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(self.exit_future(loop))
+            finally:
+                loop.close()
+
+    agent = BusyAgent()
+    start = time.time()
+    agent.shutdown()
+    elapsed = time.time() - start
+    log.debug(agent.shutdown_times)
+
+    assert elapsed < 0.5
+    assert not any(t.is_alive() for t in agent.threads)
+    assert agent.shutdown_times["total"] <= elapsed
+    assert any(k.startswith("module ") for k in agent.shutdown_times)
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_shutdown_deadline():
+    """threads ignoring the exit event are abandoned at the shutdown deadline"""
+
+    stop = threading.Event()
+
+    class StuckAgent(Agent):
+        def setup(self):
+            self.run_process_in_thread(lambda exit_event: stop.wait())
+
+    agent = StuckAgent(shutdown_timeout=0.3)
+    start = time.time()
+    agent.shutdown()
+    assert 0.3 <= time.time() - start < 0.6
+    assert any(t.is_alive() for t in agent.threads)
+
+    # shutting down again returns at once
+    start = time.time()
+    agent.shutdown()
+    assert time.time() - start < 0.1
+    stop.set()
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_send_after_shutdown():
+    """messages sent after shutdown are dropped without touching closed wakers"""
+
+    class PushAgent(Agent):
+        def setup(self):
+            self.push = self.connect_socket(zmq.PUSH, {}, "inproc://after_shutdown")
+
+    agent = PushAgent()
+    agent.shutdown()
+    assert all(shard.waker.closed for shard in agent.zmq_shards)
+    assert all(shard.waker.socket.closed for shard in agent.zmq_shards)
+
+    agent.push.send([b"message"])
+    agent.call_soon(lambda: None)
+    assert agent.push.stats() == {"depth": 0, "high_water": 0, "drops": 1}
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_shutdown_deadline_modules():
+    """slow module shutdowns and disposables are abandoned at the deadline"""
+
+    class FastModule(AgentModule):
+        def setup(self):
+            pass
+
+        def shutdown(self):
+            pass
+
+    class SlowModule(FastModule):
+        def shutdown(self):
+            time.sleep(3)
+
+    class SlowDisposable:
+        def dispose(self):
+            time.sleep(3)
+
+    class SlowAgent(Agent):
+        def setup(self):
+            self.register_module(SlowModule(self, uid="slow"))
+            self.register_module(FastModule(self, uid="fast"))
+
+    agent = SlowAgent()
+    agent.disposables.append(SlowDisposable())
+    start = time.time()
+    agent.shutdown(timeout=0.5)
+    assert time.time() - start < 1
+    assert "module fast" in agent.shutdown_times
+    assert "module slow" not in agent.shutdown_times
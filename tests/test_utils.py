@@ -0,0 +1,171 @@
+import logging
+import os
+import queue
+import threading
+
+import pytest
+import zmq
+
+from agents.utils import Compressor, PrefixTrie, SendQueue, Waker
+
+log = logging.getLogger(__name__)
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_send_queue_overflow():
+
+    # unbounded
+    q = SendQueue()
+    for i in range(100):
+        assert q.put(i)
+    assert q.stats() == {"depth": 100, "high_water": 100, "drops": 0}
+
+    # drop oldest
+    dropped = []
+    q = SendQueue(maxsize=2, overflow="drop_oldest", on_drop=dropped.append)
+    for i in range(4):
+        assert q.put(i)
+    assert dropped == [0, 1]
+    assert [q.get_nowait(), q.get_nowait()] == [2, 3]
+    assert q.stats() == {"depth": 0, "high_water": 2, "drops": 2}
+
+    # drop newest
+    q = SendQueue(maxsize=2, overflow="drop_newest")
+    assert [q.put(i) for i in range(4)] == [True, True, False, False]
+    assert [q.get_nowait(), q.get_nowait()] == [0, 1]
+    assert q.drops == 2
+
+    # raise
+    q = SendQueue(maxsize=1, overflow="raise")
+    q.put(0)
+    with pytest.raises(queue.Full):
+        q.put(1)
+    assert q.drops == 1
+
+    # block with timeout
+    q = SendQueue(maxsize=1, overflow="block", timeout=0.05)
+    q.put(0)
+    with pytest.raises(queue.Full):
+        q.put(1)
+
+    # block until a consumer makes room
+    q = SendQueue(maxsize=1, overflow="block", timeout=1)
+    q.put(0)
+    threading.Timer(0.05, q.get_nowait).start()
+    assert q.put(1)
+    assert q.get_nowait() == 1
+    with pytest.raises(queue.Empty):
+        q.get_nowait()
+
+    with pytest.raises(ValueError):
+        SendQueue(overflow="unknown")
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_prefix_trie():
+    """prefix trie matches the values of every stored prefix of a key"""
+
+    trie = PrefixTrie()
+    assert trie.add("a/", 1)
+    assert trie.add("a/b", 2)
+    assert not trie.add("a/b", 3)
+    assert trie.add("", 0)
+    assert len(trie) == 4
+
+    assert trie.match("a/b/c") == [0, 1, 2, 3]
+    assert trie.match("a/c") == [0, 1]
+    assert trie.match("b") == [0]
+
+    assert not trie.remove("a/b", 2)
+    assert trie.remove("a/b", 3)
+    assert trie.match("a/b/c") == [0, 1]
+    with pytest.raises(KeyError):
+        trie.remove("a/b", 3)
+    assert trie.remove("a/", 1)
+    assert trie.remove("", 0)
+    assert len(trie) == 0
+    assert trie.match("a/b") == []
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_compressor():
+    """compression is flagged, skipped for small frames and turned off when poor"""
+
+    for codec in ["zlib", "lzma"]:
+        c = Compressor(codec, threshold=100)
+        for x in [b"x" * 1000, "y" * 1000, b"small", "small"]:
+            assert c.decompress(c.compress(x)) == x
+        assert c.compressed == 2
+        assert c.ratio < 0.2
+
+    # incompressible data turns compression off, probes turn it back on
+    c = Compressor(threshold=100, window=5, probe_interval=3)
+    for _ in range(5):
+        c.compress(os.urandom(1000))
+    assert not c.enabled
+    assert c.ratio > 0.9
+    compressed = c.compressed
+    c.compress(b"x" * 1000)
+    c.compress(b"x" * 1000)
+    assert c.compressed == compressed
+    c.compress(b"x" * 1000)
+    assert c.enabled
+    assert c.compressed == compressed + 1
+
+    with pytest.raises(ValueError):
+        Compressor("unknown")
+
+
+@pytest.mark.report(
+    specification="""
+    """,
+    procedure="""
+    """,
+    expected="""
+    """,
+)
+def test_waker():
+    """wakers interrupt a poll from other threads until closed"""
+
+    waker = Waker()
+    poller = zmq.Poller()
+    poller.register(waker.socket, zmq.POLLIN)
+    assert not poller.poll(0)
+
+    threading.Timer(0.05, waker.wake).start()
+    assert dict(poller.poll(1000)) == {waker.socket: zmq.POLLIN}
+
+    # wakes are coalesced until cleared
+    waker.wake()
+    waker.clear()
+    assert not poller.poll(0)
+    waker.wake()
+    assert poller.poll(0)
+
+    poller.unregister(waker.socket)
+    waker.close()
+    waker.close()
+    assert waker.closed
+    waker.wake()
+    waker.clear()